@@ -0,0 +1,237 @@
+import logging
+import threading
+import time
+from collections import namedtuple
+from contextlib import contextmanager
+import torch
+from transformers import StoppingCriteria
+from streaming import StreamingResponseCleaner
+from utils.metrics import DISCARDED_TOKENS, GENERATION_STOPS
+
+logger = logging.getLogger(__name__)
+
+# Token budget and monotonic deadline (or None) for one request
+GenerationPlan = namedtuple("GenerationPlan", ["max_new_tokens", "deadline"])
+
+STOP_REASONS = ("eos", "length_cap", "deadline", "token_budget", "cancelled")
+
+class AdaptiveStoppingCriteria(StoppingCriteria):
+    """
+    Stops each row of a (batched) generate call on its own terms: at the
+    end-of-text token, at its token budget, at its deadline, or once its
+    response has reached the display length cap.
+
+    The cap check applies the same sentence packing as the streaming cleaner
+    to the row's decoded text; once the sentence being generated can no
+    longer fit, nothing more would be shown, so the row stops and its
+    response is the complete sentences kept so far (see capped_response).
+    Each row keeps its own cleaner and is detokenized incrementally, so a
+    step only decodes the tokens around the newest one.
+    """
+    def __init__(self, tokenizer, prompt_length, plans, eos_token_id=None, max_chars=200):
+        self.tokenizer = tokenizer
+        self.prompt_length = prompt_length
+        self.plans = list(plans)
+        self.eos_token_id = eos_token_id
+        self.max_chars = max_chars
+        self.reasons = [None] * len(self.plans)
+        self.sequences = None
+        self._cleaners = [StreamingResponseCleaner(max_chars=max_chars) for _ in self.plans]
+        # Per row: (prefix, read) token offsets into the generated tokens; text
+        # up to read has been fed to the cleaner, prefix..read gives context
+        self._offsets = [(0, 0)] * len(self.plans)
+
+    def __call__(self, input_ids, scores, **kwargs):
+        self.sequences = input_ids
+        generated = input_ids.shape[1] - self.prompt_length
+        now = time.monotonic()
+
+        for row, plan in enumerate(self.plans):
+            if self.reasons[row] is not None:
+                continue
+            if self.eos_token_id is not None and input_ids[row, -1].item() == self.eos_token_id:
+                self.reasons[row] = "eos"
+            elif generated >= plan.max_new_tokens:
+                self.reasons[row] = "token_budget"
+            elif plan.deadline is not None and now >= plan.deadline:
+                self.reasons[row] = "deadline"
+            elif self.max_chars:
+                self._cleaners[row].feed(self._decode_new_text(row, input_ids[row, self.prompt_length:]))
+                if self._cleaners[row].capped:
+                    self.reasons[row] = "length_cap"
+
+        return torch.tensor([reason is not None for reason in self.reasons], dtype=torch.bool,
+                            device=input_ids.device)
+
+    def _decode_new_text(self, row, token_ids):
+        """
+        Text added by the tokens generated since the row's last step.
+
+        Decodes the new tokens together with the few before them and returns
+        the difference, as tokenizers may merge or space a token differently
+        depending on its neighbours. Text ending in an incomplete character
+        is held back until the tokens completing it arrive.
+        """
+        prefix_offset, read_offset = self._offsets[row]
+        window = token_ids[prefix_offset:].tolist()
+        if prefix_offset + len(window) <= read_offset:
+            return ""
+
+        prefix_text = self.tokenizer.decode(window[:read_offset - prefix_offset], skip_special_tokens=True)
+        new_text = self.tokenizer.decode(window, skip_special_tokens=True)
+        if len(new_text) <= len(prefix_text) or new_text.endswith("\ufffd"):
+            return ""
+
+        self._offsets[row] = (read_offset, prefix_offset + len(window))
+        return new_text[len(prefix_text):]
+
+    def capped_response(self, row=0):
+        """
+        The response for a row stopped at the length cap, or None if the row
+        stopped for another reason.
+        """
+        cleaner = self._cleaners[row]
+        return cleaner.capped_response() if cleaner.capped else None
+
+    def stop_reason(self, row=0, cancel_event=None):
+        """
+        Why a row stopped, once generate has returned.
+        """
+        if self.reasons[row] is not None:
+            return self.reasons[row]
+        if cancel_event is not None and cancel_event.is_set():
+            return "cancelled"
+        return "token_budget"
+
+class AdaptiveGenerationController:
+    """
+    Plans and accounts for each chat generation.
+
+    The token budget shrinks as more generations run at once: up to
+    full_budget_load concurrent requests each get max_new_tokens; beyond
+    that the budget is scaled by full_budget_load / load (never below
+    min_new_tokens), so an overloaded process spends about the same number
+    of decode steps in total instead of letting every request slow down.
+    With deadline_ms set, a request stops generating that long after it
+    arrived (time spent waiting for a batch included) and keeps the complete
+    sentences it has.
+
+    For every response it records why generation stopped and how many
+    generated tokens did not make it into the response (cut by cleanup or
+    the length cap).
+    """
+    def __init__(self, tokenizer, max_new_tokens=100, min_new_tokens=32, full_budget_load=4, deadline_ms=0,
+                 max_chars=200):
+        self.tokenizer = tokenizer
+        self.max_new_tokens = max(1, int(max_new_tokens))
+        self.min_new_tokens = max(1, min(int(min_new_tokens), self.max_new_tokens))
+        self.full_budget_load = max(1, int(full_budget_load))
+        self.deadline_ms = max(0.0, float(deadline_ms))
+        self.max_chars = max_chars
+
+        self._active = 0
+        self._lock = threading.Lock()
+        self._stats = {
+            "plans": 0,
+            "responses": 0,
+            "generated_tokens": 0,
+            "discarded_tokens": 0,
+            "budget_tokens": 0,
+            "reduced_budgets": 0,
+            "max_load": 0,
+            "stop_reasons": {reason: 0 for reason in STOP_REASONS},
+        }
+
+    @contextmanager
+    def track(self):
+        """
+        Count a generation as running for the duration of the block and yield
+        its plan, made from the load when it started.
+        """
+        with self._lock:
+            self._active += 1
+            load = self._active
+            self._stats["max_load"] = max(self._stats["max_load"], load)
+        try:
+            yield self._plan(load)
+        finally:
+            with self._lock:
+                self._active -= 1
+
+    def stopping_criteria(self, prompt_length, plans, eos_token_id=None, max_chars=None):
+        """
+        Build the stopping criterion for a generate call.
+
+        Args:
+            prompt_length (int): Length of the (padded) prompt in the call
+            plans (list): GenerationPlan per row
+            eos_token_id (int): End-of-text token
+            max_chars (int): Display cap to stop at; defaults to the controller's,
+                0 disables the cap check (e.g. when the caller applies it itself)
+
+        Returns:
+            AdaptiveStoppingCriteria: The criterion for the call
+        """
+        return AdaptiveStoppingCriteria(
+            self.tokenizer, prompt_length, plans, eos_token_id=eos_token_id,
+            max_chars=self.max_chars if max_chars is None else max_chars)
+
+    def record(self, stop_reason, generated_ids, response):
+        """
+        Account for one finished response.
+
+        Args:
+            stop_reason (str): One of STOP_REASONS
+            generated_ids: The row's generated token ids (after the prompt)
+            response (str): The cleaned response sent to the user ("" if a
+                fallback was used instead)
+        """
+        generated_ids = [int(token_id) for token_id in generated_ids]
+        eos_token_id = self.tokenizer.eos_token_id
+        if eos_token_id in generated_ids:
+            # The end-of-text token (and the padding after it in a batch) is not text
+            generated_ids = generated_ids[:generated_ids.index(eos_token_id)]
+
+        generated = len(generated_ids)
+        kept = min(generated, len(self.tokenizer.encode(response))) if response else 0
+        discarded = generated - kept
+
+        DISCARDED_TOKENS.inc(discarded)
+        GENERATION_STOPS.inc(reason=stop_reason)
+        with self._lock:
+            self._stats["responses"] += 1
+            self._stats["generated_tokens"] += generated
+            self._stats["discarded_tokens"] += discarded
+            self._stats["stop_reasons"][stop_reason] = self._stats["stop_reasons"].get(stop_reason, 0) + 1
+
+    def get_stats(self):
+        """
+        Stop reasons, token counts and discard rate over every response so far.
+        """
+        with self._lock:
+            stats = dict(self._stats)
+            stats["stop_reasons"] = dict(self._stats["stop_reasons"])
+            stats["active"] = self._active
+        responses = stats["responses"]
+        stats["discard_rate"] = stats["discarded_tokens"] / stats["generated_tokens"] if stats["generated_tokens"] else 0.0
+        stats["avg_generated_tokens"] = stats["generated_tokens"] / responses if responses else 0.0
+        stats["avg_budget_tokens"] = stats.pop("budget_tokens") / stats["plans"] if stats["plans"] else 0.0
+        stats["max_new_tokens"] = self.max_new_tokens
+        stats["min_new_tokens"] = self.min_new_tokens
+        stats["full_budget_load"] = self.full_budget_load
+        stats["deadline_ms"] = self.deadline_ms
+        return stats
+
+    def _plan(self, load):
+        if load <= self.full_budget_load:
+            budget = self.max_new_tokens
+        else:
+            budget = max(self.min_new_tokens, self.max_new_tokens * self.full_budget_load // load)
+        deadline = time.monotonic() + self.deadline_ms / 1000.0 if self.deadline_ms else None
+
+        with self._lock:
+            self._stats["plans"] += 1
+            self._stats["budget_tokens"] += budget
+            if budget < self.max_new_tokens:
+                self._stats["reduced_budgets"] += 1
+        return GenerationPlan(budget, deadline)
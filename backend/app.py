@@ -1,20 +1,28 @@
 # backend/app.py
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, Response, g, send_file, stream_with_context
 from flask_cors import CORS
 import torch
-from transformers import AutoModelForCausalLM, AutoTokenizer
+from transformers import AutoTokenizer
 import os
 import logging
 from conversation import ConversationManager
 from sentiment_analysis import SentimentAnalyzer
+from inference_backends import backend_device, get_backend, load_causal_lm
+from model_registry import ModelRegistry, ModelNotReadyError
+from pipeline import ChatPipeline
+from safety import DEFAULT_PHRASES_PATH, SafetyMatcher
+from sessions import SessionNotFoundError, create_session_store, tokenizer_fingerprint
+from topics import DEFAULT_CATALOG_PATH, TopicEngine
+from worker_pool import PooledConversationManager, PooledSentimentAnalyzer, WorkerPool
+from utils.auth import admin_required
 from utils.cache import setup_cache
-from utils.metrics import log_api_call
+from utils.metrics import REGISTRY, log_api_call
+from utils.profiling import PROFILE_ID_HEADER, create_request_profiler
+from utils.structured_logging import get_log_pipeline, setup_logging
 import json
-import random
 
-# Configure logging
-logging.basicConfig(level=logging.INFO, 
-                   format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+# Configure logging: structured records written by a background thread
+setup_logging(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 # Initialize Flask app
@@ -24,56 +32,476 @@ CORS(app)  # Enable CORS for all routes
 # Setup caching
 cache = setup_cache(app)
 
-# Load models
-try:
-    # Initialize sentiment analysis model
-    sentiment_analyzer = SentimentAnalyzer()
+# Opt-in request profiling (PROFILING=1 and ADMIN_TOKEN). Nothing is hooked
+# into request handling unless it is enabled.
+request_profiler = create_request_profiler()
+if request_profiler is not None:
+    @app.before_request
+    def start_profile():
+        session = request_profiler.start_request(request.method, request.path, request.headers)
+        if session is not None:
+            g.profile_session = session
+
+    @app.after_request
+    def finish_profile(response):
+        session = g.pop('profile_session', None)
+        if session is not None:
+            response.headers[PROFILE_ID_HEADER] = session.profile_id
+            # Streamed responses are still generating here; stop once the body is sent
+            response.call_on_close(lambda: session.finish(response.status_code))
+        return response
+
+    @app.teardown_request
+    def abandon_profile(exc):
+        # Still set only if the request failed before a response was made
+        session = g.pop('profile_session', None)
+        if session is not None:
+            session.finish(500)
+
+# Largest number of messages accepted by the batch sentiment endpoint
+MAX_SENTIMENT_BATCH = int(os.environ.get('MAX_SENTIMENT_BATCH', 1000))
+
+# Directory holding models exported by export_models.py for the onnx backend
+ONNX_MODEL_DIR = os.environ.get('ONNX_MODEL_DIR', 'ml_models/onnx')
+
+# Run representative inputs through the models before reporting ready. With
+# COMPILE_MODELS=1 (pytorch backend) the sentiment forward, for inputs padded
+# to SENTIMENT_LENGTH_BUCKETS, and the chat decode step are compiled too,
+# which can take minutes.
+MODEL_WARMUP = os.environ.get('MODEL_WARMUP', '1') == '1'
+COMPILE_MODELS = os.environ.get('COMPILE_MODELS', '0') == '1'
+SENTIMENT_LENGTH_BUCKETS = [int(length) for length in os.environ.get('SENTIMENT_LENGTH_BUCKETS', '16,32,64,128').split(',')]
+
+# Conversation sessions: the server keeps each conversation's turns (with
+# their token ids) so clients only send the new message. Use Redis when
+# running more than one serving process.
+session_store = create_session_store(
+    redis_url=os.environ.get('SESSION_REDIS_URL'),
+    ttl_seconds=int(os.environ.get('SESSION_TTL_SECONDS', 3600)),
+    max_sessions=int(os.environ.get('SESSION_MAX_SESSIONS', 10000))
+)
+
+# Previous turns loaded from a session for each prompt (the history window)
+SESSION_HISTORY_TURNS = 10
+
+# Topic suggestions: a curated catalog, embedded once into a memory-mapped
+# matrix under TOPIC_INDEX_DIR and ranked against each conversation
+topic_engine = TopicEngine(
+    os.environ.get('TOPICS_PATH', DEFAULT_CATALOG_PATH),
+    index_dir=os.environ.get('TOPIC_INDEX_DIR', 'ml_models/topics'),
+    cache_size=int(os.environ.get('TOPIC_CACHE_SIZE', 10000)),
+    cache_ttl_seconds=int(os.environ.get('TOPIC_CACHE_TTL_SECONDS', 300))
+)
+
+# Most topics returned by one /api/topics request
+MAX_TOPIC_SUGGESTIONS = 10
+
+def load_sentiment_analyzer():
+    """
+    Build the sentiment analyzer for the configured backend.
+    """
+    sentiment_analyzer = SentimentAnalyzer(
+        backend=os.environ.get('SENTIMENT_BACKEND'),
+        onnx_dir=os.path.join(ONNX_MODEL_DIR, 'sentiment'),
+        model_name=os.environ.get('SENTIMENT_MODEL_NAME')
+    )
+    
+    # Cache results in-process, backed by the shared (Redis) cache when configured
+    sentiment_analyzer.enable_result_cache(
+        shared_cache=cache,
+        max_entries=int(os.environ.get('SENTIMENT_CACHE_SIZE', 10000))
+    )
     
+    if COMPILE_MODELS:
+        if sentiment_analyzer.backend != "pytorch":
+            logger.warning("Compilation needs the pytorch backend; not compiling the sentiment model")
+        else:
+            sentiment_analyzer.enable_compilation(length_buckets=SENTIMENT_LENGTH_BUCKETS)
+    
+    return sentiment_analyzer
+
+def load_conversation_manager():
+    """
+    Load DialoGPT for the configured backend and wrap it in a ConversationManager.
+    """
     # Use pre-trained DialoGPT from Hugging Face instead of fine-tuned model
-    logger.info("Using pre-trained DialoGPT from Hugging Face")
-    model_name = "microsoft/DialoGPT-medium"  # Can use small/medium/large depending on performance needs
+    chat_backend = get_backend(os.environ.get('CHAT_BACKEND'))
+    logger.info(f"Using pre-trained DialoGPT from Hugging Face (backend: {chat_backend})")
+    model_name = os.environ.get('CHAT_MODEL_NAME', "microsoft/DialoGPT-medium")  # Can use small/medium/large depending on performance needs
     
     tokenizer = AutoTokenizer.from_pretrained(model_name)
-    model = AutoModelForCausalLM.from_pretrained(model_name)
+    # Session turns stored by another tokenizer are re-encoded rather than reused
+    session_store.tokenizer_fingerprint = tokenizer_fingerprint(tokenizer)
+    model = load_causal_lm(model_name, chat_backend, os.path.join(ONNX_MODEL_DIR, 'dialogpt'))
     
-    # Move model to GPU if available
-    device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+    # Move model to GPU if available (quantized and ONNX backends run on CPU)
+    device = backend_device(chat_backend)
     model.to(device)
     
-    conversation_manager = ConversationManager(model, tokenizer, device)
+    safety_matcher = SafetyMatcher(os.environ.get('SAFETY_PHRASES_PATH', DEFAULT_PHRASES_PATH))
+    conversation_manager = ConversationManager(model, tokenizer, device, safety_matcher=safety_matcher)
+    
+    # Reuse each conversation's attention cache across turns. Requests with a
+    # conversation ID then generate one at a time instead of through the batch
+    # scheduler, so this is off by default in favour of CHAT_BATCHING
+    kv_cache_mb = int(os.environ.get('KV_CACHE_MB', 0))
+    if kv_cache_mb > 0:
+        conversation_manager.enable_kv_cache(max_bytes=kv_cache_mb * 1024 * 1024)
+    
+    # Stop at the display cap or a deadline, and shrink token budgets under load
+    if os.environ.get('ADAPTIVE_GENERATION', '1') == '1':
+        conversation_manager.enable_adaptive_generation(
+            min_new_tokens=int(os.environ.get('CHAT_MIN_NEW_TOKENS', 32)),
+            full_budget_load=int(os.environ.get('CHAT_FULL_BUDGET_LOAD', 8)),
+            deadline_ms=float(os.environ.get('CHAT_DEADLINE_MS', 0))
+        )
+    
+    # Serve frequent short messages from pools of previously sampled replies
+    response_cache_size = int(os.environ.get('RESPONSE_CACHE_SIZE', 1024))
+    if response_cache_size > 0:
+        conversation_manager.enable_response_cache(
+            max_entries=response_cache_size,
+            ttl_seconds=float(os.environ.get('RESPONSE_CACHE_TTL_SECONDS', 3600)),
+            pool_size=int(os.environ.get('RESPONSE_CACHE_POOL_SIZE', 4)),
+            context_turns=int(os.environ.get('RESPONSE_CACHE_CONTEXT_TURNS', 1)),
+            max_message_words=int(os.environ.get('RESPONSE_CACHE_MAX_WORDS', 8))
+        )
+    
+    # Batch concurrent chat requests into a single generate call
+    if os.environ.get('CHAT_BATCHING', '1') == '1':
+        conversation_manager.enable_batching(
+            max_batch_size=int(os.environ.get('CHAT_MAX_BATCH_SIZE', 8)),
+            batch_window_ms=float(os.environ.get('CHAT_BATCH_WINDOW_MS', 5))
+        )
     
-    logger.info(f"Models loaded successfully. Using device: {device}")
-except Exception as e:
-    logger.error(f"Error loading models: {str(e)}")
-    raise
+    # Speculative decoding with a smaller draft model sharing the tokenizer
+    draft_model_name = os.environ.get('CHAT_DRAFT_MODEL_NAME')  # e.g. microsoft/DialoGPT-small
+    if draft_model_name:
+        if chat_backend == "onnx":
+            logger.warning("Speculative decoding is not supported with the ONNX backend; ignoring CHAT_DRAFT_MODEL_NAME")
+        else:
+            draft_model = load_causal_lm(draft_model_name, chat_backend)
+            draft_model.to(device)
+            conversation_manager.enable_speculative_decoding(
+                draft_model, num_draft_tokens=int(os.environ.get('SPECULATIVE_DRAFT_TOKENS', 4)))
+            logger.info(f"Speculative decoding enabled with draft model {draft_model_name}")
+    
+    if COMPILE_MODELS:
+        if chat_backend != "pytorch":
+            logger.warning("Compilation needs the pytorch backend; not compiling the chat model")
+        else:
+            conversation_manager.enable_compilation()
+    
+    logger.info(f"Chat model loaded successfully. Using device: {device}")
+    return conversation_manager
+
+# Load models concurrently. With MODEL_PRELOAD=1 (see gunicorn.conf.py) the
+# models are loaded before serving, in the gunicorn master, so forked workers
+# share the weights copy-on-write. Otherwise they load in the background and
+# /ready reports when the worker can serve requests.
+model_registry = ModelRegistry()
+model_registry.register('sentiment', load_sentiment_analyzer)
+model_registry.register('chat', load_conversation_manager)
+
+def warm_up_models(registry):
+    """
+    Warm up (and compile) each model before the registry reports ready, so
+    the first requests after startup run as fast as later ones.
+    """
+    for name in ('sentiment', 'chat'):
+        registry.update_status(name, state="warming_up")
+        seconds = registry.get(name).warm_up()
+        registry.update_status(name, state="ready", warmup_seconds=round(seconds, 2))
+
+# Registered before the worker pool starts, so forked workers inherit warm models
+if MODEL_WARMUP:
+    model_registry.add_post_load_hook(warm_up_models)
+elif COMPILE_MODELS:
+    logger.warning("COMPILE_MODELS without MODEL_WARMUP compiles during the first requests")
+
+# Optionally serve inference from a pool of processes forked from this one,
+# all sharing a single copy of the weights (see worker_pool.py). The processes
+# are forked on first use, so with MODEL_PRELOAD=1 each gunicorn worker forks its own.
+MODEL_WORKERS = int(os.environ.get('MODEL_WORKERS', 0))
+worker_pool = None
+
+def start_worker_pool(registry):
+    global worker_pool
+    worker_pool = WorkerPool(
+        registry.get('chat'),
+        registry.get('sentiment'),
+        num_workers=MODEL_WORKERS,
+        cores_per_worker=os.environ.get('MODEL_WORKER_CORES'),
+        threads_per_worker=int(os.environ.get('MODEL_WORKER_THREADS', 4))
+    ).start()
+    registry.set('chat', PooledConversationManager(worker_pool))
+    registry.set('sentiment', PooledSentimentAnalyzer(worker_pool))
+
+if MODEL_WORKERS > 0:
+    model_registry.add_post_load_hook(start_worker_pool)
+
+# Safety screen, then sentiment and generation concurrently, for /api/chat/pipeline
+pipeline = ChatPipeline()
+
+if os.environ.get('MODEL_PRELOAD', '0') == '1':
+    if not model_registry.load_all():
+        raise RuntimeError("Error loading models")
+else:
+    model_registry.start_background_load()
+
+def load_session_turns(conversation_manager, session_id, user_message):
+    """
+    Get the recent turns of a session followed by the encoded new message,
+    which is only stored once the response has been generated.
+    
+    Raises:
+        SessionNotFoundError: If the session does not exist or has expired
+    """
+    turns = session_store.get_turns(session_id, limit=SESSION_HISTORY_TURNS)
+    return turns + [conversation_manager.encode_turn('user', user_message)]
+
+def save_session_turns(conversation_manager, session_id, session_turns, response):
+    """
+    Append the new message and the response to the session.
+    """
+    session_store.append(session_id, session_turns[-1], conversation_manager.encode_turn('bot', response))
+
+def suggest_topics(session_id, sentiment, count):
+    """
+    Pick topics for a session's conversation so far, or for a new
+    conversation if there is no session (or it has expired).
+    
+    Args:
+        session_id (str): The session, or None
+        sentiment (str): Sentiment of the user's latest message, or None
+        count (int): Number of topics to return
+    """
+    messages = []
+    if session_id:
+        try:
+            turns = session_store.get_turns(session_id, limit=SESSION_HISTORY_TURNS)
+            messages = [turn.text for turn in turns if turn.sender == 'user']
+        except SessionNotFoundError:
+            session_id = None
+    
+    count = max(1, min(count, MAX_TOPIC_SUGGESTIONS))
+    return topic_engine.suggest(messages, sentiment=sentiment, count=count, user_key=session_id)
+
+@app.errorhandler(ModelNotReadyError)
+def model_not_ready(e):
+    response = jsonify({"error": "Models are still loading, please try again shortly"})
+    response.headers['Retry-After'] = '5'
+    return response, 503
 
 # Define API routes
 @app.route('/api/chat', methods=['POST'])
 @log_api_call
 def chat():
+    conversation_manager = model_registry.get('chat')
     try:
         data = request.json
         user_message = data.get('message', '')
         conversation_history = data.get('conversation_history', [])
+        conversation_id = data.get('conversation_id')
+        session_id = data.get('session_id')
         
         if not user_message:
             return jsonify({"error": "No message provided"}), 400
         
-        # Generate response
-        response = conversation_manager.generate_response(user_message, conversation_history)
+        # Generate response, from the server-side session when one is given
+        if session_id:
+            session_turns = load_session_turns(conversation_manager, session_id, user_message)
+            response = conversation_manager.generate_response(
+                user_message, conversation_id=session_id, session_turns=session_turns)
+            save_session_turns(conversation_manager, session_id, session_turns, response)
+        else:
+            response = conversation_manager.generate_response(user_message, conversation_history, conversation_id)
         
         return jsonify({
             "response": response,
             "status": "success"
         })
+    except SessionNotFoundError:
+        return jsonify({"error": "Session not found or expired"}), 404
     except Exception as e:
-        logger.error(f"Error in chat endpoint: {str(e)}")
+        logger.error("Error in chat endpoint: %s", e)
         return jsonify({"error": str(e)}), 500
 
+@app.route('/api/chat/stream', methods=['POST'])
+@log_api_call
+def chat_stream():
+    conversation_manager = model_registry.get('chat')
+    try:
+        data = request.json
+        user_message = data.get('message', '')
+        conversation_history = data.get('conversation_history', [])
+        conversation_id = data.get('conversation_id')
+        session_id = data.get('session_id')
+        
+        if not user_message:
+            return jsonify({"error": "No message provided"}), 400
+        
+        session_turns = None
+        if session_id:
+            session_turns = load_session_turns(conversation_manager, session_id, user_message)
+            conversation_id = session_id
+        
+        def event_stream():
+            events = conversation_manager.stream_response(
+                user_message, conversation_history, conversation_id, session_turns=session_turns)
+            for event in events:
+                if event["type"] == "token":
+                    payload = {"text": event["text"]}
+                else:
+                    payload = {"response": event["response"], "status": "success"}
+                    if session_turns:
+                        save_session_turns(conversation_manager, session_id, session_turns, event["response"])
+                yield f"event: {event['type']}\ndata: {json.dumps(payload)}\n\n"
+        
+        # Server-Sent Events; disable proxy buffering so tokens arrive immediately
+        return Response(
+            stream_with_context(event_stream()),
+            mimetype='text/event-stream',
+            headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+        )
+    except SessionNotFoundError:
+        return jsonify({"error": "Session not found or expired"}), 404
+    except Exception as e:
+        logger.error("Error in chat stream endpoint: %s", e)
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/chat/pipeline', methods=['POST'])
+@log_api_call
+def chat_pipeline():
+    conversation_manager = model_registry.get('chat')
+    sentiment_analyzer = model_registry.get('sentiment')
+    try:
+        data = request.json
+        user_message = data.get('message', '')
+        conversation_history = data.get('conversation_history', [])
+        conversation_id = data.get('conversation_id')
+        session_id = data.get('session_id')
+        
+        if not user_message:
+            return jsonify({"error": "No message provided"}), 400
+        
+        session_turns = None
+        if session_id:
+            session_turns = load_session_turns(conversation_manager, session_id, user_message)
+        
+        # Only called once the pipeline's safety screen has passed the message
+        def generate():
+            if session_turns:
+                return conversation_manager.generate_response(
+                    user_message, conversation_id=session_id, session_turns=session_turns, screened=True)
+            return conversation_manager.generate_response(
+                user_message, conversation_history, conversation_id, screened=True)
+        
+        # Safety screen, then sentiment and response generation in parallel
+        result = pipeline.run(conversation_manager, sentiment_analyzer, user_message, generate)
+        if session_turns:
+            save_session_turns(conversation_manager, session_id, session_turns, result["response"])
+        
+        return jsonify({**result, "status": "success"})
+    except SessionNotFoundError:
+        return jsonify({"error": "Session not found or expired"}), 404
+    except Exception as e:
+        logger.error("Error in chat pipeline endpoint: %s", e)
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/chat/pipeline/stream', methods=['POST'])
+@log_api_call
+def chat_pipeline_stream():
+    conversation_manager = model_registry.get('chat')
+    sentiment_analyzer = model_registry.get('sentiment')
+    try:
+        data = request.json
+        user_message = data.get('message', '')
+        conversation_history = data.get('conversation_history', [])
+        conversation_id = data.get('conversation_id')
+        session_id = data.get('session_id')
+        
+        if not user_message:
+            return jsonify({"error": "No message provided"}), 400
+        
+        session_turns = None
+        if session_id:
+            session_turns = load_session_turns(conversation_manager, session_id, user_message)
+            conversation_id = session_id
+        
+        def event_stream():
+            events = pipeline.stream(
+                conversation_manager, sentiment_analyzer, user_message,
+                lambda: conversation_manager.stream_response(
+                    user_message, conversation_history, conversation_id, session_turns=session_turns, screened=True))
+            for event in events:
+                event_type = event.pop("type")
+                if event_type == "done":
+                    event["status"] = "success"
+                    if session_turns:
+                        save_session_turns(conversation_manager, session_id, session_turns, event["response"])
+                yield f"event: {event_type}\ndata: {json.dumps(event)}\n\n"
+        
+        # Server-Sent Events: sentiment, then tokens, then the final response with timings
+        return Response(
+            stream_with_context(event_stream()),
+            mimetype='text/event-stream',
+            headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+        )
+    except SessionNotFoundError:
+        return jsonify({"error": "Session not found or expired"}), 404
+    except Exception as e:
+        logger.error("Error in chat pipeline stream endpoint: %s", e)
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/sessions', methods=['POST'])
+@log_api_call
+def create_session():
+    conversation_manager = model_registry.get('chat')
+    try:
+        data = request.get_json(silent=True) or {}
+        turns = data.get('turns', [])
+        
+        # Optional existing history, e.g. to restore an expired session
+        if not isinstance(turns, list) or not all(isinstance(turn, dict) and isinstance(turn.get('text'), str)
+                                                  for turn in turns):
+            return jsonify({"error": "Turns must be objects with a text field"}), 400
+        
+        session_id = session_store.create([
+            conversation_manager.encode_turn(turn.get('sender'), turn['text'])
+            for turn in turns if turn['text'].strip()
+        ])
+        
+        return jsonify({
+            "session_id": session_id,
+            "ttl_seconds": session_store.ttl_seconds
+        }), 201
+    except Exception as e:
+        logger.error("Error in create session endpoint: %s", e)
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/sessions/<session_id>', methods=['GET'])
+@log_api_call
+def get_session(session_id):
+    try:
+        turns = session_store.get_turns(session_id)
+        return jsonify({
+            "session_id": session_id,
+            "turns": [{"sender": turn.sender, "text": turn.text} for turn in turns]
+        })
+    except SessionNotFoundError:
+        return jsonify({"error": "Session not found or expired"}), 404
+
+@app.route('/api/sessions/<session_id>', methods=['DELETE'])
+@log_api_call
+def delete_session(session_id):
+    session_store.delete(session_id)
+    return '', 204
+
 @app.route('/api/sentiment', methods=['POST'])
-@cache.cached(timeout=60, key_prefix=lambda: f"sentiment_{request.json.get('message', '')[:50]}")
 @log_api_call
 def analyze_sentiment():
+    sentiment_analyzer = model_registry.get('sentiment')
     try:
         data = request.json
         message = data.get('message', '')
@@ -90,41 +518,188 @@ def analyze_sentiment():
             "message": message
         })
     except Exception as e:
-        logger.error(f"Error in sentiment endpoint: {str(e)}")
+        logger.error("Error in sentiment endpoint: %s", e)
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/sentiment/batch', methods=['POST'])
+@log_api_call
+def analyze_sentiment_batch():
+    sentiment_analyzer = model_registry.get('sentiment')
+    try:
+        data = request.json
+        messages = data.get('messages', [])
+        
+        if not messages or not isinstance(messages, list):
+            return jsonify({"error": "No messages provided"}), 400
+        
+        if len(messages) > MAX_SENTIMENT_BATCH:
+            return jsonify({"error": f"Too many messages (max {MAX_SENTIMENT_BATCH})"}), 400
+        
+        if not all(isinstance(message, str) and message for message in messages):
+            return jsonify({"error": "Messages must be non-empty strings"}), 400
+        
+        # Analyze sentiment for all messages in batched forward passes
+        results = sentiment_analyzer.analyze_many(messages)
+        
+        return jsonify({
+            "results": [
+                {"sentiment": sentiment, "confidence": confidence, "message": message}
+                for message, (sentiment, confidence) in zip(messages, results)
+            ]
+        })
+    except Exception as e:
+        logger.error("Error in sentiment batch endpoint: %s", e)
         return jsonify({"error": str(e)}), 500
 
 @app.route('/api/topics', methods=['GET'])
-@cache.cached(timeout=3600)  # Cache for 1 hour
 @log_api_call
 def get_topics():
     try:
-        # Topics related to elderly interests and well-being
-        topics = [
-            "How are you feeling today?",
-            "What was your favorite activity when you were younger?",
-            "Do you have any family photos you'd like to tell me about?",
-            "What's your favorite season and why?",
-            "Have you read any good books or watched any good shows lately?",
-            "What's the most interesting place you've traveled to?",
-            "Do you have any favorite recipes you'd like to share?",
-            "What music do you enjoy listening to?",
-            "How did you meet your spouse or best friend?"
-        ]
-        
-        # Randomly select 4 topics
-        selected_topics = random.sample(topics, min(4, len(topics)))
+        # Optional: the session to suggest for and the sentiment of its latest message
+        selected_topics = suggest_topics(
+            request.args.get('session_id'),
+            request.args.get('sentiment'),
+            request.args.get('count', 4, type=int)
+        )
         
         return jsonify({
             "topics": selected_topics
         })
     except Exception as e:
-        logger.error(f"Error in topics endpoint: {str(e)}")
+        logger.error("Error in topics endpoint: %s", e)
         return jsonify({"error": str(e)}), 500
 
+@app.route('/api/stats/batching', methods=['GET'])
+def batching_stats():
+    conversation_manager = model_registry.get('chat')
+    scheduler = conversation_manager.batch_scheduler
+    if scheduler is None:
+        return jsonify({"enabled": False}), 200
+    
+    return jsonify({"enabled": True, **scheduler.get_stats()}), 200
+
+@app.route('/api/stats/kv_cache', methods=['GET'])
+def kv_cache_stats():
+    conversation_manager = model_registry.get('chat')
+    store = conversation_manager.kv_cache_store
+    if store is None:
+        return jsonify({"enabled": False}), 200
+    
+    return jsonify({"enabled": True, **store.get_stats()}), 200
+
+@app.route('/api/stats/speculative', methods=['GET'])
+def speculative_stats():
+    conversation_manager = model_registry.get('chat')
+    decoder = conversation_manager.speculative_decoder
+    if decoder is None:
+        return jsonify({"enabled": False}), 200
+    
+    return jsonify({"enabled": True, **decoder.get_stats()}), 200
+
+@app.route('/api/stats/generation', methods=['GET'])
+def generation_stats():
+    conversation_manager = model_registry.get('chat')
+    controller = conversation_manager.generation_controller
+    if controller is None:
+        return jsonify({"enabled": False}), 200
+    
+    return jsonify({"enabled": True, **controller.get_stats()}), 200
+
+@app.route('/api/stats/response_cache', methods=['GET'])
+def response_cache_stats():
+    conversation_manager = model_registry.get('chat')
+    response_cache = conversation_manager.response_cache
+    if response_cache is None:
+        return jsonify({"enabled": False}), 200
+    
+    return jsonify({"enabled": True, **response_cache.get_stats()}), 200
+
+@app.route('/api/stats/sentiment_cache', methods=['GET'])
+def sentiment_cache_stats():
+    sentiment_analyzer = model_registry.get('sentiment')
+    result_cache = sentiment_analyzer.result_cache
+    if result_cache is None:
+        return jsonify({"enabled": False}), 200
+    
+    return jsonify({"enabled": True, **result_cache.get_stats()}), 200
+
+@app.route('/api/stats/topics', methods=['GET'])
+def topic_stats():
+    return jsonify(topic_engine.get_stats()), 200
+
+@app.route('/api/stats/sessions', methods=['GET'])
+def session_stats():
+    return jsonify(session_store.get_stats()), 200
+
+@app.route('/api/stats/logging', methods=['GET'])
+def logging_stats():
+    log_pipeline = get_log_pipeline()
+    if log_pipeline is None:
+        return jsonify({"enabled": False}), 200
+    
+    return jsonify({"enabled": True, **log_pipeline.get_stats()}), 200
+
+@app.route('/api/admin/profiling', methods=['GET', 'POST'])
+@admin_required
+def profiling_settings():
+    if request_profiler is None:
+        return jsonify({"error": "Profiling is disabled"}), 404
+    
+    if request.method == 'POST':
+        # Profile the next N requests, optionally only under a path prefix
+        data = request.get_json(silent=True) or {}
+        count = data.get('requests', 1)
+        if not isinstance(count, int) or count < 0:
+            return jsonify({"error": "requests must be a non-negative integer"}), 400
+        request_profiler.arm(count, data.get('path_prefix'))
+    
+    return jsonify(request_profiler.get_stats()), 200
+
+@app.route('/api/admin/profiles', methods=['GET'])
+@admin_required
+def list_profiles():
+    if request_profiler is None:
+        return jsonify({"error": "Profiling is disabled"}), 404
+    
+    return jsonify({"profiles": request_profiler.store.list()}), 200
+
+@app.route('/api/admin/profiles/<profile_id>', methods=['GET'])
+@admin_required
+def download_profile(profile_id):
+    path = request_profiler.store.trace_path(profile_id) if request_profiler is not None else None
+    if path is None:
+        return jsonify({"error": "Profile not found"}), 404
+    
+    # Gzipped Chrome trace; open it in ui.perfetto.dev or chrome://tracing
+    return send_file(path, mimetype='application/gzip', as_attachment=True,
+                     download_name=f'profile-{profile_id}.json.gz')
+
+@app.route('/api/stats/workers', methods=['GET'])
+def worker_stats():
+    if worker_pool is None:
+        return jsonify({"enabled": False}), 200
+    
+    return jsonify({"enabled": True, **worker_pool.get_stats()}), 200
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    # Prometheus text exposition format; metrics are per process
+    return Response(REGISTRY.render(), mimetype='text/plain; version=0.0.4')
+
 @app.route('/health', methods=['GET'])
 def health_check():
+    # Liveness: the process is up, whether or not models have loaded
     return jsonify({"status": "healthy"}), 200
 
+@app.route('/ready', methods=['GET'])
+def readiness_check():
+    # Readiness: every model is loaded and requests can be served
+    ready = model_registry.is_ready()
+    return jsonify({
+        "status": "ready" if ready else "loading",
+        "models": model_registry.status()
+    }), 200 if ready else 503
+
 if __name__ == '__main__':
     port = int(os.environ.get('PORT', 5000))
     app.run(host='0.0.0.0', port=port, debug=False)
\ No newline at end of file
@@ -0,0 +1,697 @@
+# backend/asgi.py
+#
+# Async serving mode: the same API as app.py as an ASGI (Starlette) app.
+# Request handling stays on the event loop while model inference runs on a
+# bounded InferenceExecutor, so slow generations don't tie up connection
+# threads, overload is answered with 503 + Retry-After instead of an
+# ever-growing queue, and generation stops when the client disconnects.
+#
+#   uvicorn asgi:app --port 5000
+#   SERVER_MODE=asgi gunicorn -c gunicorn.conf.py
+import asyncio
+import json
+import logging
+import os
+import threading
+import time
+from functools import wraps
+from starlette.applications import Starlette
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.responses import FileResponse, JSONResponse, Response, StreamingResponse
+from starlette.routing import Route
+import app as wsgi
+from app import (MAX_SENTIMENT_BATCH, load_session_turns, model_registry, pipeline, save_session_turns,
+                 session_store, suggest_topics, topic_engine)
+from inference_executor import InferenceExecutor, OverloadedError
+from model_registry import ModelNotReadyError
+from sessions import SessionNotFoundError
+from utils.auth import is_admin
+from utils.metrics import REGISTRY, REQUEST_LATENCY, REQUESTS_CANCELLED
+from utils.profiling import PROFILE_ID_HEADER
+from utils.structured_logging import get_log_pipeline
+
+logger = logging.getLogger(__name__)
+
+# With CHAT_BATCHING, requests waiting for a batch hold a worker without
+# computing, so by default there is a worker per batch slot and torch uses
+# every core for the one batched generate running at a time. Without batching,
+# one inference job runs at a time, using every core.
+if os.environ.get('CHAT_BATCHING', '1') == '1':
+    default_inference_workers = int(os.environ.get('CHAT_MAX_BATCH_SIZE', 8))
+    default_torch_threads = os.cpu_count() or 1
+else:
+    default_inference_workers = 1
+    default_torch_threads = None
+inference_executor = InferenceExecutor(
+    max_workers=int(os.environ.get('INFERENCE_WORKERS', default_inference_workers)),
+    max_queue=int(os.environ.get('INFERENCE_MAX_QUEUE', 32)),
+    torch_threads=os.environ.get('TORCH_NUM_THREADS', default_torch_threads)
+)
+
+# How often to check whether the client of a pending chat request is still connected
+DISCONNECT_POLL_SECONDS = 0.1
+
+class ClientDisconnected(Exception):
+    """
+    Raised when the client goes away before its response is ready.
+    """
+    pass
+
+def route_template(request):
+    """
+    The matched route's path template (e.g. /api/sessions/{session_id}), so
+    metric labels stay bounded like the url_rule labels of the Flask app.
+    """
+    route = request.scope.get("route")
+    return route.path if route is not None else request.url.path
+
+def log_asgi_call(f):
+    """
+    Async counterpart of utils.metrics.log_api_call for Starlette endpoints.
+    """
+    @wraps(f)
+    async def decorated_function(request):
+        start_time = time.time()
+        endpoint = route_template(request)
+
+        def record(status_code):
+            elapsed = time.time() - start_time
+            REQUEST_LATENCY.observe(elapsed, method=request.method, endpoint=endpoint, status=str(status_code))
+            response_time = int(elapsed * 1000)
+            logger.info("API %s %s - Status: %s - Time: %sms", request.method, request.url.path,
+                        status_code, response_time,
+                        extra={"method": request.method, "endpoint": endpoint,
+                               "status": status_code, "duration_ms": response_time})
+
+        status_code = 500
+        streamed = False
+        try:
+            try:
+                response = await f(request)
+            except Exception as e:
+                # Build the response with the app's handler (e.g. 503 while models
+                # load) so it is counted; anything else stays a 500 for
+                # ServerErrorMiddleware
+                handler = _exception_handler(request, e)
+                if handler is None:
+                    raise
+                response = await handler(request, e)
+
+            status_code = response.status_code
+            # Streamed bodies are still being generated; record once the last chunk is sent
+            if isinstance(response, StreamingResponse):
+                response.body_iterator = _record_on_close(response.body_iterator, lambda: record(status_code))
+                streamed = True
+            return response
+        finally:
+            if not streamed:
+                record(status_code)
+
+    return decorated_function
+
+def _exception_handler(request, exc):
+    """
+    The app's handler for exc's type, other than the catch-all Exception handler.
+    """
+    handlers = request.app.exception_handlers
+    for cls in type(exc).__mro__:
+        if cls is Exception:
+            return None
+        if cls in handlers:
+            return handlers[cls]
+    return None
+
+async def _record_on_close(body_iterator, record):
+    try:
+        async for chunk in body_iterator:
+            yield chunk
+    finally:
+        # Close the endpoint's generator too, so its own cleanup runs
+        if hasattr(body_iterator, "aclose"):
+            await body_iterator.aclose()
+        record()
+
+def asgi_admin_required(f):
+    """
+    Async counterpart of utils.auth.admin_required for Starlette endpoints.
+    """
+    @wraps(f)
+    async def decorated_function(request):
+        if not is_admin(request.headers):
+            return JSONResponse({"error": "Admin token required"}, status_code=401)
+        return await f(request)
+
+    return decorated_function
+
+class ProfilingMiddleware:
+    """
+    Profile the requests selected by a utils.profiling.RequestProfiler.
+
+    Plain ASGI rather than BaseHTTPMiddleware so streamed responses are
+    profiled until their last chunk is sent. The profile starts and stops on
+    the event loop (the torch profiler needs both on one thread) and is saved
+    off the loop. Other requests served meanwhile show up in the trace too.
+    """
+    def __init__(self, app, profiler):
+        self.app = app
+        self.profiler = profiler
+
+    async def __call__(self, scope, receive, send):
+        session = None
+        if scope["type"] == "http":
+            session = self.profiler.start_request(scope["method"], scope["path"], Headers(scope=scope))
+        if session is None:
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+
+        async def send_with_profile_id(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                MutableHeaders(scope=message).append(PROFILE_ID_HEADER, session.profile_id)
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_profile_id)
+        finally:
+            session.stop(status)
+            await asyncio.to_thread(session.save)
+
+async def run_until_disconnected(request, fn, cancel_event):
+    """
+    Run a blocking inference call on the executor, waiting for its result
+    while watching for the client to disconnect.
+
+    Args:
+        request: The Starlette request being served
+        fn: Zero-argument callable doing the inference
+        cancel_event (threading.Event): Event fn watches to stop generating
+
+    Returns:
+        The result of fn
+
+    Raises:
+        OverloadedError: If the executor queue is full
+        ClientDisconnected: If the client disconnected first; the job is
+            cancelled if still queued, and cancel_event is set otherwise
+    """
+    future = inference_executor.submit(fn)
+    waiter = asyncio.wrap_future(future)
+
+    while True:
+        done, _ = await asyncio.wait({waiter}, timeout=DISCONNECT_POLL_SECONDS)
+        if done:
+            return waiter.result()
+
+        if await request.is_disconnected():
+            cancel_event.set()
+            future.cancel()
+            # Nobody will read the result; retrieve it so errors aren't reported as unhandled
+            waiter.add_done_callback(lambda f: f.cancelled() or f.exception())
+            REQUESTS_CANCELLED.inc(endpoint=route_template(request))
+            raise ClientDisconnected(request.url.path)
+
+# Define API routes
+@log_asgi_call
+async def chat(request):
+    conversation_manager = model_registry.get('chat')
+    data = await request.json()
+    user_message = data.get('message', '')
+    conversation_history = data.get('conversation_history', [])
+    conversation_id = data.get('conversation_id')
+    session_id = data.get('session_id')
+
+    if not user_message:
+        return JSONResponse({"error": "No message provided"}, status_code=400)
+
+    def generate():
+        # From the server-side session when one is given
+        if not session_id:
+            return conversation_manager.generate_response(
+                user_message, conversation_history, conversation_id, cancel_event=cancel_event)
+
+        session_turns = load_session_turns(conversation_manager, session_id, user_message)
+        response = conversation_manager.generate_response(
+            user_message, conversation_id=session_id, cancel_event=cancel_event, session_turns=session_turns)
+        if not cancel_event.is_set():
+            save_session_turns(conversation_manager, session_id, session_turns, response)
+        return response
+
+    # Generate response, stopping early if the client goes away
+    cancel_event = threading.Event()
+    response = await run_until_disconnected(request, generate, cancel_event)
+
+    return JSONResponse({
+        "response": response,
+        "status": "success"
+    })
+
+@log_asgi_call
+async def chat_stream(request):
+    conversation_manager = model_registry.get('chat')
+    data = await request.json()
+    user_message = data.get('message', '')
+    conversation_history = data.get('conversation_history', [])
+    conversation_id = data.get('conversation_id')
+    session_id = data.get('session_id')
+
+    if not user_message:
+        return JSONResponse({"error": "No message provided"}, status_code=400)
+
+    session_turns = None
+    if session_id:
+        session_turns = load_session_turns(conversation_manager, session_id, user_message)
+        conversation_id = session_id
+
+    loop = asyncio.get_running_loop()
+    events = asyncio.Queue()
+    stop_event = threading.Event()
+
+    def produce():
+        # Runs on an inference thread for the whole stream; closing the
+        # generator stops generation
+        stream = conversation_manager.stream_response(
+            user_message, conversation_history, conversation_id, session_turns=session_turns)
+        try:
+            for event in stream:
+                if stop_event.is_set():
+                    break
+                if event["type"] == "done" and session_turns:
+                    save_session_turns(conversation_manager, session_id, session_turns, event["response"])
+                loop.call_soon_threadsafe(events.put_nowait, event)
+        finally:
+            stream.close()
+            loop.call_soon_threadsafe(events.put_nowait, None)
+
+    # Admission control happens here, before any bytes are sent
+    inference_executor.submit(produce)
+
+    async def event_stream():
+        finished = False
+        try:
+            while True:
+                event = await events.get()
+                if event is None:
+                    finished = True
+                    break
+                if event["type"] == "token":
+                    payload = {"text": event["text"]}
+                else:
+                    payload = {"response": event["response"], "status": "success"}
+                yield f"event: {event['type']}\ndata: {json.dumps(payload)}\n\n"
+        finally:
+            # Also reached when Starlette cancels the stream on client disconnect
+            stop_event.set()
+            if not finished:
+                REQUESTS_CANCELLED.inc(endpoint=route_template(request))
+
+    # Server-Sent Events; disable proxy buffering so tokens arrive immediately
+    return StreamingResponse(
+        event_stream(),
+        media_type='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+@log_asgi_call
+async def chat_pipeline(request):
+    conversation_manager = model_registry.get('chat')
+    sentiment_analyzer = model_registry.get('sentiment')
+    data = await request.json()
+    user_message = data.get('message', '')
+    conversation_history = data.get('conversation_history', [])
+    conversation_id = data.get('conversation_id')
+    session_id = data.get('session_id')
+
+    if not user_message:
+        return JSONResponse({"error": "No message provided"}, status_code=400)
+
+    session_turns = None
+    if session_id:
+        session_turns = load_session_turns(conversation_manager, session_id, user_message)
+
+    # Only called once the pipeline's safety screen has passed the message
+    def generate():
+        if session_turns:
+            return conversation_manager.generate_response(
+                user_message, conversation_id=session_id, cancel_event=cancel_event, session_turns=session_turns,
+                screened=True)
+        return conversation_manager.generate_response(
+            user_message, conversation_history, conversation_id, cancel_event=cancel_event, screened=True)
+
+    def run():
+        result = pipeline.run(conversation_manager, sentiment_analyzer, user_message, generate)
+        if session_turns and not cancel_event.is_set():
+            save_session_turns(conversation_manager, session_id, session_turns, result["response"])
+        return result
+
+    # Safety screen, then sentiment and response generation in parallel,
+    # stopping early if the client goes away
+    cancel_event = threading.Event()
+    result = await run_until_disconnected(request, run, cancel_event)
+
+    return JSONResponse({**result, "status": "success"})
+
+@log_asgi_call
+async def chat_pipeline_stream(request):
+    conversation_manager = model_registry.get('chat')
+    sentiment_analyzer = model_registry.get('sentiment')
+    data = await request.json()
+    user_message = data.get('message', '')
+    conversation_history = data.get('conversation_history', [])
+    conversation_id = data.get('conversation_id')
+    session_id = data.get('session_id')
+
+    if not user_message:
+        return JSONResponse({"error": "No message provided"}, status_code=400)
+
+    session_turns = None
+    if session_id:
+        session_turns = load_session_turns(conversation_manager, session_id, user_message)
+        conversation_id = session_id
+
+    loop = asyncio.get_running_loop()
+    events = asyncio.Queue()
+    stop_event = threading.Event()
+
+    def produce():
+        # Runs on an inference thread for the whole stream; closing the
+        # generator stops generation
+        stream = pipeline.stream(
+            conversation_manager, sentiment_analyzer, user_message,
+            lambda: conversation_manager.stream_response(
+                user_message, conversation_history, conversation_id, session_turns=session_turns, screened=True))
+        try:
+            for event in stream:
+                if stop_event.is_set():
+                    break
+                if event["type"] == "done" and session_turns:
+                    save_session_turns(conversation_manager, session_id, session_turns, event["response"])
+                loop.call_soon_threadsafe(events.put_nowait, event)
+        finally:
+            stream.close()
+            loop.call_soon_threadsafe(events.put_nowait, None)
+
+    # Admission control happens here, before any bytes are sent
+    inference_executor.submit(produce)
+
+    async def event_stream():
+        finished = False
+        try:
+            while True:
+                event = await events.get()
+                if event is None:
+                    finished = True
+                    break
+                event_type = event.pop("type")
+                if event_type == "done":
+                    event["status"] = "success"
+                yield f"event: {event_type}\ndata: {json.dumps(event)}\n\n"
+        finally:
+            # Also reached when Starlette cancels the stream on client disconnect
+            stop_event.set()
+            if not finished:
+                REQUESTS_CANCELLED.inc(endpoint=route_template(request))
+
+    # Server-Sent Events: sentiment, then tokens, then the final response with timings
+    return StreamingResponse(
+        event_stream(),
+        media_type='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+@log_asgi_call
+async def create_session(request):
+    conversation_manager = model_registry.get('chat')
+    body = await request.body()
+    data = json.loads(body) if body else {}
+    turns = data.get('turns', [])
+
+    # Optional existing history, e.g. to restore an expired session
+    if not isinstance(turns, list) or not all(isinstance(turn, dict) and isinstance(turn.get('text'), str)
+                                              for turn in turns):
+        return JSONResponse({"error": "Turns must be objects with a text field"}, status_code=400)
+
+    session_id = session_store.create([
+        conversation_manager.encode_turn(turn.get('sender'), turn['text'])
+        for turn in turns if turn['text'].strip()
+    ])
+
+    return JSONResponse({
+        "session_id": session_id,
+        "ttl_seconds": session_store.ttl_seconds
+    }, status_code=201)
+
+@log_asgi_call
+async def get_session(request):
+    session_id = request.path_params['session_id']
+    turns = session_store.get_turns(session_id)
+    return JSONResponse({
+        "session_id": session_id,
+        "turns": [{"sender": turn.sender, "text": turn.text} for turn in turns]
+    })
+
+@log_asgi_call
+async def delete_session(request):
+    session_store.delete(request.path_params['session_id'])
+    return Response(status_code=204)
+
+@log_asgi_call
+async def analyze_sentiment(request):
+    sentiment_analyzer = model_registry.get('sentiment')
+    data = await request.json()
+    message = data.get('message', '')
+
+    if not message:
+        return JSONResponse({"error": "No message provided"}, status_code=400)
+
+    # Analyze sentiment
+    sentiment, confidence = await inference_executor.run(sentiment_analyzer.analyze, message)
+
+    return JSONResponse({
+        "sentiment": sentiment,
+        "confidence": confidence,
+        "message": message
+    })
+
+@log_asgi_call
+async def analyze_sentiment_batch(request):
+    sentiment_analyzer = model_registry.get('sentiment')
+    data = await request.json()
+    messages = data.get('messages', [])
+
+    if not messages or not isinstance(messages, list):
+        return JSONResponse({"error": "No messages provided"}, status_code=400)
+
+    if len(messages) > MAX_SENTIMENT_BATCH:
+        return JSONResponse({"error": f"Too many messages (max {MAX_SENTIMENT_BATCH})"}, status_code=400)
+
+    if not all(isinstance(message, str) and message for message in messages):
+        return JSONResponse({"error": "Messages must be non-empty strings"}, status_code=400)
+
+    # Analyze sentiment for all messages in batched forward passes
+    results = await inference_executor.run(sentiment_analyzer.analyze_many, messages)
+
+    return JSONResponse({
+        "results": [
+            {"sentiment": sentiment, "confidence": confidence, "message": message}
+            for message, (sentiment, confidence) in zip(messages, results)
+        ]
+    })
+
+@log_asgi_call
+async def get_topics(request):
+    try:
+        count = int(request.query_params.get('count', 4))
+    except ValueError:
+        count = 4
+    selected_topics = suggest_topics(request.query_params.get('session_id'),
+                                     request.query_params.get('sentiment'), count)
+
+    return JSONResponse({
+        "topics": selected_topics
+    })
+
+async def batching_stats(request):
+    scheduler = model_registry.get('chat').batch_scheduler
+    if scheduler is None:
+        return JSONResponse({"enabled": False})
+
+    return JSONResponse({"enabled": True, **scheduler.get_stats()})
+
+async def kv_cache_stats(request):
+    store = model_registry.get('chat').kv_cache_store
+    if store is None:
+        return JSONResponse({"enabled": False})
+
+    return JSONResponse({"enabled": True, **store.get_stats()})
+
+async def speculative_stats(request):
+    decoder = model_registry.get('chat').speculative_decoder
+    if decoder is None:
+        return JSONResponse({"enabled": False})
+
+    return JSONResponse({"enabled": True, **decoder.get_stats()})
+
+async def generation_stats(request):
+    controller = model_registry.get('chat').generation_controller
+    if controller is None:
+        return JSONResponse({"enabled": False})
+
+    return JSONResponse({"enabled": True, **controller.get_stats()})
+
+async def response_cache_stats(request):
+    response_cache = model_registry.get('chat').response_cache
+    if response_cache is None:
+        return JSONResponse({"enabled": False})
+
+    return JSONResponse({"enabled": True, **response_cache.get_stats()})
+
+async def sentiment_cache_stats(request):
+    result_cache = model_registry.get('sentiment').result_cache
+    if result_cache is None:
+        return JSONResponse({"enabled": False})
+
+    return JSONResponse({"enabled": True, **result_cache.get_stats()})
+
+async def topic_stats(request):
+    return JSONResponse(topic_engine.get_stats())
+
+async def session_stats(request):
+    return JSONResponse(session_store.get_stats())
+
+async def logging_stats(request):
+    log_pipeline = get_log_pipeline()
+    if log_pipeline is None:
+        return JSONResponse({"enabled": False})
+
+    return JSONResponse({"enabled": True, **log_pipeline.get_stats()})
+
+@asgi_admin_required
+async def profiling_settings(request):
+    if wsgi.request_profiler is None:
+        return JSONResponse({"error": "Profiling is disabled"}, status_code=404)
+
+    if request.method == 'POST':
+        # Profile the next N requests, optionally only under a path prefix
+        try:
+            data = await request.json()
+        except ValueError:
+            data = None
+        data = data if isinstance(data, dict) else {}
+        count = data.get('requests', 1)
+        if not isinstance(count, int) or count < 0:
+            return JSONResponse({"error": "requests must be a non-negative integer"}, status_code=400)
+        wsgi.request_profiler.arm(count, data.get('path_prefix'))
+
+    return JSONResponse(wsgi.request_profiler.get_stats())
+
+@asgi_admin_required
+async def list_profiles(request):
+    if wsgi.request_profiler is None:
+        return JSONResponse({"error": "Profiling is disabled"}, status_code=404)
+
+    return JSONResponse({"profiles": wsgi.request_profiler.store.list()})
+
+@asgi_admin_required
+async def download_profile(request):
+    profile_id = request.path_params['profile_id']
+    path = wsgi.request_profiler.store.trace_path(profile_id) if wsgi.request_profiler is not None else None
+    if path is None:
+        return JSONResponse({"error": "Profile not found"}, status_code=404)
+
+    # Gzipped Chrome trace; open it in ui.perfetto.dev or chrome://tracing
+    return FileResponse(path, media_type='application/gzip', filename=f'profile-{profile_id}.json.gz')
+
+async def worker_stats(request):
+    if wsgi.worker_pool is None:
+        return JSONResponse({"enabled": False})
+
+    return JSONResponse({"enabled": True, **wsgi.worker_pool.get_stats()})
+
+async def inference_stats(request):
+    return JSONResponse(inference_executor.get_stats())
+
+async def metrics(request):
+    # Prometheus text exposition format; metrics are per process
+    return Response(REGISTRY.render(), media_type='text/plain; version=0.0.4')
+
+async def health_check(request):
+    # Liveness: the process is up, whether or not models have loaded
+    return JSONResponse({"status": "healthy"})
+
+async def readiness_check(request):
+    # Readiness: every model is loaded and requests can be served
+    ready = model_registry.is_ready()
+    return JSONResponse({
+        "status": "ready" if ready else "loading",
+        "models": model_registry.status()
+    }, status_code=200 if ready else 503)
+
+async def model_not_ready(request, exc):
+    return JSONResponse({"error": "Models are still loading, please try again shortly"},
+                        status_code=503, headers={'Retry-After': '5'})
+
+async def session_not_found(request, exc):
+    return JSONResponse({"error": "Session not found or expired"}, status_code=404)
+
+async def overloaded(request, exc):
+    return JSONResponse({"error": str(exc)}, status_code=503, headers={'Retry-After': str(exc.retry_after)})
+
+async def client_disconnected(request, exc):
+    # Nobody is listening; 499 (client closed request) shows up in access logs
+    return Response(status_code=499)
+
+async def server_error(request, exc):
+    logger.error("Error in %s: %s", request.url.path, exc)
+    return JSONResponse({"error": str(exc)}, status_code=500)
+
+app = Starlette(
+    routes=[
+        Route('/api/chat', chat, methods=['POST']),
+        Route('/api/chat/stream', chat_stream, methods=['POST']),
+        Route('/api/chat/pipeline', chat_pipeline, methods=['POST']),
+        Route('/api/chat/pipeline/stream', chat_pipeline_stream, methods=['POST']),
+        Route('/api/sessions', create_session, methods=['POST']),
+        Route('/api/sessions/{session_id}', get_session, methods=['GET']),
+        Route('/api/sessions/{session_id}', delete_session, methods=['DELETE']),
+        Route('/api/sentiment', analyze_sentiment, methods=['POST']),
+        Route('/api/sentiment/batch', analyze_sentiment_batch, methods=['POST']),
+        Route('/api/topics', get_topics, methods=['GET']),
+        Route('/api/stats/batching', batching_stats, methods=['GET']),
+        Route('/api/stats/kv_cache', kv_cache_stats, methods=['GET']),
+        Route('/api/stats/speculative', speculative_stats, methods=['GET']),
+        Route('/api/stats/generation', generation_stats, methods=['GET']),
+        Route('/api/stats/response_cache', response_cache_stats, methods=['GET']),
+        Route('/api/stats/sentiment_cache', sentiment_cache_stats, methods=['GET']),
+        Route('/api/stats/topics', topic_stats, methods=['GET']),
+        Route('/api/stats/sessions', session_stats, methods=['GET']),
+        Route('/api/stats/logging', logging_stats, methods=['GET']),
+        Route('/api/admin/profiling', profiling_settings, methods=['GET', 'POST']),
+        Route('/api/admin/profiles', list_profiles, methods=['GET']),
+        Route('/api/admin/profiles/{profile_id}', download_profile, methods=['GET']),
+        Route('/api/stats/workers', worker_stats, methods=['GET']),
+        Route('/api/stats/inference', inference_stats, methods=['GET']),
+        Route('/metrics', metrics, methods=['GET']),
+        Route('/health', health_check, methods=['GET']),
+        Route('/ready', readiness_check, methods=['GET']),
+    ],
+    middleware=[Middleware(CORSMiddleware, allow_origins=['*'], allow_methods=['*'], allow_headers=['*'])]
+               + ([Middleware(ProfilingMiddleware, profiler=wsgi.request_profiler)]
+                  if wsgi.request_profiler is not None else []),
+    exception_handlers={
+        ModelNotReadyError: model_not_ready,
+        SessionNotFoundError: session_not_found,
+        OverloadedError: overloaded,
+        ClientDisconnected: client_disconnected,
+        Exception: server_error,
+    }
+)
+
+if __name__ == '__main__':
+    import uvicorn
+    port = int(os.environ.get('PORT', 5000))
+    uvicorn.run(app, host='0.0.0.0', port=port)
@@ -0,0 +1,187 @@
+import logging
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from utils.metrics import BATCH_SIZE, QUEUE_DEPTH
+
+logger = logging.getLogger(__name__)
+
+class BatchScheduler:
+    """
+    Collects concurrent chat generation requests and runs them through the
+    model as a single batched generate call.
+
+    Requests are gathered until either the batch window expires or the batch
+    is full, whichever comes first. Each caller blocks until its own response
+    is ready.
+
+    The worker thread is started on first use in each process, so a scheduler
+    created before gunicorn forks its workers still works in every worker.
+    """
+    def __init__(self, conversation_manager, max_batch_size=8, batch_window_ms=5):
+        self.conversation_manager = conversation_manager
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.batch_window = max(0.0, float(batch_window_ms)) / 1000.0
+
+        self._queue = None
+        self._worker = None
+        self._worker_pid = None
+        self._start_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._stats = {
+            "requests": 0,
+            "batches": 0,
+            "max_queue_depth": 0,
+            "total_wait_ms": 0.0,
+            "batch_sizes": {},
+        }
+
+        self._running = True
+
+        logger.info(f"Batch scheduler configured (max_batch_size={self.max_batch_size}, "
+                    f"window={batch_window_ms}ms)")
+
+    def _ensure_worker(self):
+        """
+        Start the worker thread for the current process if it is not running.
+        """
+        if self._worker_pid == os.getpid():
+            return
+
+        with self._start_lock:
+            if self._worker_pid == os.getpid():
+                return
+            self._queue = queue.Queue()
+            self._worker = threading.Thread(target=self._run, name="chat-batch-scheduler", daemon=True)
+            self._worker.start()
+            self._worker_pid = os.getpid()
+
+    def submit(self, input_ids, cancel_event=None, plan=None):
+        """
+        Queue a single encoded prompt and wait for its generated response.
+
+        Args:
+            input_ids (torch.Tensor): Encoded prompt of shape (1, seq_len)
+            cancel_event (threading.Event): Optional event; once set, the request
+                is dropped if still queued or stops generating within its batch
+            plan (GenerationPlan): Optional token budget and deadline for this prompt
+
+        Returns:
+            str: The cleaned response for this prompt (may be empty)
+        """
+        self._ensure_worker()
+        future = Future()
+        self._queue.put((input_ids, future, time.perf_counter(), cancel_event, plan))
+
+        depth = self.queue_depth()
+        QUEUE_DEPTH.set(depth)
+        with self._stats_lock:
+            self._stats["max_queue_depth"] = max(self._stats["max_queue_depth"], depth)
+
+        return future.result()
+
+    def queue_depth(self):
+        """
+        Number of requests currently waiting to be batched.
+        """
+        return self._queue.qsize() if self._queue is not None else 0
+
+    def get_stats(self):
+        """
+        Snapshot of batching statistics, used to tune the batch window.
+
+        Returns:
+            dict: Request and batch counters, queue depth and batch size distribution
+        """
+        with self._stats_lock:
+            stats = dict(self._stats)
+            stats["batch_sizes"] = dict(self._stats["batch_sizes"])
+
+        batches = stats["batches"]
+        stats["avg_batch_size"] = stats["requests"] / batches if batches else 0.0
+        stats["avg_wait_ms"] = stats["total_wait_ms"] / stats["requests"] if stats["requests"] else 0.0
+        stats["queue_depth"] = self.queue_depth()
+        stats["max_batch_size"] = self.max_batch_size
+        stats["batch_window_ms"] = self.batch_window * 1000.0
+        return stats
+
+    def shutdown(self):
+        """
+        Stop the worker thread after the current batch finishes.
+        """
+        self._running = False
+        if self._worker_pid == os.getpid():
+            self._queue.put(None)
+            self._worker.join(timeout=5)
+
+    def _collect_batch(self):
+        """
+        Block for the first request, then gather more until the window closes
+        or the batch is full.
+        """
+        first = self._queue.get()
+        if first is None:
+            return []
+
+        batch = [first]
+        deadline = time.perf_counter() + self.batch_window
+
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if item is None:
+                self._running = False
+                break
+            batch.append(item)
+
+        return batch
+
+    def _run(self):
+        while self._running:
+            batch = self._collect_batch()
+            # Requests cancelled while queued never reach the model
+            active = []
+            for item in batch:
+                cancel_event = item[3]
+                if cancel_event is not None and cancel_event.is_set():
+                    item[1].set_result("")
+                else:
+                    active.append(item)
+            batch = active
+            if not batch:
+                continue
+
+            started = time.perf_counter()
+            wait_ms = sum((started - enqueued) * 1000.0 for _, _, enqueued, _, _ in batch)
+
+            with self._stats_lock:
+                size = len(batch)
+                self._stats["requests"] += size
+                self._stats["batches"] += 1
+                self._stats["total_wait_ms"] += wait_ms
+                self._stats["batch_sizes"][size] = self._stats["batch_sizes"].get(size, 0) + 1
+            BATCH_SIZE.observe(size)
+            QUEUE_DEPTH.set(self.queue_depth())
+
+            try:
+                responses = self.conversation_manager._generate_batch(
+                    [input_ids for input_ids, _, _, _, _ in batch],
+                    [cancel_event for _, _, _, cancel_event, _ in batch],
+                    [plan for _, _, _, _, plan in batch])
+            except Exception as e:
+                logger.error("Error generating batch of %d: %s", len(batch), e)
+                for _, future, _, _, _ in batch:
+                    future.set_exception(e)
+                continue
+
+            for (_, future, _, _, _), response in zip(batch, responses):
+                future.set_result(response)
+
+            logger.debug("Generated batch of %d in %.0fms", len(batch), (time.perf_counter() - started) * 1000)
@@ -0,0 +1,134 @@
+"""
+Benchmark adaptive generation against generating the full token budget.
+
+Answers the same prompts through ConversationManager.generate_response
+twice: with early stopping at the display cap turned off (every response
+runs to the end-of-text token or max_new_tokens, as before) and with it on,
+and reports latency, generated tokens and how many of them were discarded by
+cleanup and the 200-character cap. With --concurrency above 1 the requests
+are sent from that many threads at once, so the load-adaptive token budget
+comes into play. Run from the backend directory:
+
+    python benchmarks/bench_adaptive_generation.py --concurrency 1 8 --output adaptive.json
+
+Defaults to DialoGPT-medium. Pass --tiny to use a small locally built
+stand-in instead (no download; its responses are noise, so nearly every one
+runs into the length cap).
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import torch
+from transformers import AutoTokenizer
+from benchmarks.tiny_models import build_tiny_chat_model
+from conversation import ConversationManager
+from inference_backends import load_causal_lm
+
+PROMPTS = [
+    "Good morning! I slept quite well last night.",
+    "I've been feeling a bit lonely lately.",
+    "My granddaughter is visiting this weekend.",
+    "Do you know any good soup recipes for the winter?",
+    "I went for a walk in the park and saw some lovely birds.",
+    "My knee has been hurting when it rains.",
+    "Tell me a long story about the seaside.",
+    "What should I cook for dinner tonight?",
+]
+
+def run(conversation_manager, prompts, concurrency):
+    def answer(prompt):
+        start = time.perf_counter()
+        conversation_manager.generate_response(prompt)
+        return time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        latencies = list(executor.map(answer, prompts))
+    return latencies, time.perf_counter() - start
+
+def main(args):
+    if args.tiny:
+        model_dir = args.model_dir or tempfile.mkdtemp(prefix="chatbot-adaptive-bench-")
+        model_name = build_tiny_chat_model(model_dir, n_layer=4, n_embd=256, n_head=4)
+    else:
+        model_name = args.model
+
+    tokenizer = AutoTokenizer.from_pretrained(model_name)
+    conversation_manager = ConversationManager(load_causal_lm(model_name).eval(), tokenizer, "cpu",
+                                               max_length=args.max_new_tokens)
+    prompts = PROMPTS * args.repeats
+
+    # Warm up before measuring
+    conversation_manager.generate_response(prompts[0])
+
+    results = []
+    for concurrency in args.concurrency:
+        for mode, max_chars in (("full_budget", 0), ("adaptive", 200)):
+            torch.manual_seed(args.seed)
+            # full_budget only records the waste; adaptive also stops early and adapts to load
+            controller = conversation_manager.enable_adaptive_generation(
+                min_new_tokens=args.min_new_tokens,
+                full_budget_load=args.full_budget_load if max_chars else len(prompts),
+                deadline_ms=args.deadline_ms if max_chars else 0,
+                max_chars=max_chars,
+            )
+            latencies, seconds = run(conversation_manager, prompts, concurrency)
+            stats = controller.get_stats()
+
+            result = {
+                "mode": mode,
+                "concurrency": concurrency,
+                "responses_per_second": len(prompts) / seconds,
+                "latency_ms_p50": float(np.percentile(latencies, 50) * 1000),
+                "latency_ms_p95": float(np.percentile(latencies, 95) * 1000),
+                "generated_tokens_per_response": stats["avg_generated_tokens"],
+                "discarded_tokens_per_response": stats["discarded_tokens"] / max(1, stats["responses"]),
+                "discard_rate": stats["discard_rate"],
+                "avg_budget_tokens": stats["avg_budget_tokens"],
+                "stop_reasons": stats["stop_reasons"],
+            }
+            results.append(result)
+            print(f"{mode:<11} x{concurrency:<2} | {result['responses_per_second']:6.2f} responses/s | "
+                  f"p50 {result['latency_ms_p50']:7.0f}ms | "
+                  f"{result['generated_tokens_per_response']:5.1f} tokens generated, "
+                  f"{result['discarded_tokens_per_response']:5.1f} discarded ({result['discard_rate']:.0%}) | "
+                  f"budget {result['avg_budget_tokens']:.0f}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"model": model_name, "results": results}, f, indent=2)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark adaptive generation")
+    parser.add_argument("--model", type=str, default="microsoft/DialoGPT-medium",
+                        help="Chat model")
+    parser.add_argument("--tiny", action="store_true",
+                        help="Use a small locally built stand-in model instead")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8],
+                        help="Concurrent requests to benchmark")
+    parser.add_argument("--max_new_tokens", type=int, default=100,
+                        help="Full token budget per response")
+    parser.add_argument("--min_new_tokens", type=int, default=32,
+                        help="Smallest token budget under load")
+    parser.add_argument("--full_budget_load", type=int, default=4,
+                        help="Concurrent requests that still get the full budget")
+    parser.add_argument("--deadline_ms", type=float, default=0,
+                        help="Per-request generation deadline (0 disables)")
+    parser.add_argument("--repeats", type=int, default=2,
+                        help="Times to run through the prompt set")
+    parser.add_argument("--seed", type=int, default=0,
+                        help="Random seed for sampling")
+    parser.add_argument("--model_dir", type=str, default=None,
+                        help="Where to write the stand-in model with --tiny (default: a temp directory)")
+    parser.add_argument("--output", type=str, default=None,
+                        help="Optional path for JSON results")
+
+    main(parser.parse_args())
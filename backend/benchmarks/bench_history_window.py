@@ -0,0 +1,121 @@
+"""
+Benchmark prompt construction cost against conversation history length.
+
+Builds the model input for conversations with a growing number of previous
+messages, sent statelessly as conversation_history, in three ways:
+
+    joined   the previous approach: join the last 10 messages into one
+             string, tokenize all of it and cut the oldest tokens beyond 512
+    window   ConversationManager._encode_input with an empty turn token
+             cache: walks turns newest first and tokenizes only those that fit
+    cached   the same with the cache warm from earlier requests in the
+             conversation, so only the new message is tokenized
+
+and reports the median time per prompt for each history length. Run from
+the backend directory:
+
+    python benchmarks/bench_history_window.py --turns 0 2 5 10 20 50 100 --output window.json
+
+Defaults to the DialoGPT tokenizer. Pass --tiny to use a small locally
+built stand-in instead (no download).
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+from transformers import AutoTokenizer
+from benchmarks.tiny_models import CORPUS, build_tiny_chat_model
+from conversation import ConversationManager
+from utils.cache import TurnTokenCache
+
+def make_history(turns, message_words, seed):
+    rng = random.Random(seed)
+    words = " ".join(CORPUS).split()
+    return [
+        {"sender": "user" if i % 2 == 0 else "bot", "text": " ".join(rng.choices(words, k=message_words))}
+        for i in range(turns)
+    ]
+
+def joined_input_ids(conversation_manager, user_message, conversation_history):
+    lines = [f"{'User' if message['sender'] == 'user' else 'Assistant'}: {message['text']}"
+             for message in conversation_history[-10:]]
+    lines += [f"User: {user_message}", "Assistant:"]
+    input_ids = conversation_manager.tokenizer.encode("\n".join(lines), return_tensors='pt')
+    return input_ids[:, -conversation_manager.max_history_tokens:]
+
+def time_prompts(build, repeats):
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        build()
+        timings.append(time.perf_counter() - start)
+    return float(np.median(timings)) * 1e6
+
+def main(args):
+    if args.tiny:
+        model_dir = args.model_dir or tempfile.mkdtemp(prefix="chatbot-window-bench-")
+        tokenizer_name = build_tiny_chat_model(model_dir)
+    else:
+        tokenizer_name = args.tokenizer
+
+    tokenizer = AutoTokenizer.from_pretrained(tokenizer_name)
+    conversation_manager = ConversationManager(None, tokenizer, "cpu")
+    user_message = "I have been thinking about my garden and the tomatoes we planted this spring."
+
+    results = []
+    for turns in args.turns:
+        history = make_history(turns, args.message_words, args.seed)
+
+        def window_cold():
+            conversation_manager.turn_token_cache = TurnTokenCache(tokenizer)
+            return conversation_manager._encode_input(user_message, history)
+
+        def window_cached():
+            return conversation_manager._encode_input(user_message, history)
+
+        conversation_manager.turn_token_cache = TurnTokenCache(tokenizer)
+        window_cached()
+        result = {
+            "turns": turns,
+            "joined_us": time_prompts(lambda: joined_input_ids(conversation_manager, user_message, history),
+                                      args.repeats),
+            "window_us": time_prompts(window_cold, args.repeats),
+            "cached_us": time_prompts(window_cached, args.repeats),
+            "prompt_tokens": int(window_cached().shape[1]),
+        }
+        results.append(result)
+        print(f"{turns:4d} turns | joined {result['joined_us']:8.1f}us | window {result['window_us']:8.1f}us | "
+              f"cached {result['cached_us']:8.1f}us | {result['prompt_tokens']} prompt tokens")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"tokenizer": tokenizer_name, "message_words": args.message_words, "results": results}, f,
+                      indent=2)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark history window construction")
+    parser.add_argument("--tokenizer", type=str, default="microsoft/DialoGPT-medium",
+                        help="Chat model tokenizer")
+    parser.add_argument("--tiny", action="store_true",
+                        help="Use a small locally built stand-in tokenizer instead")
+    parser.add_argument("--turns", type=int, nargs="+", default=[0, 2, 5, 10, 20, 50, 100],
+                        help="History lengths (previous messages) to benchmark")
+    parser.add_argument("--message_words", type=int, default=40,
+                        help="Words per history message")
+    parser.add_argument("--repeats", type=int, default=200,
+                        help="Prompts built per measurement")
+    parser.add_argument("--seed", type=int, default=0,
+                        help="Random seed for the synthetic history")
+    parser.add_argument("--model_dir", type=str, default=None,
+                        help="Where to write the stand-in tokenizer with --tiny (default: a temp directory)")
+    parser.add_argument("--output", type=str, default=None,
+                        help="Optional path for JSON results")
+
+    main(parser.parse_args())
@@ -0,0 +1,103 @@
+"""
+Benchmark safety screening time as the phrase list grows.
+
+Compares the compiled SafetyMatcher against the previous approach of calling
+re.search once per pattern. Run from the backend directory:
+
+    python benchmarks/bench_safety.py --sizes 10 100 1000 10000
+"""
+import os
+import re
+import sys
+import json
+import time
+import random
+import string
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from safety import SafetyMatcher
+
+SAMPLE_MESSAGES = [
+    "Good morning! I slept well and had a lovely cup of tea.",
+    "My daughter is visiting this weekend with the grandchildren.",
+    "I've been feeling a bit lonely since the winter started.",
+    "The doctor changed my blood pressure medication again.",
+    "Do you remember the name of that song from the fifties?",
+    "I don't really want to go to the community centre today.",
+    "We planted tomatoes and beans in the garden this spring.",
+    "Sometimes I feel like nobody listens to me anymore.",
+]
+
+def random_phrase(rng):
+    words = ["".join(rng.choices(string.ascii_lowercase, k=rng.randint(3, 9))) for _ in range(rng.randint(1, 4))]
+    return " ".join(words)
+
+def build_phrase_file(size, rng, directory):
+    phrases = [random_phrase(rng) for _ in range(size)]
+    path = os.path.join(directory, f"phrases_{size}.json")
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"categories": {"synthetic": {"en": phrases}}}, f)
+    return path, phrases
+
+def time_scans(scan, messages, repeats):
+    start = time.perf_counter()
+    for _ in range(repeats):
+        for message in messages:
+            scan(message)
+    return (time.perf_counter() - start) / (repeats * len(messages)) * 1e6
+
+def main(args):
+    rng = random.Random(0)
+    results = []
+
+    with tempfile.TemporaryDirectory() as directory:
+        for size in args.sizes:
+            path, phrases = build_phrase_file(size, rng, directory)
+
+            compile_start = time.perf_counter()
+            matcher = SafetyMatcher(path, reload_interval=3600)
+            compile_ms = (time.perf_counter() - compile_start) * 1000
+
+            # Previous implementation: one uncompiled re.search per pattern
+            patterns = [rf"(?i)\b{re.escape(p)}\b" for p in phrases]
+
+            def naive_scan(text):
+                for pattern in patterns:
+                    if re.search(pattern, text):
+                        return True
+                return False
+
+            compiled_us = time_scans(matcher.scan, SAMPLE_MESSAGES, args.repeats)
+            naive_repeats = max(1, args.repeats // max(1, size // 100))
+            naive_us = time_scans(naive_scan, SAMPLE_MESSAGES, naive_repeats)
+
+            # Sanity check: every phrase is found when embedded in a message
+            missed = sum(1 for p in phrases[:200] if matcher.scan(f"well {p} today") is None)
+
+            results.append({
+                "phrases": size,
+                "compile_ms": round(compile_ms, 2),
+                "compiled_us_per_message": round(compiled_us, 2),
+                "per_pattern_us_per_message": round(naive_us, 2),
+                "missed_phrases": missed,
+            })
+            print(f"{size:>7} phrases | compile {compile_ms:8.1f}ms | compiled {compiled_us:8.2f}us/msg "
+                  f"| per-pattern {naive_us:10.2f}us/msg | missed {missed}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark safety phrase screening")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 1000, 10000],
+                        help="Phrase list sizes to benchmark")
+    parser.add_argument("--repeats", type=int, default=200,
+                        help="Scans of the sample messages per size")
+    parser.add_argument("--output", type=str, default=None,
+                        help="Optional path for JSON results")
+
+    main(parser.parse_args())
@@ -0,0 +1,157 @@
+"""
+Benchmark a distilled sentiment student against its teacher.
+
+Loads both models through SentimentAnalyzer (so labels are the ones the
+API returns, with the teacher's threshold-based neutral class) and reports
+for each:
+
+    single     latency of one message per forward pass, as in /api/sentiment
+    batch      messages/sec scoring all messages in batches of --batch_size
+    size       parameters and weights on disk
+
+and how often the student's label agrees with the teacher's, overall and
+per teacher label. Use messages the student was not trained on, e.g. a
+held-out text file with one message per line. Run from the backend
+directory:
+
+    python benchmarks/bench_sentiment_distill.py --student ../ml_training/sentiment_student \\
+        --messages heldout.txt --output sentiment_distill.json
+"""
+import os
+import sys
+import json
+import time
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import torch
+from sentiment_analysis import SentimentAnalyzer
+
+SAMPLE_MESSAGES = [
+    "Good morning! I slept well and had a lovely cup of tea.",
+    "My daughter is visiting this weekend with the grandchildren.",
+    "I've been feeling a bit lonely since the winter started.",
+    "The doctor changed my blood pressure medication again.",
+    "Do you remember the name of that song from the fifties?",
+    "I don't really want to go to the community centre today.",
+    "We planted tomatoes and beans in the garden this spring.",
+    "Sometimes I feel like nobody listens to me anymore.",
+    "My knee has been hurting when it rains.",
+    "What a wonderful surprise, my old friend called me today!",
+    "I'm not sure what to have for dinner.",
+    "It was an ordinary day, nothing much happened.",
+]
+
+def load_messages(path, limit):
+    """
+    Messages from a text file (one per line) or JSONL with a "text" field,
+    such as the teacher_labels.jsonl written by distill_sentiment.py.
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        if path.endswith(".jsonl"):
+            messages = [json.loads(line)["text"] for line in f if line.strip()]
+        else:
+            messages = [line.strip() for line in f if line.strip()]
+    return messages[:limit] if limit else messages
+
+def weights_mb(model_name):
+    if not os.path.isdir(model_name):
+        return None
+    return sum(os.path.getsize(os.path.join(model_name, name)) for name in os.listdir(model_name)
+               if name.endswith((".safetensors", ".bin", ".onnx"))) / 1e6
+
+def measure(analyzer, model_name, messages, single_count, batch_size):
+    analyzer.analyze_many(messages[:batch_size], batch_size=batch_size)
+
+    single = []
+    for message in messages[:single_count]:
+        start = time.perf_counter()
+        analyzer.analyze_many([message])
+        single.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    results = analyzer.analyze_many(messages, batch_size=batch_size)
+    batch_seconds = time.perf_counter() - start
+
+    return results, {
+        "model": model_name,
+        "model_version": analyzer.model_version,
+        "parameters": sum(p.numel() for p in analyzer.model.parameters()) if hasattr(analyzer.model, "parameters")
+        else None,
+        "weights_mb": weights_mb(model_name),
+        "single_ms_p50": float(np.percentile(single, 50) * 1000),
+        "single_ms_p95": float(np.percentile(single, 95) * 1000),
+        "batch_messages_per_second": len(messages) / batch_seconds,
+    }
+
+def main(args):
+    if args.threads:
+        torch.set_num_threads(args.threads)
+
+    messages = load_messages(args.messages, args.limit) if args.messages else SAMPLE_MESSAGES
+    if not args.messages:
+        print("No --messages given; agreement on the built-in sample messages is only a smoke test")
+
+    # No result cache is enabled, so every call runs the model
+    teacher = SentimentAnalyzer(backend=args.backend, model_name=args.teacher)
+    teacher_results, teacher_stats = measure(teacher, args.teacher, messages, args.single, args.batch_size)
+    del teacher
+
+    student = SentimentAnalyzer(backend=args.backend, model_name=args.student)
+    student_results, student_stats = measure(student, args.student, messages, args.single, args.batch_size)
+
+    teacher_labels = [label for label, _ in teacher_results]
+    student_labels = [label for label, _ in student_results]
+    agreement = {"overall": float(np.mean([t == s for t, s in zip(teacher_labels, student_labels)]))}
+    confusion = {}
+    for label in ("negative", "neutral", "positive"):
+        matches = [s for t, s in zip(teacher_labels, student_labels) if t == label]
+        agreement[label] = float(np.mean([s == label for s in matches])) if matches else None
+        confusion[label] = {other: matches.count(other) for other in ("negative", "neutral", "positive")}
+
+    for name, stats in (("teacher", teacher_stats), ("student", student_stats)):
+        parameters = f"{stats['parameters'] / 1e6:6.1f}M" if stats["parameters"] else "     -  "
+        print(f"{name:7s} | {parameters} params | single p50 {stats['single_ms_p50']:7.2f}ms "
+              f"p95 {stats['single_ms_p95']:7.2f}ms | batch {stats['batch_messages_per_second']:8.1f} msg/s")
+    print(f"speedup: single {teacher_stats['single_ms_p50'] / student_stats['single_ms_p50']:.1f}x, "
+          f"batch {student_stats['batch_messages_per_second'] / teacher_stats['batch_messages_per_second']:.1f}x")
+    print(f"agreement on {len(messages)} messages: {agreement['overall']:.1%} ("
+          + ", ".join(f"{label} {value:.1%}" for label, value in agreement.items()
+                      if label != "overall" and value is not None) + ")")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({
+                "messages": len(messages),
+                "batch_size": args.batch_size,
+                "threads": torch.get_num_threads(),
+                "teacher": teacher_stats,
+                "student": student_stats,
+                "agreement": agreement,
+                "confusion": confusion,
+            }, f, indent=2)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark a distilled sentiment student against its teacher")
+    parser.add_argument("--teacher", type=str, default="distilbert-base-uncased-finetuned-sst-2-english",
+                        help="Teacher model name or directory")
+    parser.add_argument("--student", type=str, required=True,
+                        help="Student model directory written by ml_training/distill_sentiment.py")
+    parser.add_argument("--messages", type=str, default=None,
+                        help="Held-out messages: text file with one per line, or JSONL with a text field")
+    parser.add_argument("--limit", type=int, default=5000,
+                        help="Use at most this many messages")
+    parser.add_argument("--single", type=int, default=200,
+                        help="Messages timed one at a time")
+    parser.add_argument("--batch_size", type=int, default=32,
+                        help="Messages per forward pass for the batch measurement")
+    parser.add_argument("--backend", type=str, default=None,
+                        help="Inference backend for both models (default: INFERENCE_BACKEND)")
+    parser.add_argument("--threads", type=int, default=None,
+                        help="torch threads (default: torch's own choice)")
+    parser.add_argument("--output", type=str, default=None,
+                        help="Optional path for JSON results")
+
+    main(parser.parse_args())
@@ -0,0 +1,132 @@
+"""
+Benchmark speculative decoding against standard generation.
+
+Generates responses to the same prompts with the chat model alone and with
+a draft model proposing tokens, using the production sampling settings, and
+reports tokens per second, draft acceptance rate and speedup for each draft
+length. Run from the backend directory:
+
+    python benchmarks/bench_speculative.py --draft_tokens 2 4 6 --output speculative.json
+
+Defaults to DialoGPT-medium with DialoGPT-small as the draft model. Pass
+--tiny to use small locally built stand-ins instead (no download; acceptance
+is low because the two stand-ins are unrelated).
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import torch
+from transformers import AutoTokenizer
+from benchmarks.tiny_models import build_tiny_chat_model
+from conversation import ConversationManager
+from inference_backends import load_causal_lm
+
+PROMPTS = [
+    "Good morning! I slept quite well last night.",
+    "I've been feeling a bit lonely lately.",
+    "My granddaughter is visiting this weekend.",
+    "Do you know any good soup recipes for the winter?",
+    "I went for a walk in the park and saw some lovely birds.",
+    "My knee has been hurting when it rains.",
+]
+
+def run_standard(conversation_manager, prompts, max_new_tokens):
+    tokens = 0
+    start = time.perf_counter()
+    for prompt in prompts:
+        input_ids = conversation_manager._encode_input(prompt)
+        with torch.no_grad():
+            output = conversation_manager.model.generate(
+                input_ids,
+                attention_mask=torch.ones_like(input_ids),
+                max_new_tokens=max_new_tokens,
+                pad_token_id=conversation_manager.eos_token_id,
+                **conversation_manager.generation_kwargs,
+            )
+        tokens += output.shape[1] - input_ids.shape[1]
+    return tokens, time.perf_counter() - start
+
+def run_speculative(decoder, conversation_manager, prompts, max_new_tokens):
+    tokens = 0
+    start = time.perf_counter()
+    for prompt in prompts:
+        input_ids = conversation_manager._encode_input(prompt)
+        output = decoder.generate(input_ids, max_new_tokens, eos_token_id=conversation_manager.eos_token_id)
+        tokens += output.sequences.shape[1] - input_ids.shape[1]
+    return tokens, time.perf_counter() - start
+
+def main(args):
+    torch.manual_seed(args.seed)
+    if args.tiny:
+        model_dir = args.model_dir or tempfile.mkdtemp(prefix="chatbot-speculative-bench-")
+        target_name = build_tiny_chat_model(os.path.join(model_dir, "target"), n_layer=8, n_embd=256, n_head=4)
+        draft_name = build_tiny_chat_model(os.path.join(model_dir, "draft"), n_layer=2, n_embd=128, n_head=2, seed=1)
+    else:
+        target_name, draft_name = args.model, args.draft_model
+
+    tokenizer = AutoTokenizer.from_pretrained(target_name)
+    conversation_manager = ConversationManager(load_causal_lm(target_name).eval(), tokenizer, "cpu",
+                                               max_length=args.max_new_tokens)
+    draft_model = load_causal_lm(draft_name).eval()
+    prompts = PROMPTS * args.repeats
+
+    # Warm up both models before measuring
+    run_standard(conversation_manager, prompts[:1], 4)
+    run_speculative(conversation_manager.enable_speculative_decoding(draft_model), conversation_manager, prompts[:1], 4)
+
+    tokens, seconds = run_standard(conversation_manager, prompts, args.max_new_tokens)
+    baseline = tokens / seconds
+    print(f"standard       | {baseline:7.1f} tokens/s | {tokens} tokens in {seconds:.2f}s")
+
+    results = [{"mode": "standard", "tokens_per_second": baseline, "tokens": tokens, "seconds": seconds}]
+    for num_draft_tokens in args.draft_tokens:
+        decoder = conversation_manager.enable_speculative_decoding(draft_model, num_draft_tokens=num_draft_tokens)
+        tokens, seconds = run_speculative(decoder, conversation_manager, prompts, args.max_new_tokens)
+        stats = decoder.get_stats()
+        result = {
+            "mode": "speculative",
+            "num_draft_tokens": num_draft_tokens,
+            "tokens_per_second": tokens / seconds,
+            "tokens": tokens,
+            "seconds": seconds,
+            "acceptance_rate": stats["acceptance_rate"],
+            "tokens_per_round": stats["tokens_per_round"],
+            "speedup": (tokens / seconds) / baseline,
+        }
+        results.append(result)
+        print(f"speculative k={num_draft_tokens} | {result['tokens_per_second']:7.1f} tokens/s | "
+              f"acceptance {result['acceptance_rate']:.1%} | {result['tokens_per_round']:.2f} tokens/round | "
+              f"speedup {result['speedup']:.2f}x")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"model": target_name, "draft_model": draft_name, "results": results}, f, indent=2)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark speculative decoding")
+    parser.add_argument("--model", type=str, default="microsoft/DialoGPT-medium",
+                        help="Chat model")
+    parser.add_argument("--draft_model", type=str, default="microsoft/DialoGPT-small",
+                        help="Draft model sharing the chat model's tokenizer")
+    parser.add_argument("--tiny", action="store_true",
+                        help="Use small locally built stand-in models instead")
+    parser.add_argument("--draft_tokens", type=int, nargs="+", default=[2, 4, 6],
+                        help="Draft lengths to benchmark")
+    parser.add_argument("--max_new_tokens", type=int, default=100,
+                        help="Tokens generated per response")
+    parser.add_argument("--repeats", type=int, default=2,
+                        help="Times to run through the prompt set")
+    parser.add_argument("--seed", type=int, default=0,
+                        help="Random seed for sampling")
+    parser.add_argument("--model_dir", type=str, default=None,
+                        help="Where to write the stand-in models with --tiny (default: a temp directory)")
+    parser.add_argument("--output", type=str, default=None,
+                        help="Optional path for JSON results")
+
+    main(parser.parse_args())
@@ -0,0 +1,145 @@
+"""
+Benchmark topic suggestion against catalog size.
+
+Builds synthetic catalogs of the given sizes (the curated topics, repeated
+with varied wording and extra words until the size is reached), and for each
+one reports:
+
+    build      first start: embedding the catalog and saving the matrix
+    load       later starts: memory-mapping the saved matrix
+    loop       scoring topics one at a time in Python (the per-topic approach
+               the vectorized query replaces; only up to --loop_max topics)
+    query      TopicEngine.suggest for a conversation: one matrix-vector
+               product, sentiment boost and diversity re-ranking
+    cached     the same request again for the same user
+
+Run from the backend directory:
+
+    python benchmarks/bench_topics.py --sizes 1000 10000 100000 --output topics.json
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+from topics import DEFAULT_CATALOG_PATH, MOODS, TopicEngine
+
+CONVERSATIONS = [
+    ["Good morning! I slept quite well last night."],
+    ["I've been feeling a bit lonely lately.", "My daughter hasn't called this week."],
+    ["My granddaughter is visiting this weekend."],
+    ["Do you know any good soup recipes for the winter?"],
+    ["I went for a walk in the park and saw some lovely birds.", "There were robins and a woodpecker."],
+    ["My knee has been hurting when it rains."],
+    ["I used to play the piano when I was younger.", "We had a lovely old upright at home."],
+    ["What should I cook for dinner tonight?"],
+]
+
+def make_catalog(path, size, seed):
+    """
+    Write a catalog of size topics built from the curated one.
+    """
+    rng = random.Random(seed)
+    with open(DEFAULT_CATALOG_PATH, "r", encoding="utf-8") as f:
+        categories = json.load(f)["categories"]
+
+    words = sorted({word.strip("?.,!'").lower() for entry in categories.values()
+                    for text in entry["topics"] + entry["keywords"] for word in text.split()})
+    names = list(categories)
+    synthetic = {name: {"moods": categories[name]["moods"], "keywords": categories[name]["keywords"], "topics": []}
+                 for name in names}
+
+    for index in range(size):
+        name = names[index % len(names)]
+        text = rng.choice(categories[name]["topics"]).rstrip("?")
+        extra = " ".join(rng.choices(words, k=rng.randint(1, 4)))
+        synthetic[name]["topics"].append(f"{text} {extra} ({index})?")
+
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"version": 1, "categories": synthetic}, f)
+
+def loop_scores(engine, query):
+    return [float(sum(a * b for a, b in zip(row, query))) for row in engine.matrix.tolist()]
+
+def time_calls(call, repeats):
+    timings = []
+    for i in range(repeats):
+        start = time.perf_counter()
+        call(i)
+        timings.append(time.perf_counter() - start)
+    return timings
+
+def main(args):
+    rng = random.Random(args.seed)
+    work_dir = args.work_dir or tempfile.mkdtemp(prefix="chatbot-topics-bench-")
+
+    results = []
+    for size in args.sizes:
+        catalog_path = os.path.join(work_dir, f"catalog-{size}.json")
+        index_dir = os.path.join(work_dir, f"index-{size}")
+        make_catalog(catalog_path, size, args.seed)
+
+        start = time.perf_counter()
+        engine = TopicEngine(catalog_path, index_dir=index_dir, dim=args.dim)
+        build_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        engine = TopicEngine(catalog_path, index_dir=index_dir, dim=args.dim)
+        load_ms = (time.perf_counter() - start) * 1000
+
+        requests = [(rng.choice(CONVERSATIONS), rng.choice(MOODS)) for _ in range(args.repeats)]
+        engine.suggest(*requests[0])
+
+        query = time_calls(lambda i: engine.suggest(requests[i][0], requests[i][1]), args.repeats)
+        engine.suggest(requests[0][0], requests[0][1], user_key="bench-user")
+        cached = time_calls(lambda i: engine.suggest(requests[0][0], requests[0][1], user_key="bench-user"),
+                            args.repeats)
+
+        result = {
+            "topics": size,
+            "build_seconds": build_seconds,
+            "load_ms": load_ms,
+            "index_mb": os.path.getsize(engine.index_path) / 1e6,
+            "query_ms_p50": float(np.percentile(query, 50) * 1000),
+            "query_ms_p95": float(np.percentile(query, 95) * 1000),
+            "cached_us_p50": float(np.percentile(cached, 50) * 1e6),
+            "loop_ms": None,
+        }
+        if size <= args.loop_max:
+            vector = engine.embed(requests[0][0]).tolist()
+            result["loop_ms"] = float(np.median(time_calls(lambda i: loop_scores(engine, vector), 3)) * 1000)
+
+        results.append(result)
+        loop = f"{result['loop_ms']:9.1f}ms" if result["loop_ms"] is not None else "        -  "
+        print(f"{size:7d} topics | build {build_seconds:6.2f}s | load {load_ms:6.1f}ms | "
+              f"{result['index_mb']:6.1f}MB | loop {loop} | query p50 {result['query_ms_p50']:6.2f}ms "
+              f"p95 {result['query_ms_p95']:6.2f}ms | cached {result['cached_us_p50']:5.1f}us")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"dim": args.dim, "results": results}, f, indent=2)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark topic suggestion")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000],
+                        help="Catalog sizes (topics) to benchmark")
+    parser.add_argument("--dim", type=int, default=512,
+                        help="Embedding dimensions")
+    parser.add_argument("--repeats", type=int, default=200,
+                        help="Requests per measurement")
+    parser.add_argument("--loop_max", type=int, default=10000,
+                        help="Largest catalog to also score one topic at a time")
+    parser.add_argument("--seed", type=int, default=0,
+                        help="Random seed for the synthetic catalogs")
+    parser.add_argument("--work_dir", type=str, default=None,
+                        help="Where to write catalogs and indexes (default: a temp directory)")
+    parser.add_argument("--output", type=str, default=None,
+                        help="Optional path for JSON results")
+
+    main(parser.parse_args())
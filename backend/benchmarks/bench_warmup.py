@@ -0,0 +1,150 @@
+"""
+Benchmark first-request against steady-state latency after startup.
+
+Each mode starts a fresh Python process that loads the chat and sentiment
+models, prepares them, then times the first few requests one by one and the
+median of the requests after them:
+
+    cold       no warmup: the first requests pay for lazy initialization
+    warmup     ConversationManager.warm_up / SentimentAnalyzer.warm_up first
+    compile    enable_compilation (bucketed sentiment graphs, compiled chat
+               decode step), then warm_up, which builds the graphs
+
+Requests reuse the same sampling seeds in every mode, so they generate the
+same number of tokens. Uses stand-ins of the production architectures unless
+--chat_model and --sentiment_model are given. Run from the backend directory:
+
+    python benchmarks/bench_warmup.py --modes cold warmup compile --output warmup.json
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import subprocess
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+MESSAGES = [
+    "Good morning! I slept quite well last night.",
+    "I've been feeling a bit lonely lately.",
+    "My granddaughter is visiting this weekend.",
+    "Do you know any good soup recipes for the winter?",
+    "I went for a walk in the park and saw some lovely birds.",
+    "My knee has been hurting when it rains.",
+    "I used to play the piano when I was younger.",
+    "What should I cook for dinner tonight?",
+]
+
+def run_mode(args):
+    """
+    Runs in the child process: load, prepare and time requests for one mode.
+    """
+    import torch
+    from transformers import AutoTokenizer
+    from conversation import ConversationManager
+    from inference_backends import load_causal_lm
+    from sentiment_analysis import SentimentAnalyzer
+
+    start = time.perf_counter()
+    sentiment_analyzer = SentimentAnalyzer(model_name=args.sentiment_model)
+    tokenizer = AutoTokenizer.from_pretrained(args.chat_model)
+    conversation_manager = ConversationManager(load_causal_lm(args.chat_model), tokenizer, torch.device("cpu"),
+                                               max_length=args.max_new_tokens)
+    load_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    if args.child == "compile":
+        sentiment_analyzer.enable_compilation()
+        conversation_manager.enable_compilation()
+    if args.child in ("warmup", "compile"):
+        sentiment_analyzer.warm_up()
+        conversation_manager.warm_up()
+    prepare_seconds = time.perf_counter() - start
+
+    sentiment_ms, chat_ms = [], []
+    history = []
+    for i in range(args.first + args.steady):
+        message = MESSAGES[i % len(MESSAGES)]
+
+        start = time.perf_counter()
+        sentiment_analyzer.analyze_many([message])
+        sentiment_ms.append((time.perf_counter() - start) * 1000)
+
+        torch.manual_seed(i)
+        start = time.perf_counter()
+        response = conversation_manager.generate_response(message, history)
+        chat_ms.append((time.perf_counter() - start) * 1000)
+        history = (history + [{"sender": "user", "text": message}, {"sender": "bot", "text": response}])[-6:]
+
+    return {
+        "mode": args.child,
+        "load_seconds": load_seconds,
+        "prepare_seconds": prepare_seconds,
+        "first_sentiment_ms": sentiment_ms[:args.first],
+        "first_chat_ms": chat_ms[:args.first],
+        "steady_sentiment_ms_p50": float(np.median(sentiment_ms[args.first:])),
+        "steady_chat_ms_p50": float(np.median(chat_ms[args.first:])),
+    }
+
+def main(args):
+    if not (args.chat_model and args.sentiment_model):
+        from benchmarks.tiny_models import build_tiny_chat_model, build_tiny_sentiment_model
+        model_dir = args.model_dir or tempfile.mkdtemp(prefix="chatbot-warmup-bench-")
+        args.chat_model = args.chat_model or build_tiny_chat_model(
+            os.path.join(model_dir, "chat"), n_layer=args.n_layer, n_embd=args.n_embd, n_head=args.n_embd // 64)
+        args.sentiment_model = args.sentiment_model or build_tiny_sentiment_model(
+            os.path.join(model_dir, "sentiment"), n_layers=args.n_layer, dim=args.n_embd, n_heads=args.n_embd // 64)
+
+    results = []
+    for mode in args.modes:
+        command = [sys.executable, os.path.abspath(__file__), "--child", mode,
+                   "--chat_model", args.chat_model, "--sentiment_model", args.sentiment_model,
+                   "--first", str(args.first), "--steady", str(args.steady),
+                   "--max_new_tokens", str(args.max_new_tokens)]
+        output = subprocess.run(command, check=True, capture_output=True, text=True).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        results.append(result)
+
+        print(f"{mode:8s} | load {result['load_seconds']:5.1f}s | prepare {result['prepare_seconds']:6.1f}s | "
+              f"first sentiment {result['first_sentiment_ms'][0]:7.1f}ms chat {result['first_chat_ms'][0]:7.1f}ms | "
+              f"steady sentiment {result['steady_sentiment_ms_p50']:6.1f}ms chat {result['steady_chat_ms_p50']:7.1f}ms")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"chat_model": args.chat_model, "sentiment_model": args.sentiment_model,
+                       "results": results}, f, indent=2)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark first-request vs steady-state latency")
+    parser.add_argument("--modes", type=str, nargs="+", default=["cold", "warmup", "compile"],
+                        choices=["cold", "warmup", "compile"], help="Startup modes to compare")
+    parser.add_argument("--first", type=int, default=3,
+                        help="Requests reported individually after startup")
+    parser.add_argument("--steady", type=int, default=20,
+                        help="Requests after those whose median is the steady state")
+    parser.add_argument("--max_new_tokens", type=int, default=32,
+                        help="Tokens generated per chat response")
+    parser.add_argument("--chat_model", type=str, default=None,
+                        help="Chat model name or directory (default: a stand-in)")
+    parser.add_argument("--sentiment_model", type=str, default=None,
+                        help="Sentiment model name or directory (default: a stand-in)")
+    parser.add_argument("--n_layer", type=int, default=6,
+                        help="Layers of the stand-in models")
+    parser.add_argument("--n_embd", type=int, default=512,
+                        help="Hidden size of the stand-in models")
+    parser.add_argument("--model_dir", type=str, default=None,
+                        help="Where to save the stand-in models (default: a temp directory)")
+    parser.add_argument("--output", type=str, default=None,
+                        help="Optional path for JSON results")
+    parser.add_argument("--child", type=str, default=None,
+                        help=argparse.SUPPRESS)
+
+    args = parser.parse_args()
+    if args.child:
+        print(json.dumps(run_mode(args)))
+    else:
+        main(args)
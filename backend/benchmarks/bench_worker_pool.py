@@ -0,0 +1,139 @@
+"""
+Benchmark memory and throughput of the model worker pool as it scales.
+
+Loads stand-in models of the production architectures once, then for each
+worker count starts a WorkerPool, drives concurrent chat and sentiment jobs
+through it, and measures throughput together with the RSS and PSS (RSS with
+shared pages divided among the processes sharing them) of the front process
+plus its workers. The "separate processes" column is what the same number of
+independently loaded processes would use. Run from the backend directory:
+
+    python benchmarks/bench_worker_pool.py --workers 1 2 4 --output pool.json
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from transformers import AutoTokenizer
+from benchmarks.tiny_models import build_tiny_chat_model, build_tiny_sentiment_model
+from conversation import ConversationManager
+from inference_backends import load_causal_lm
+from sentiment_analysis import SentimentAnalyzer
+from worker_pool import WorkerPool
+
+MESSAGES = [
+    "Good morning! I slept quite well last night.",
+    "I've been feeling a bit lonely lately.",
+    "My granddaughter is visiting this weekend.",
+    "Do you know any good soup recipes for the winter?",
+]
+
+def memory_mb(pid):
+    """
+    RSS and PSS of a process in MB, from /proc/<pid>/smaps_rollup (Linux).
+    """
+    values = {}
+    with open(f"/proc/{pid}/smaps_rollup", "r") as f:
+        for line in f:
+            parts = line.split()
+            if parts[0] in ("Rss:", "Pss:"):
+                values[parts[0][:-1].lower()] = int(parts[1]) / 1024
+    return values
+
+def run_clients(pool, clients, requests_per_client):
+    errors = []
+
+    def client(client_id):
+        for i in range(requests_per_client):
+            message = MESSAGES[(client_id + i) % len(MESSAGES)]
+            try:
+                pool.generate_response(message, [], f"conversation-{client_id}")
+                pool.analyze_many([message])
+            except Exception as e:
+                errors.append(str(e))
+
+    threads = [threading.Thread(target=client, args=(c,)) for c in range(clients)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return time.perf_counter() - start, errors
+
+def main(args):
+    model_dir = args.model_dir or tempfile.mkdtemp(prefix="chatbot-pool-bench-")
+    chat_dir = build_tiny_chat_model(os.path.join(model_dir, "chat"), n_layer=args.n_layer, n_embd=args.n_embd,
+                                     n_head=max(1, args.n_embd // 64))
+    sentiment_dir = build_tiny_sentiment_model(os.path.join(model_dir, "sentiment"))
+
+    tokenizer = AutoTokenizer.from_pretrained(chat_dir)
+    conversation_manager = ConversationManager(load_causal_lm(chat_dir), tokenizer, "cpu",
+                                               max_length=args.max_new_tokens)
+    conversation_manager.enable_kv_cache()
+    sentiment_analyzer = SentimentAnalyzer(model_name=sentiment_dir)
+
+    single_process = memory_mb(os.getpid())
+    print(f"Single process with models loaded: RSS {single_process['rss']:.0f}MB")
+
+    results = []
+    for num_workers in args.workers:
+        pool = WorkerPool(conversation_manager, sentiment_analyzer, num_workers=num_workers,
+                          threads_per_worker=args.threads_per_worker).start()
+
+        # Warm up every worker before measuring
+        run_clients(pool, num_workers, 1)
+        duration, errors = run_clients(pool, args.clients, args.requests)
+
+        stats = pool.get_stats()
+        processes = [os.getpid()] + [worker["pid"] for worker in stats["workers"]]
+        memory = [memory_mb(pid) for pid in processes]
+        pool.shutdown()
+
+        jobs = args.clients * args.requests
+        result = {
+            "workers": num_workers,
+            "cores_per_worker": pool.cores_per_worker,
+            "chat_per_second": jobs / duration,
+            "total_rss_mb": sum(m["rss"] for m in memory),
+            "total_pss_mb": sum(m["pss"] for m in memory),
+            "separate_processes_rss_mb": single_process["rss"] * num_workers,
+            "jobs_per_worker": [worker["completed"] for worker in stats["workers"]],
+            "errors": len(errors),
+        }
+        results.append(result)
+        print(f"{num_workers:>2} workers | {result['chat_per_second']:6.2f} chat/s | "
+              f"RSS {result['total_rss_mb']:7.0f}MB | PSS {result['total_pss_mb']:7.0f}MB | "
+              f"separate processes {result['separate_processes_rss_mb']:7.0f}MB | errors {len(errors)}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"single_process_rss_mb": single_process["rss"], "results": results}, f, indent=2)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the model worker pool")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4],
+                        help="Worker counts to benchmark")
+    parser.add_argument("--clients", type=int, default=8,
+                        help="Concurrent client threads, each with its own conversation")
+    parser.add_argument("--requests", type=int, default=4,
+                        help="Chat + sentiment requests per client")
+    parser.add_argument("--threads_per_worker", type=int, default=4,
+                        help="Job threads inside each worker process")
+    parser.add_argument("--max_new_tokens", type=int, default=32,
+                        help="Tokens generated per chat response")
+    parser.add_argument("--n_layer", type=int, default=6,
+                        help="Layers in the stand-in chat model")
+    parser.add_argument("--n_embd", type=int, default=512,
+                        help="Hidden size of the stand-in chat model")
+    parser.add_argument("--model_dir", type=str, default=None,
+                        help="Where to write the stand-in models (default: a temp directory)")
+    parser.add_argument("--output", type=str, default=None,
+                        help="Optional path for JSON results")
+
+    main(parser.parse_args())
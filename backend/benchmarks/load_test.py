@@ -0,0 +1,254 @@
+"""
+Offline load test for the backend API.
+
+Builds tiny randomly initialized DialoGPT/DistilBERT-architecture models,
+starts the Flask app in-process against them, and replays multi-turn
+conversations from concurrent sessions against /api/chat, /api/sentiment
+and /api/topics. Reports throughput, latency percentiles and peak RSS as JSON
+so runs can be compared.
+
+Run from the backend directory:
+
+    python benchmarks/load_test.py --sessions 8 --turns 6 --output results.json
+    python benchmarks/load_test.py --sessions 8 --baseline results.json
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import resource
+import tempfile
+import threading
+from collections import defaultdict
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.tiny_models import build_tiny_chat_model, build_tiny_sentiment_model
+
+# Multi-turn conversations replayed by the simulated sessions
+CONVERSATIONS = [
+    [
+        "Good morning! I slept quite well last night.",
+        "I'm going to the market later to buy some fresh bread.",
+        "My knees are a bit stiff today, but the walk will do me good.",
+        "Do you know any good soup recipes for the winter?",
+        "My granddaughter loves my vegetable soup.",
+        "Thank you, I'll try that this weekend.",
+        "What should I do this afternoon?",
+        "That's a good idea, I haven't read in a while.",
+    ],
+    [
+        "I've been feeling a bit lonely lately.",
+        "My children live far away and don't call very often.",
+        "We used to have big family dinners every Sunday.",
+        "I miss the noise of the house when they were little.",
+        "Maybe I should join the club at the community centre.",
+        "They have a choir on Thursdays, I used to love singing.",
+        "I sang in the church choir for twenty years.",
+        "You're right, I'll give them a call tomorrow.",
+    ],
+    [
+        "Do you like music?",
+        "I grew up listening to Frank Sinatra and Ella Fitzgerald.",
+        "My husband and I danced to 'The Way You Look Tonight' at our wedding.",
+        "He passed away three years ago.",
+        "Some days are harder than others.",
+        "Talking about him helps, thank you for listening.",
+        "Tell me something cheerful.",
+        "That made me smile.",
+    ],
+]
+
+def percentile_summary(samples_ms, duration_s):
+    samples = np.array(samples_ms) if samples_ms else np.zeros(1)
+    return {
+        "count": len(samples_ms),
+        "throughput_rps": len(samples_ms) / duration_s if duration_s else 0.0,
+        "mean_ms": float(samples.mean()),
+        "p50_ms": float(np.percentile(samples, 50)),
+        "p95_ms": float(np.percentile(samples, 95)),
+        "p99_ms": float(np.percentile(samples, 99)),
+        "max_ms": float(samples.max()),
+    }
+
+def peak_rss_mb():
+    # ru_maxrss is reported in kilobytes on Linux and bytes on macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / (1024 * 1024) if platform.system() == "Darwin" else rss / 1024
+
+def run_session(client, session_id, conversation, turns, endpoints, latencies, errors, lock):
+    """
+    Replay one conversation turn by turn, growing the history like the frontend does.
+    """
+    history = []
+    conversation_id = f"load-test-{session_id}"
+
+    for turn in range(turns):
+        message = conversation[turn % len(conversation)]
+        requests = []
+        if "sentiment" in endpoints:
+            requests.append(("/api/sentiment", lambda: client.post("/api/sentiment", json={"message": message})))
+        if "chat" in endpoints:
+            requests.append(("/api/chat", lambda: client.post("/api/chat", json={
+                "message": message,
+                "conversation_history": history,
+                "conversation_id": conversation_id,
+            })))
+        if "pipeline" in endpoints:
+            requests.append(("/api/chat/pipeline", lambda: client.post("/api/chat/pipeline", json={
+                "message": message,
+                "conversation_history": history,
+                "conversation_id": conversation_id,
+            })))
+        if "topics" in endpoints and turn == 0:
+            requests.append(("/api/topics", lambda: client.get("/api/topics")))
+
+        reply = None
+        for endpoint, send in requests:
+            start = time.perf_counter()
+            response = send()
+            elapsed = (time.perf_counter() - start) * 1000
+
+            with lock:
+                if response.status_code == 200:
+                    latencies[endpoint].append(elapsed)
+                else:
+                    errors[endpoint] += 1
+
+            if endpoint in ("/api/chat", "/api/chat/pipeline") and response.status_code == 200:
+                reply = response.get_json().get("response", "")
+
+        history.append({"sender": "user", "text": message})
+        if reply is not None:
+            history.append({"sender": "bot", "text": reply})
+
+def compare_to_baseline(report, baseline_path, max_regression):
+    """
+    Print per-endpoint changes against a previous report.
+
+    Returns:
+        bool: True if no endpoint regressed by more than max_regression
+    """
+    with open(baseline_path, "r", encoding="utf-8") as f:
+        baseline = json.load(f)
+
+    ok = True
+    for endpoint, current in report["endpoints"].items():
+        previous = baseline.get("endpoints", {}).get(endpoint)
+        if not previous:
+            continue
+        for key in ("p50_ms", "p95_ms", "p99_ms"):
+            change = (current[key] - previous[key]) / previous[key] if previous[key] else 0.0
+            flag = "REGRESSION" if change > max_regression else ""
+            ok = ok and not flag
+            print(f"{endpoint:<16} {key:<7} {previous[key]:9.1f} -> {current[key]:9.1f} ms ({change:+.1%}) {flag}")
+    return ok
+
+def main(args):
+    random.seed(args.seed)
+    model_dir = args.model_dir or tempfile.mkdtemp(prefix="chatbot-load-test-")
+
+    # Point the app at tiny local models and load them before serving
+    chat_dir = build_tiny_chat_model(os.path.join(model_dir, "chat"), n_layer=args.n_layer, n_embd=args.n_embd,
+                                     seed=args.seed)
+    sentiment_dir = build_tiny_sentiment_model(os.path.join(model_dir, "sentiment"), seed=args.seed)
+    os.environ["CHAT_MODEL_NAME"] = chat_dir
+    os.environ["SENTIMENT_MODEL_NAME"] = sentiment_dir
+    os.environ["MODEL_PRELOAD"] = "1"
+
+    import torch
+    torch.manual_seed(args.seed)
+    if args.torch_threads:
+        torch.set_num_threads(args.torch_threads)
+
+    import app as backend_app
+    rss_after_load = peak_rss_mb()
+
+    latencies = defaultdict(list)
+    errors = defaultdict(int)
+    lock = threading.Lock()
+
+    sessions = []
+    for session_id in range(args.sessions):
+        client = backend_app.app.test_client()
+        conversation = random.choice(CONVERSATIONS)
+        sessions.append(threading.Thread(
+            target=run_session,
+            args=(client, session_id, conversation, args.turns, args.endpoints, latencies, errors, lock),
+        ))
+
+    start = time.perf_counter()
+    for session in sessions:
+        session.start()
+    for session in sessions:
+        session.join()
+    duration = time.perf_counter() - start
+
+    total_requests = sum(len(samples) for samples in latencies.values())
+    report = {
+        "config": {
+            "sessions": args.sessions,
+            "turns": args.turns,
+            "endpoints": args.endpoints,
+            "n_layer": args.n_layer,
+            "n_embd": args.n_embd,
+            "seed": args.seed,
+            "torch_threads": torch.get_num_threads(),
+            "chat_batching": os.environ.get("CHAT_BATCHING", "1"),
+        },
+        "environment": {
+            "python": platform.python_version(),
+            "torch": torch.__version__,
+            "cpu_count": os.cpu_count(),
+            "platform": platform.platform(),
+        },
+        "duration_s": duration,
+        "total_requests": total_requests,
+        "throughput_rps": total_requests / duration if duration else 0.0,
+        "errors": dict(errors),
+        "rss_after_load_mb": rss_after_load,
+        "peak_rss_mb": peak_rss_mb(),
+        "endpoints": {endpoint: percentile_summary(samples, duration) for endpoint, samples in latencies.items()},
+    }
+
+    print(json.dumps(report, indent=2))
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+    if args.baseline and not compare_to_baseline(report, args.baseline, args.max_regression):
+        sys.exit(1)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offline load test for the chatbot backend")
+    parser.add_argument("--sessions", type=int, default=8,
+                        help="Number of concurrent conversation sessions")
+    parser.add_argument("--turns", type=int, default=6,
+                        help="Turns replayed per session")
+    parser.add_argument("--endpoints", nargs="+", choices=["chat", "sentiment", "topics", "pipeline"],
+                        default=["chat", "sentiment", "topics"],
+                        help="Endpoints to exercise (pipeline replaces the separate chat and sentiment calls)")
+    parser.add_argument("--n_layer", type=int, default=2,
+                        help="Layers in the stand-in chat model")
+    parser.add_argument("--n_embd", type=int, default=64,
+                        help="Hidden size of the stand-in chat model")
+    parser.add_argument("--torch_threads", type=int, default=0,
+                        help="torch intra-op threads (0 = torch default)")
+    parser.add_argument("--seed", type=int, default=0,
+                        help="Random seed for models and session scripts")
+    parser.add_argument("--model_dir", type=str, default=None,
+                        help="Where to write the stand-in models (default: a temp directory)")
+    parser.add_argument("--output", type=str, default=None,
+                        help="Path to write the JSON report")
+    parser.add_argument("--baseline", type=str, default=None,
+                        help="Previous JSON report to compare against")
+    parser.add_argument("--max_regression", type=float, default=0.10,
+                        help="Allowed relative latency increase before failing the comparison")
+
+    main(parser.parse_args())
@@ -0,0 +1,111 @@
+"""
+Tiny randomly initialized stand-ins for the production models, so benchmarks
+run offline without downloading DialoGPT or DistilBERT.
+
+The chat model is a GPT-2 (DialoGPT) architecture and the sentiment model a
+DistilBERT sequence classifier with two labels, each with a tokenizer trained
+on a small built-in corpus. Only the shapes are scaled down; the code paths
+exercised are the same as with the real models.
+"""
+import os
+import torch
+from tokenizers import Tokenizer, decoders, models, normalizers, pre_tokenizers, trainers
+from tokenizers.processors import TemplateProcessing
+from transformers import (
+    DistilBertConfig,
+    DistilBertForSequenceClassification,
+    GPT2Config,
+    GPT2LMHeadModel,
+    PreTrainedTokenizerFast,
+)
+
+CORPUS = [
+    "Good morning! How are you feeling today?",
+    "I slept well and had a lovely cup of tea with my neighbour.",
+    "My daughter is visiting this weekend with the grandchildren.",
+    "I've been feeling a bit lonely since the winter started.",
+    "The doctor changed my blood pressure medication again.",
+    "We planted tomatoes and beans in the garden this spring.",
+    "That sounds wonderful. What are you looking forward to most?",
+    "I'm sorry to hear that. Would you like to talk about it?",
+    "Do you remember the name of that song from the fifties?",
+    "My late husband and I used to dance every Saturday night.",
+    "User: Tell me about your favourite season.\nAssistant: I love autumn, the leaves are beautiful.",
+]
+
+def build_tiny_chat_model(output_dir, n_layer=2, n_embd=64, n_head=2, vocab_size=2000, seed=0):
+    """
+    Save a tiny GPT-2 architecture model and byte-level BPE tokenizer to output_dir.
+    """
+    bpe = Tokenizer(models.BPE())
+    bpe.pre_tokenizer = pre_tokenizers.ByteLevel(add_prefix_space=False)
+    bpe.decoder = decoders.ByteLevel()
+    bpe.train_from_iterator(CORPUS * 20, trainers.BpeTrainer(
+        vocab_size=vocab_size,
+        special_tokens=["<|endoftext|>"],
+        initial_alphabet=pre_tokenizers.ByteLevel.alphabet(),
+    ))
+    tokenizer = PreTrainedTokenizerFast(
+        tokenizer_object=bpe,
+        eos_token="<|endoftext|>",
+        bos_token="<|endoftext|>",
+        unk_token="<|endoftext|>",
+    )
+
+    torch.manual_seed(seed)
+    model = GPT2LMHeadModel(GPT2Config(
+        vocab_size=len(tokenizer),
+        n_positions=1024,
+        n_embd=n_embd,
+        n_layer=n_layer,
+        n_head=n_head,
+        bos_token_id=tokenizer.eos_token_id,
+        eos_token_id=tokenizer.eos_token_id,
+    ))
+
+    os.makedirs(output_dir, exist_ok=True)
+    tokenizer.save_pretrained(output_dir)
+    model.save_pretrained(output_dir)
+    return output_dir
+
+def build_tiny_sentiment_model(output_dir, n_layers=2, dim=64, n_heads=2, vocab_size=1000, seed=0):
+    """
+    Save a tiny two-label DistilBERT classifier and WordPiece tokenizer to output_dir.
+    """
+    wordpiece = Tokenizer(models.WordPiece(unk_token="[UNK]"))
+    wordpiece.normalizer = normalizers.BertNormalizer(lowercase=True)
+    wordpiece.pre_tokenizer = pre_tokenizers.BertPreTokenizer()
+    wordpiece.decoder = decoders.WordPiece()
+    wordpiece.train_from_iterator(CORPUS * 20, trainers.WordPieceTrainer(
+        vocab_size=vocab_size,
+        special_tokens=["[PAD]", "[UNK]", "[CLS]", "[SEP]", "[MASK]"],
+    ))
+    wordpiece.post_processor = TemplateProcessing(
+        single="[CLS] $A [SEP]",
+        special_tokens=[("[CLS]", wordpiece.token_to_id("[CLS]")), ("[SEP]", wordpiece.token_to_id("[SEP]"))],
+    )
+    tokenizer = PreTrainedTokenizerFast(
+        tokenizer_object=wordpiece,
+        pad_token="[PAD]",
+        unk_token="[UNK]",
+        cls_token="[CLS]",
+        sep_token="[SEP]",
+        mask_token="[MASK]",
+    )
+
+    torch.manual_seed(seed)
+    model = DistilBertForSequenceClassification(DistilBertConfig(
+        vocab_size=len(tokenizer),
+        dim=dim,
+        hidden_dim=dim * 4,
+        n_layers=n_layers,
+        n_heads=n_heads,
+        num_labels=2,
+        id2label={0: "NEGATIVE", 1: "POSITIVE"},
+        label2id={"NEGATIVE": 0, "POSITIVE": 1},
+    ))
+
+    os.makedirs(output_dir, exist_ok=True)
+    tokenizer.save_pretrained(output_dir)
+    model.save_pretrained(output_dir)
+    return output_dir
@@ -2,14 +2,44 @@ import torch
 import logging
 import re
 import random
+import threading
+import time
+from array import array
+from contextlib import contextmanager
+from transformers import StoppingCriteriaList, TextIteratorStreamer
+from adaptive_generation import AdaptiveGenerationController
+from batching import BatchScheduler
+from inference_backends import allow_compiled_graphs, compile_forward
+from kv_cache import KVCacheStore, common_prefix_length
+from response_cache import ResponseCache
+from safety import SafetyMatcher
+from sessions import Turn
+from speculative import SpeculativeDecoder
+from utils.cache import TurnTokenCache
+from utils.metrics import RESPONSE_SOURCES, GenerationTimer, stage, trace_span
+from streaming import CancellationStoppingCriteria, EventStoppingCriteria, StreamingResponseCleaner
 
 logger = logging.getLogger(__name__)
 
+# Representative conversation run through the model at startup (see warm_up)
+WARMUP_HISTORY = [
+    {"sender": "user", "text": "Good morning! I slept quite well last night."},
+    {"sender": "bot", "text": "That's lovely to hear. Do you have any plans for today?"},
+]
+WARMUP_MESSAGES = [
+    "I might go for a walk in the park if the weather stays nice.",
+    "My daughter said she would call this afternoon.",
+    "I've been feeling a bit tired lately.",
+]
+
+# New tokens generated per warmup call, enough to run the decode step
+WARMUP_NEW_TOKENS = 8
+
 class ConversationManager:
     """
     Manages conversation state and generates responses using a language model.
     """
-    def __init__(self, model, tokenizer, device, max_length=100):
+    def __init__(self, model, tokenizer, device, max_length=100, safety_matcher=None):
         self.model = model
         self.tokenizer = tokenizer
         self.device = device
@@ -20,14 +50,45 @@ class ConversationManager:
         
         # Conversation context window
         self.max_history_tokens = 512
+        self.max_history_turns = 10
         
-        # Safety patterns to detect inappropriate content
-        self.safety_patterns = [
-            r'(?i)sui[c]+ide',
-            r'(?i)kill\s+(?:my|your)self',
-            r'(?i)harm\s+(?:my|your)self',
-            r'(?i)want\s+to\s+die'
-        ]
+        # Token ids of formatted turns, shared by every conversation
+        self.turn_token_cache = TurnTokenCache(tokenizer)
+        
+        # Tokens that end every prompt; the model continues from here
+        self.assistant_prefix_ids = tokenizer.encode("Assistant:")
+        
+        # Sampling settings shared by every generation path
+        self.generation_kwargs = {
+            "no_repeat_ngram_size": 3,
+            "do_sample": True,
+            "top_p": 0.92,
+            "top_k": 50,
+            "temperature": 0.85,
+        }
+        
+        # Optional micro-batching of concurrent requests (see enable_batching)
+        self.batch_scheduler = None
+        
+        # Optional per-conversation attention cache reuse (see enable_kv_cache)
+        self.kv_cache_store = None
+        self.min_kv_reuse_tokens = 8
+        
+        # Optional draft-model speculative decoding (see enable_speculative_decoding)
+        self.speculative_decoder = None
+        
+        # Optional load-adaptive token budgets, deadlines and early stopping
+        # at the display cap (see enable_adaptive_generation)
+        self.generation_controller = None
+        
+        # Optional pools of cached replies for common short messages (see enable_response_cache)
+        self.response_cache = None
+        
+        # Whether the decode step runs a compiled graph (see enable_compilation)
+        self.compiled_decoding = False
+        
+        # Compiled crisis phrase list used to detect concerning content
+        self.safety_matcher = safety_matcher or SafetyMatcher()
         
         # Empathetic responses for potentially concerning content
         self.safety_responses = [
@@ -46,76 +107,692 @@ class ConversationManager:
             "I appreciate you talking with me about this. Would you like to continue on this topic?"
         ]
 
-    def generate_response(self, user_message, conversation_history=None):
+    def generate_response(self, user_message, conversation_history=None, conversation_id=None, cancel_event=None,
+                          session_turns=None, screened=False):
         """
         Generate a response to the user's message, with safety checks.
         
         Args:
             user_message (str): The message from the user
             conversation_history (list): Previous messages in the conversation
+            conversation_id (str): Optional ID used to reuse the previous turn's attention cache
+            cancel_event (threading.Event): Optional event; once set, generation stops early
+                and the (partial) response should be discarded
+            session_turns (list): Optional session turns (see encode_turn) ending with the
+                current message; used instead of conversation_history
+            screened (bool): The caller already passed the message through screen_message
+                (e.g. ChatPipeline), so the safety check is skipped
             
         Returns:
             str: The model's response
         """
         try:
             # Check for safety concerns
-            if self._contains_concerning_content(user_message):
+            if not screened and self._contains_concerning_content(user_message):
+                RESPONSE_SOURCES.inc(source="safety")
                 return random.choice(self.safety_responses)
             
-            # Format conversation history for the model
-            input_text = self._format_conversation_history(user_message, conversation_history)
+            # Serve common messages from the response cache once its pool is full
+            cache_key, pool_key = self._response_cache_keys(user_message, conversation_history, session_turns)
+            if cache_key is not None:
+                response = self.response_cache.get(cache_key)
+                if response is not None:
+                    RESPONSE_SOURCES.inc(source="cache")
+                    return response
+            
+            # Format and encode the conversation for the model
+            input_ids = self._encode_input(user_message, conversation_history, session_turns)
+            
+            # Generate response with the draft model, reusing this conversation's
+            # attention cache or batching with concurrent requests when enabled
+            with self._generation_plan() as plan:
+                if self.speculative_decoder is not None:
+                    response = self._generate_speculative(input_ids, conversation_id, cancel_event, plan)
+                elif conversation_id and self.kv_cache_store is not None:
+                    response = self._generate_with_kv_cache(conversation_id, input_ids, cancel_event, plan)
+                elif self.batch_scheduler is not None:
+                    response = self.batch_scheduler.submit(input_ids, cancel_event, plan)
+                else:
+                    response = self._generate_batch([input_ids], [cancel_event], [plan])[0]
+            
+            if not response:
+                RESPONSE_SOURCES.inc(source="fallback")
+                return random.choice(self.fallback_responses)
+            
+            # A cancelled request's reply is partial, so keep it out of the pool
+            if pool_key is not None and not (cancel_event is not None and cancel_event.is_set()):
+                self.response_cache.add(pool_key, response)
+            RESPONSE_SOURCES.inc(source="model")
+            return response
+            
+        except Exception as e:
+            logger.error("Error generating response: %s", e)
+            RESPONSE_SOURCES.inc(source="fallback")
+            return random.choice(self.fallback_responses)
+    
+    def stream_response(self, user_message, conversation_history=None, conversation_id=None, session_turns=None,
+                        screened=False):
+        """
+        Generate a response incrementally, yielding text as tokens are sampled.
+        
+        Whitespace cleanup and the display length cap are applied as the text
+        streams; generation stops as soon as the cap is reached. Closing the
+        generator (e.g. when the client disconnects) also stops generation.
+        
+        Args:
+            user_message (str): The message from the user
+            conversation_history (list): Previous messages in the conversation
+            conversation_id (str): Optional ID used to reuse the previous turn's attention cache
+            session_turns (list): Optional session turns (see encode_turn) ending with the
+                current message; used instead of conversation_history
+            screened (bool): The caller already passed the message through screen_message,
+                so the safety check is skipped
+            
+        Yields:
+            dict: {"type": "token", "text": ...} for each new piece of text,
+                  then {"type": "done", "response": ...} with the final cleaned response
+        """
+        # Check for safety concerns
+        if not screened and self._contains_concerning_content(user_message):
+            RESPONSE_SOURCES.inc(source="safety")
+            response = random.choice(self.safety_responses)
+            yield {"type": "token", "text": response}
+            yield {"type": "done", "response": response}
+            return
+        
+        cache_key, pool_key = self._response_cache_keys(user_message, conversation_history, session_turns)
+        if cache_key is not None:
+            response = self.response_cache.get(cache_key)
+            if response is not None:
+                RESPONSE_SOURCES.inc(source="cache")
+                yield {"type": "token", "text": response}
+                yield {"type": "done", "response": response}
+                return
+        
+        cleaner = StreamingResponseCleaner(max_chars=200)
+        stop_event = threading.Event()
+        generation_thread = None
+        adaptive = None
+        
+        with self._generation_plan() as plan:
+            try:
+                input_ids = self._encode_input(user_message, conversation_history, session_turns)
+                # The cleaner below applies the display cap as text streams
+                adaptive = self._adaptive_criteria(input_ids.shape[1], [plan], max_chars=0)
+                
+                streamer = TextIteratorStreamer(self.tokenizer, skip_prompt=True, skip_special_tokens=True)
+                generation_thread = threading.Thread(
+                    target=self._generate_streaming,
+                    args=(input_ids, streamer, stop_event, conversation_id, adaptive),
+                    daemon=True
+                )
+                generation_thread.start()
+                
+                for chunk in streamer:
+                    delta = cleaner.feed(chunk)
+                    if delta:
+                        yield {"type": "token", "text": delta}
+                    if cleaner.capped:
+                        # Nothing more can be shown, so stop spending decode steps
+                        stop_event.set()
+                        break
+                
+                if cleaner.capped:
+                    response = cleaner.capped_response()
+                else:
+                    response = self._clean_response(cleaner.raw_text)
+            except Exception as e:
+                logger.error("Error streaming response: %s", e)
+                response = ""
+            finally:
+                stop_event.set()
+                if generation_thread is not None:
+                    generation_thread.join()
+        
+        if adaptive is not None and adaptive.sequences is not None:
+            stop_reason = "length_cap" if cleaner.capped else adaptive.stop_reason()
+            self.generation_controller.record(stop_reason, adaptive.sequences[0][adaptive.prompt_length:], response)
+        
+        if not response:
+            RESPONSE_SOURCES.inc(source="fallback")
+            response = random.choice(self.fallback_responses)
+        else:
+            # Closing the generator early (client disconnect) never gets here,
+            # so partial replies are not pooled
+            if pool_key is not None:
+                self.response_cache.add(pool_key, response)
+            RESPONSE_SOURCES.inc(source="model")
+        
+        yield {"type": "done", "response": response}
+    
+    def _generate_streaming(self, input_ids, streamer, stop_event, conversation_id=None, adaptive=None):
+        """
+        Run generate in a background thread, pushing decoded text to the streamer.
+        """
+        try:
+            use_kv_cache = bool(conversation_id) and self.kv_cache_store is not None
+            past_key_values = self._reusable_kv_cache(conversation_id, input_ids) if use_kv_cache else None
+            max_new_tokens = self._max_new_tokens(adaptive)
+            
+            if self.speculative_decoder is not None:
+                with trace_span("speculative_generate"):
+                    output = self.speculative_decoder.generate(
+                        input_ids,
+                        max_new_tokens=max_new_tokens,
+                        eos_token_id=self.eos_token_id,
+                        past_key_values=past_key_values,
+                        streamer=streamer,
+                        stop_event=stop_event,
+                        stopping_criteria=adaptive,
+                    )
+                if use_kv_cache:
+                    self._store_kv_cache(conversation_id, output)
+                return
             
-            # Encode the input text
-            input_ids = self.tokenizer.encode(input_text, return_tensors='pt').to(self.device)
+            timer = GenerationTimer()
+            stopping_criteria = StoppingCriteriaList([EventStoppingCriteria(stop_event), timer])
+            if adaptive is not None:
+                stopping_criteria.append(adaptive)
+            with torch.no_grad(), trace_span("generate"):
+                output = self.model.generate(
+                    input_ids,
+                    attention_mask=torch.ones_like(input_ids),
+                    past_key_values=past_key_values,
+                    max_new_tokens=max_new_tokens,
+                    pad_token_id=self.tokenizer.eos_token_id,
+                    streamer=streamer,
+                    stopping_criteria=stopping_criteria,
+                    return_dict_in_generate=use_kv_cache,
+                    **self.generation_kwargs,
+                )
+            timer.record()
             
-            # Truncate if too long
-            if input_ids.shape[1] > self.max_history_tokens:
-                input_ids = input_ids[:, -self.max_history_tokens:]
+            if use_kv_cache:
+                self._store_kv_cache(conversation_id, output)
+        except Exception as e:
+            logger.error("Error in streaming generation: %s", e)
+            # Unblock the consumer waiting on the streamer
+            streamer.end()
+    
+    def enable_kv_cache(self, max_bytes=512 * 1024 * 1024):
+        """
+        Keep each conversation's attention keys/values between turns so a new
+        turn only has to prefill the tokens that changed.
+        
+        Args:
+            max_bytes (int): Memory budget for all cached conversations
             
-            # Generate response
+        Returns:
+            KVCacheStore: The store now used for requests with a conversation ID
+        """
+        self.kv_cache_store = KVCacheStore(max_bytes=max_bytes)
+        return self.kv_cache_store
+    
+    def _generate_with_kv_cache(self, conversation_id, input_ids, cancel_event=None, plan=None):
+        """
+        Generate a single response, reusing the conversation's cached prefix
+        when it still matches the new prompt.
+        """
+        past_key_values = self._reusable_kv_cache(conversation_id, input_ids)
+        
+        timer = GenerationTimer()
+        stopping_criteria = StoppingCriteriaList([timer])
+        if cancel_event is not None:
+            stopping_criteria.append(EventStoppingCriteria(cancel_event))
+        adaptive = self._adaptive_criteria(input_ids.shape[1], [plan])
+        if adaptive is not None:
+            stopping_criteria.append(adaptive)
+        with torch.no_grad(), trace_span("generate"):
             output = self.model.generate(
                 input_ids,
-                max_length=input_ids.shape[1] + self.max_length,
+                attention_mask=torch.ones_like(input_ids),
+                past_key_values=past_key_values,
+                max_new_tokens=self._max_new_tokens(adaptive),
                 pad_token_id=self.tokenizer.eos_token_id,
-                no_repeat_ngram_size=3,
-                do_sample=True,
-                top_p=0.92,
-                top_k=50,
-                temperature=0.85,
-                num_return_sequences=1,
+                return_dict_in_generate=True,
+                stopping_criteria=stopping_criteria,
+                **self.generation_kwargs,
             )
+        timer.record()
+        
+        self._store_kv_cache(conversation_id, output)
+        
+        return self._finish_response(output.sequences[0][input_ids.shape[1]:], adaptive, 0, cancel_event)
+    
+    def enable_speculative_decoding(self, draft_model, num_draft_tokens=4):
+        """
+        Generate with a smaller draft model proposing tokens that this model
+        verifies several at a time. Responses follow the same sampling
+        settings; only single requests are decoded this way, so micro-batching
+        is bypassed while it is enabled.
+        
+        Args:
+            draft_model: Causal LM sharing this model's tokenizer (e.g. DialoGPT-small)
+            num_draft_tokens (int): Tokens proposed per verification step
             
-            # Decode the response
-            response = self.tokenizer.decode(output[0][input_ids.shape[1]:], skip_special_tokens=True)
+        Returns:
+            SpeculativeDecoder: The decoder now used for generation
+        """
+        self.speculative_decoder = SpeculativeDecoder(
+            self.model, draft_model, self.generation_kwargs, num_draft_tokens=num_draft_tokens)
+        return self.speculative_decoder
+    
+    def _generate_speculative(self, input_ids, conversation_id=None, cancel_event=None, plan=None):
+        """
+        Generate a single response with the speculative decoder, reusing the
+        conversation's attention cache when enabled.
+        """
+        use_kv_cache = bool(conversation_id) and self.kv_cache_store is not None
+        past_key_values = self._reusable_kv_cache(conversation_id, input_ids) if use_kv_cache else None
+        adaptive = self._adaptive_criteria(input_ids.shape[1], [plan])
+        
+        with trace_span("speculative_generate"):
+            output = self.speculative_decoder.generate(
+                input_ids,
+                max_new_tokens=self._max_new_tokens(adaptive),
+                eos_token_id=self.eos_token_id,
+                past_key_values=past_key_values,
+                stop_event=cancel_event,
+                stopping_criteria=adaptive,
+            )
+        
+        if use_kv_cache:
+            self._store_kv_cache(conversation_id, output)
+        
+        return self._finish_response(output.sequences[0][input_ids.shape[1]:], adaptive, 0, cancel_event)
+    
+    def _reusable_kv_cache(self, conversation_id, input_ids):
+        """
+        Take the conversation's cached keys/values and trim them to the part
+        that is still a prefix of the new prompt.
+        
+        Returns None (full recompute) when nothing is cached or the history has
+        diverged, e.g. because the history window slid or was truncated.
+        """
+        entry = self.kv_cache_store.take(conversation_id)
+        if entry is None:
+            return None
+        
+        # Always leave at least one new token for the model to prefill
+        prefix_length = common_prefix_length(entry.token_ids, input_ids[0].tolist())
+        prefix_length = min(prefix_length, input_ids.shape[1] - 1)
+        
+        if prefix_length < self.min_kv_reuse_tokens or not hasattr(entry.past_key_values, "crop"):
+            logger.debug("KV cache for conversation %s diverged, recomputing", conversation_id)
+            self.kv_cache_store.record_miss()
+            return None
+        
+        excess = entry.past_key_values.get_seq_length() - prefix_length
+        if excess > 0:
+            entry.past_key_values.crop(-excess)
+        self.kv_cache_store.record_hit(prefix_length)
+        return entry.past_key_values
+    
+    def _store_kv_cache(self, conversation_id, output):
+        """
+        Save the keys/values computed during generation for the next turn.
+        """
+        past_key_values = getattr(output, "past_key_values", None)
+        if past_key_values is None or not hasattr(past_key_values, "get_seq_length"):
+            return
+        
+        cached_length = past_key_values.get_seq_length()
+        self.kv_cache_store.put(conversation_id, output.sequences[0][:cached_length].tolist(), past_key_values)
+    
+    def enable_adaptive_generation(self, min_new_tokens=32, full_budget_load=4, deadline_ms=0, max_chars=200):
+        """
+        Stop generating once a response can no longer grow on screen, give up
+        at a per-request deadline, and shrink the token budget under load.
+        
+        Args:
+            min_new_tokens (int): Smallest token budget under heavy load
+            full_budget_load (int): Concurrent generations that still each get max_length tokens
+            deadline_ms (float): Generation time limit per request, counted from when it
+                reached the model (0 disables)
+            max_chars (int): Display cap responses are cut to (see _clean_response)
             
-            # Clean up the response
-            response = self._clean_response(response)
+        Returns:
+            AdaptiveGenerationController: The controller now planning every generation
+        """
+        self.generation_controller = AdaptiveGenerationController(
+            self.tokenizer,
+            max_new_tokens=self.max_length,
+            min_new_tokens=min_new_tokens,
+            full_budget_load=full_budget_load,
+            deadline_ms=deadline_ms,
+            max_chars=max_chars,
+        )
+        return self.generation_controller
+    
+    @contextmanager
+    def _generation_plan(self):
+        """
+        Yield the GenerationPlan for a request about to generate, counting it
+        towards the load while the block runs; yields None when adaptive
+        generation is disabled.
+        """
+        if self.generation_controller is None:
+            yield None
+            return
+        with self.generation_controller.track() as plan:
+            yield plan
+    
+    def _adaptive_criteria(self, prompt_length, plans, max_chars=None):
+        """
+        Stopping criterion enforcing the plans of a generate call's rows, or
+        None when adaptive generation is disabled.
+        """
+        if self.generation_controller is None or any(plan is None for plan in plans):
+            return None
+        return self.generation_controller.stopping_criteria(
+            prompt_length, plans, eos_token_id=self.eos_token_id, max_chars=max_chars)
+    
+    def _max_new_tokens(self, adaptive=None):
+        if adaptive is None:
+            return self.max_length
+        return max(plan.max_new_tokens for plan in adaptive.plans)
+    
+    def enable_response_cache(self, max_entries=1024, ttl_seconds=3600, pool_size=4, context_turns=1,
+                              max_message_words=8):
+        """
+        Serve short, frequently repeated messages (greetings, "how are you")
+        from pools of previously sampled replies instead of calling generate.
+        
+        Args:
+            max_entries (int): Maximum number of cached contexts
+            ttl_seconds (float): Lifetime of each cached reply; 0 keeps replies until evicted
+            pool_size (int): Distinct replies collected per context before it is served
+                from the cache
+            context_turns (int): Previous turns included in the context fingerprint
+            max_message_words (int): Longer messages are never cached
             
-            return response if response else random.choice(self.fallback_responses)
+        Returns:
+            ResponseCache: The cache now consulted by generate_response and stream_response
+        """
+        self.response_cache = ResponseCache(
+            max_entries=max_entries,
+            ttl_seconds=ttl_seconds,
+            pool_size=pool_size,
+            context_turns=context_turns,
+            max_message_words=max_message_words,
+        )
+        return self.response_cache
+    
+    def _response_cache_keys(self, user_message, conversation_history=None, session_turns=None):
+        """
+        Response cache keys for the message and the turns before it.
+        
+        Replies are looked up by the message and the last context_turns turns,
+        but only added to a pool when those turns are the whole conversation.
+        A reply generated from a longer history may draw on anything said
+        earlier (names, family, health), and the key does not cover that, so
+        pooling it could serve one user's private context to another.
+        
+        Returns:
+            tuple: (lookup_key, pool_key); either is None when the cache is
+                disabled or the message is not cacheable, and pool_key is also
+                None when the history is longer than the key's context
+        """
+        if self.response_cache is None:
+            return None, None
+        
+        if session_turns:
+            history = [(turn.sender, turn.text) for turn in session_turns[:-1]]
+        else:
+            history = [(message['sender'], message['text']) for message in conversation_history or []]
+        
+        turns = self.response_cache.context_turns
+        context = [("user" if sender == 'user' else "bot", text) for sender, text in history[-turns:]] if turns else []
+        key = self.response_cache.make_key(user_message, context)
+        return key, key if len(history) <= turns else None
+    
+    def enable_batching(self, max_batch_size=8, batch_window_ms=5):
+        """
+        Route generation through a micro-batching scheduler so concurrent
+        requests share a single batched generate call.
+        
+        Args:
+            max_batch_size (int): Largest number of requests per batch
+            batch_window_ms (float): How long to wait for more requests after the first
             
+        Returns:
+            BatchScheduler: The scheduler now used by generate_response
+        """
+        if self.batch_scheduler is not None:
+            self.batch_scheduler.shutdown()
+        self.batch_scheduler = BatchScheduler(self, max_batch_size, batch_window_ms)
+        return self.batch_scheduler
+    
+    def enable_compilation(self):
+        """
+        Run the model's decode step (one new token per sequence against the
+        attention cache) through torch.compile, with shapes symbolic so the
+        growing cache doesn't trigger recompiles. Prompts are prefilled
+        eagerly: their lengths vary too much to pay off. Compilation is slow,
+        so call warm_up before serving.
+        """
+        model = self.model
+        compiled_forward = compile_forward(model, max_graphs=4, dynamic=True)
+        eager_forward = model.forward
+        
+        def forward(*args, **kwargs):
+            input_ids = kwargs.get("input_ids")
+            if input_ids is not None and input_ids.shape[1] == 1 and kwargs.get("past_key_values") is not None:
+                return compiled_forward(*args, **kwargs)
+            return eager_forward(*args, **kwargs)
+        
+        model.forward = forward
+        self.compiled_decoding = True
+        logger.info("Compiled the chat model's decode step")
+    
+    def disable_compilation(self):
+        self.model.__dict__.pop("forward", None)
+        self.compiled_decoding = False
+    
+    def warm_up(self):
+        """
+        Generate for a few representative prompts, so kernel initialization,
+        allocator growth and (with enable_compilation) graph compilation
+        happen before the first request. Nothing is cached. If the compiled
+        decode step fails, it is disabled and the eager model used.
+        
+        Returns:
+            float: Seconds spent warming up
+        """
+        start = time.perf_counter()
+        if self.compiled_decoding:
+            allow_compiled_graphs()
+        try:
+            self._warm_up_generation()
         except Exception as e:
-            logger.error(f"Error generating response: {str(e)}")
-            return random.choice(self.fallback_responses)
+            if not self.compiled_decoding:
+                raise
+            logger.error("Compiled decoding failed, using the eager model: %s", e)
+            self.disable_compilation()
+            self._warm_up_generation()
+        
+        elapsed = time.perf_counter() - start
+        logger.info("Chat model warmed up in %.1fs", elapsed)
+        return elapsed
+    
+    def _warm_up_generation(self):
+        # One prompt through the whole request path: history window, generate and cleanup
+        prompts = [self._encode_input(message, WARMUP_HISTORY) for message in WARMUP_MESSAGES]
+        self._generate_batch(prompts[:1])
+        
+        # Enough decode steps for a single sequence and for a batch (compiled
+        # graphs specialize on single sequences); prompts cut to a common
+        # length so they need no padding
+        length = min(ids.shape[1] for ids in prompts)
+        for batch in (prompts[:1], prompts[1:]):
+            input_ids = torch.cat([ids[:, -length:] for ids in batch], dim=0)
+            with torch.no_grad():
+                self.model.generate(
+                    input_ids,
+                    attention_mask=torch.ones_like(input_ids),
+                    max_new_tokens=WARMUP_NEW_TOKENS,
+                    min_new_tokens=WARMUP_NEW_TOKENS,
+                    pad_token_id=self.eos_token_id,
+                    **self.generation_kwargs,
+                )
+    
+    def encode_turn(self, sender, text):
+        """
+        Build a session turn holding the model's encoding of the formatted
+        message, so later prompts can reuse it without re-tokenizing.
+        
+        Args:
+            sender (str): 'user' or 'bot'
+            text (str): The message text
+            
+        Returns:
+            Turn: The turn to append to the session
+        """
+        with stage("tokenize"):
+            token_ids = self._turn_token_ids(sender, text)
+        return Turn(sender, text, token_ids)
+    
+    def _turn_token_ids(self, sender, text):
+        """
+        Token ids of a formatted message, from the turn token cache.
+        """
+        role = "User" if sender == 'user' else "Assistant"
+        return self.turn_token_cache.encode(f"{role}: {text.strip()}\n")
+    
+    def _encode_input(self, user_message, conversation_history=None, session_turns=None):
+        """
+        Build the prompt for the model and encode it, keeping as many of the
+        most recent whole turns as fit in the context window.
+        """
+        with stage("history_format"):
+            if session_turns:
+                *history, current = session_turns
+                # Turns stored under another tokenizer come back without ids
+                turn_token_ids = lambda turn: (turn.token_ids if turn.token_ids is not None
+                                               else self._turn_token_ids(turn.sender, turn.text))
+            else:
+                history, current = conversation_history or [], None
+                turn_token_ids = lambda message: self._turn_token_ids(message['sender'], message['text'])
+        
+        # Messages missing from the turn token cache are tokenized here
+        with stage("tokenize"):
+            current_ids = current.token_ids if current is not None else self._turn_token_ids('user', user_message)
+            input_ids = self._window_input_ids(current_ids, history, turn_token_ids)
+            # Token ids are well below 2**31, so the uint32 buffer can be read as int32
+            return torch.frombuffer(input_ids, dtype=torch.int32).to(device=self.device, dtype=torch.long).unsqueeze(0)
+    
+    def _generate_batch(self, input_ids_list, cancel_events=None, plans=None):
+        """
+        Generate responses for several encoded prompts in one generate call.
+        
+        Prompts are left-padded to a common length so that every sequence's
+        new tokens start at the same position.
+        
+        Args:
+            input_ids_list (list): Encoded prompts, each of shape (1, seq_len)
+            cancel_events (list): Optional threading.Event (or None) per prompt;
+                a prompt stops generating once its event is set
+            plans (list): Optional GenerationPlan per prompt (see enable_adaptive_generation)
+            
+        Returns:
+            list: Cleaned response for each prompt, in the same order
+        """
+        pad_token_id = self.tokenizer.eos_token_id
+        prompt_length = max(ids.shape[1] for ids in input_ids_list)
+        
+        padded = []
+        masks = []
+        for ids in input_ids_list:
+            ids = ids.to(self.device)
+            padding = prompt_length - ids.shape[1]
+            padded.append(torch.nn.functional.pad(ids, (padding, 0), value=pad_token_id))
+            masks.append(torch.cat([
+                torch.zeros((1, padding), dtype=torch.long, device=self.device),
+                torch.ones((1, ids.shape[1]), dtype=torch.long, device=self.device),
+            ], dim=1))
+        
+        input_ids = torch.cat(padded, dim=0)
+        attention_mask = torch.cat(masks, dim=0)
+        
+        # Generate responses
+        timer = GenerationTimer()
+        stopping_criteria = StoppingCriteriaList([timer])
+        if cancel_events is not None and any(event is not None for event in cancel_events):
+            stopping_criteria.append(CancellationStoppingCriteria(cancel_events))
+        adaptive = self._adaptive_criteria(prompt_length, plans) if plans is not None else None
+        if adaptive is not None:
+            stopping_criteria.append(adaptive)
+        
+        with torch.no_grad(), trace_span("generate"):
+            output = self.model.generate(
+                input_ids,
+                attention_mask=attention_mask,
+                max_new_tokens=self._max_new_tokens(adaptive),
+                pad_token_id=pad_token_id,
+                num_return_sequences=1,
+                stopping_criteria=stopping_criteria,
+                **self.generation_kwargs,
+            )
+        timer.record(batch_size=len(input_ids_list))
+        
+        # Decode and clean up each response
+        return [
+            self._finish_response(sequence[prompt_length:], adaptive, row,
+                                  cancel_events[row] if cancel_events is not None else None)
+            for row, sequence in enumerate(output)
+        ]
     
-    def _format_conversation_history(self, user_message, conversation_history=None):
+    def _finish_response(self, generated_ids, adaptive=None, row=0, cancel_event=None):
+        """
+        Decode and clean one generated response. A row stopped at the display
+        cap keeps the sentences its stopping criterion already packed; with
+        adaptive generation enabled the response is also accounted for.
         """
-        Format the conversation history for the model.
+        with stage("response_clean"):
+            response = adaptive.capped_response(row) if adaptive is not None else None
+            if response is None:
+                response = self._clean_response(self.tokenizer.decode(generated_ids, skip_special_tokens=True))
+        
+        if adaptive is not None:
+            self.generation_controller.record(adaptive.stop_reason(row, cancel_event), generated_ids, response)
+        return response
+    
+    def _window_input_ids(self, current_ids, history, turn_token_ids):
         """
-        if not conversation_history:
-            return f"User: {user_message}\nAssistant:"
+        Assemble a prompt from the token ids of the current message and the
+        turns before it.
         
-        formatted_history = []
+        Walks the history from the newest turn and keeps as many turns (at
+        most max_history_turns) as fit in the context window, so the prompt is
+        always cut on a turn boundary and turns that don't fit are never
+        tokenized.
         
-        # Add previous exchanges (limited to last 5 to keep context manageable)
-        for message in conversation_history[-10:]:
-            role = "User" if message['sender'] == 'user' else "Assistant"
-            formatted_history.append(f"{role}: {message['text']}")
+        Args:
+            current_ids: Token ids of the current message
+            history (list): Previous turns, oldest first
+            turn_token_ids: Returns the token ids of a history turn
+            
+        Returns:
+            array: The prompt's token ids (array('I')), ending with "Assistant:"
+        """
+        budget = self.max_history_tokens - len(self.assistant_prefix_ids)
+        
+        selected = [current_ids]
+        used = len(current_ids)
+        for turn in reversed(history[-self.max_history_turns:]):
+            token_ids = turn_token_ids(turn)
+            if used + len(token_ids) > budget:
+                break
+            selected.append(token_ids)
+            used += len(token_ids)
         
-        # Add current message
-        formatted_history.append(f"User: {user_message}")
-        formatted_history.append("Assistant:")
+        input_ids = array('I')
+        for token_ids in reversed(selected):
+            input_ids.extend(token_ids)
+        input_ids.extend(self.assistant_prefix_ids)
         
-        return "\n".join(formatted_history)
+        # A single message longer than the window keeps its most recent tokens
+        return input_ids[-self.max_history_tokens:]
     
     def _clean_response(self, response):
         """
@@ -148,13 +825,22 @@ class ConversationManager:
         
         return response
     
+    def screen_message(self, text):
+        """
+        Screen a message against the safety phrase list.
+        
+        Returns:
+            SafetyMatch or None: The matched category and phrase, if any
+        """
+        with stage("safety_check"):
+            match = self.safety_matcher.scan(text)
+        if match is not None:
+            logger.warning("Safety phrase detected (category: %s)", match.category,
+                           extra={"safety_category": match.category})
+        return match
+    
     def _contains_concerning_content(self, text):
         """
         Check if the message contains concerning content that requires special handling.
         """
-        for pattern in self.safety_patterns:
-            if re.search(pattern, text):
-                logger.warning(f"Safety pattern detected: {pattern}")
-                return True
-        
-        return False
\ No newline at end of file
+        return self.screen_message(text) is not None
\ No newline at end of file
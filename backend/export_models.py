@@ -0,0 +1,257 @@
+"""
+Offline export and comparison of inference backends for the chat and sentiment models.
+
+Examples:
+    # Export both models to ONNX (optionally with int8 weights)
+    python export_models.py export --output_dir ml_models/onnx
+    python export_models.py export --output_dir ml_models/onnx --quantize
+
+    # Compare accuracy and latency of every backend against eager PyTorch
+    python export_models.py compare --onnx_dir ml_models/onnx --report backend_report.json
+"""
+import os
+import json
+import time
+import shutil
+import logging
+import argparse
+import importlib.util
+import numpy as np
+import torch
+from transformers import AutoTokenizer
+from inference_backends import BACKENDS, load_causal_lm
+from sentiment_analysis import SentimentAnalyzer
+
+logging.basicConfig(level=logging.INFO,
+                    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+CHAT_MODEL = "microsoft/DialoGPT-medium"
+SENTIMENT_MODEL = "distilbert-base-uncased-finetuned-sst-2-english"
+
+# Representative inputs used for the comparison report
+SAMPLE_MESSAGES = [
+    "Good morning! I slept well for the first time in weeks.",
+    "My daughter didn't call again this Sunday.",
+    "I'm not sure how I feel about moving to the new place.",
+    "The garden looks lovely now that the roses are blooming.",
+    "My knees have been aching and I couldn't go for my walk.",
+    "I made my mother's apple pie recipe today.",
+    "It's been quiet around here since my husband passed.",
+    "I'm looking forward to the grandchildren visiting next week.",
+    "The doctor said my test results were fine.",
+    "Sometimes I forget what day it is.",
+    "We used to dance every Saturday night when I was young.",
+    "I don't really know anyone in this building yet.",
+]
+
+SAMPLE_PROMPTS = [
+    "User: How are you today?\nAssistant:",
+    "User: I used to love fishing with my brother.\nAssistant:",
+    "User: My grandson is getting married next month.\nAssistant:",
+    "User: I feel a bit lonely this evening.\nAssistant:",
+]
+
+def export_onnx(args):
+    """
+    Export the chat and sentiment models to ONNX Runtime graphs, optionally
+    quantizing the exported weights to int8.
+    """
+    from optimum.onnxruntime import ORTModelForCausalLM, ORTModelForSequenceClassification
+
+    targets = [
+        ("dialogpt", CHAT_MODEL, ORTModelForCausalLM, {"use_cache": True}),
+        ("sentiment", SENTIMENT_MODEL, ORTModelForSequenceClassification, {}),
+    ]
+
+    for name, model_name, model_class, kwargs in targets:
+        if args.model not in ("all", name):
+            continue
+
+        output_dir = os.path.join(args.output_dir, name)
+        logger.info(f"Exporting {model_name} to {output_dir}")
+
+        model = model_class.from_pretrained(model_name, export=True, **kwargs)
+        model.save_pretrained(output_dir)
+        AutoTokenizer.from_pretrained(model_name).save_pretrained(output_dir)
+
+        if args.quantize:
+            quantize_onnx(output_dir)
+
+    logger.info("Export complete!")
+
+def quantize_onnx(model_dir):
+    """
+    Replace the exported graph in model_dir with a dynamically quantized int8 copy.
+    """
+    from optimum.onnxruntime import ORTQuantizer
+    from optimum.onnxruntime.configuration import AutoQuantizationConfig
+
+    quantized_dir = model_dir + "_int8"
+    qconfig = AutoQuantizationConfig.avx2(is_static=False, per_channel=False)
+
+    for file_name in [f for f in os.listdir(model_dir) if f.endswith(".onnx")]:
+        quantizer = ORTQuantizer.from_pretrained(model_dir, file_name=file_name)
+        quantizer.quantize(save_dir=quantized_dir, quantization_config=qconfig)
+
+    # Keep config and tokenizer files next to the quantized graph
+    for file_name in os.listdir(model_dir):
+        if not file_name.endswith(".onnx") and not os.path.exists(os.path.join(quantized_dir, file_name)):
+            shutil.copy(os.path.join(model_dir, file_name), quantized_dir)
+
+    shutil.rmtree(model_dir)
+    os.rename(quantized_dir, model_dir)
+    logger.info(f"Quantized ONNX model written to {model_dir}")
+
+def available_backends(requested):
+    backends = []
+    for backend in requested:
+        if backend == "onnx" and importlib.util.find_spec("optimum") is None:
+            logger.warning("Skipping onnx backend: optimum[onnxruntime] is not installed")
+            continue
+        backends.append(backend)
+    return backends
+
+def latency_summary(samples_ms):
+    samples = np.array(samples_ms)
+    return {
+        "mean_ms": float(samples.mean()),
+        "p50_ms": float(np.percentile(samples, 50)),
+        "p95_ms": float(np.percentile(samples, 95)),
+    }
+
+def compare_sentiment(backends, onnx_dir, repeats):
+    """
+    Score the sample messages with each backend and compare against eager PyTorch.
+    """
+    results = {}
+    baseline = None
+
+    for backend in backends:
+        analyzer = SentimentAnalyzer(backend=backend, onnx_dir=os.path.join(onnx_dir, "sentiment"))
+        predictions = analyzer.analyze_many(SAMPLE_MESSAGES)
+
+        # Warm up once, then time single-message calls as the API makes them
+        analyzer.analyze_many(SAMPLE_MESSAGES[:1])
+        timings = []
+        for _ in range(repeats):
+            for message in SAMPLE_MESSAGES:
+                start = time.perf_counter()
+                analyzer.analyze_many([message])
+                timings.append((time.perf_counter() - start) * 1000)
+
+        if baseline is None:
+            baseline = predictions
+
+        results[backend] = {
+            "label_agreement": float(np.mean([p[0] == b[0] for p, b in zip(predictions, baseline)])),
+            "max_confidence_diff": float(max(abs(p[1] - b[1]) for p, b in zip(predictions, baseline))),
+            **latency_summary(timings),
+        }
+        logger.info(f"sentiment/{backend}: {results[backend]}")
+
+    return results
+
+def compare_chat(backends, onnx_dir, max_new_tokens):
+    """
+    Greedy-decode the sample prompts with each backend and compare the tokens
+    against eager PyTorch, along with per-token latency.
+    """
+    tokenizer = AutoTokenizer.from_pretrained(CHAT_MODEL)
+    results = {}
+    baseline = None
+
+    for backend in backends:
+        model = load_causal_lm(CHAT_MODEL, backend, os.path.join(onnx_dir, "dialogpt"))
+        outputs = []
+        timings = []
+
+        for prompt in SAMPLE_PROMPTS:
+            input_ids = tokenizer.encode(prompt, return_tensors="pt")
+            start = time.perf_counter()
+            with torch.no_grad():
+                output = model.generate(
+                    input_ids,
+                    attention_mask=torch.ones_like(input_ids),
+                    max_new_tokens=max_new_tokens,
+                    min_new_tokens=max_new_tokens,
+                    do_sample=False,
+                    pad_token_id=tokenizer.eos_token_id,
+                )
+            elapsed = (time.perf_counter() - start) * 1000
+            new_tokens = output[0][input_ids.shape[1]:].tolist()
+            outputs.append(new_tokens)
+            timings.append(elapsed / max(1, len(new_tokens)))
+
+        if baseline is None:
+            baseline = outputs
+
+        # Fraction of tokens generated before the first divergence from the baseline
+        agreement = []
+        for tokens, reference in zip(outputs, baseline):
+            matched = 0
+            for a, b in zip(tokens, reference):
+                if a != b:
+                    break
+                matched += 1
+            agreement.append(matched / max(1, len(reference)))
+
+        results[backend] = {
+            "greedy_token_agreement": float(np.mean(agreement)),
+            **{key.replace("_ms", "_ms_per_token"): value for key, value in latency_summary(timings).items()},
+        }
+        logger.info(f"chat/{backend}: {results[backend]}")
+
+    return results
+
+def compare(args):
+    """
+    Build the accuracy-vs-latency report for the requested backends.
+    """
+    torch.manual_seed(0)
+    # Eager PyTorch always runs first so it serves as the accuracy baseline
+    backends = ["pytorch"] + [b for b in available_backends(args.backends) if b != "pytorch"]
+
+    report = {"backends": backends}
+    if args.model in ("all", "sentiment"):
+        report["sentiment"] = compare_sentiment(backends, args.onnx_dir, args.repeats)
+    if args.model in ("all", "dialogpt"):
+        report["chat"] = compare_chat(backends, args.onnx_dir, args.max_new_tokens)
+
+    with open(args.report, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+
+    logger.info(f"Saved comparison report to {args.report}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export models and compare inference backends")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    export_parser = subparsers.add_parser("export", help="Export models to ONNX Runtime")
+    export_parser.add_argument("--model", choices=["all", "dialogpt", "sentiment"], default="all",
+                               help="Which model to export")
+    export_parser.add_argument("--output_dir", type=str, default="ml_models/onnx",
+                               help="Directory to write the exported models to")
+    export_parser.add_argument("--quantize", action="store_true",
+                               help="Quantize the exported graphs to int8")
+
+    compare_parser = subparsers.add_parser("compare", help="Compare backend accuracy and latency")
+    compare_parser.add_argument("--model", choices=["all", "dialogpt", "sentiment"], default="all",
+                                help="Which model to compare")
+    compare_parser.add_argument("--backends", nargs="+", choices=BACKENDS, default=list(BACKENDS),
+                                help="Backends to include in the report")
+    compare_parser.add_argument("--onnx_dir", type=str, default="ml_models/onnx",
+                                help="Directory holding models exported with the export command")
+    compare_parser.add_argument("--repeats", type=int, default=5,
+                                help="Timing repetitions per sentiment message")
+    compare_parser.add_argument("--max_new_tokens", type=int, default=32,
+                                help="Tokens to generate per chat prompt")
+    compare_parser.add_argument("--report", type=str, default="backend_report.json",
+                                help="Path of the JSON report to write")
+
+    args = parser.parse_args()
+
+    if args.command == "export":
+        export_onnx(args)
+    else:
+        compare(args)
@@ -0,0 +1,29 @@
+import os
+
+# Gunicorn settings for the backend (gunicorn -c gunicorn.conf.py)
+bind = f"0.0.0.0:{os.environ.get('PORT', 5000)}"
+workers = int(os.environ.get('GUNICORN_WORKERS', 1))
+threads = int(os.environ.get('GUNICORN_THREADS', 8))
+
+# SERVER_MODE=asgi serves asgi.py on uvicorn workers, with inference on a
+# bounded executor instead of request threads (GUNICORN_THREADS is unused)
+if os.environ.get('SERVER_MODE', 'wsgi') == 'asgi':
+    wsgi_app = 'asgi:app'
+    worker_class = 'uvicorn.workers.UvicornWorker'
+else:
+    wsgi_app = 'app:app'
+
+# Model loading can take a while on cold nodes
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 120))
+
+# With MODEL_PRELOAD=1 the app (and its models) is imported once in the master
+# process, so workers inherit the weights copy-on-write instead of each loading
+# a private copy
+preload_app = os.environ.get('MODEL_PRELOAD', '0') == '1'
+
+def post_fork(server, worker):
+    # Reinitialize torch's intra-op thread pool in the child; the pool created
+    # in the master is not usable after fork. In ASGI mode the inference
+    # executor sets it on first use.
+    import torch
+    torch.set_num_threads(int(os.environ.get('TORCH_NUM_THREADS', os.cpu_count() or 1)))
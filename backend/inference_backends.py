@@ -0,0 +1,279 @@
+import os
+import json
+import struct
+import logging
+import threading
+import torch
+from huggingface_hub import list_repo_files, snapshot_download, try_to_load_from_cache
+from transformers import AutoModelForCausalLM, AutoModelForSequenceClassification
+from transformers.pytorch_utils import Conv1D
+
+logger = logging.getLogger(__name__)
+
+# Supported inference backends:
+#   pytorch - eager fp32 PyTorch
+#   int8    - PyTorch with dynamically quantized int8 Linear layers (CPU only)
+#   onnx    - ONNX Runtime graph exported with optimum (CPU only); the causal LM
+#             is exported with past key/values so decoding reuses the KV cache
+BACKENDS = ("pytorch", "int8", "onnx")
+
+# from_pretrained relies on process-global initialization state and is not
+# safe to run from several threads at once (tied weights can be left on the
+# meta device), so model instantiation is serialized. File downloads and
+# post-processing still run concurrently.
+MODEL_INIT_LOCK = threading.Lock()
+
+# Graphs expected from every compile_forward call so far. Dynamo's recompile
+# limit counts graphs per code object, and transformers wraps every model's
+# forward in the same decorator, so the limit has to cover all of them.
+_compiled_graphs = 0
+_compile_lock = threading.Lock()
+
+def get_backend(name=None, default="pytorch"):
+    """
+    Resolve the backend to use from an explicit name or the INFERENCE_BACKEND
+    environment variable.
+    """
+    backend = (name or os.environ.get("INFERENCE_BACKEND") or default).lower()
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown inference backend: {backend} (expected one of {', '.join(BACKENDS)})")
+    return backend
+
+def backend_device(backend):
+    """
+    Device a backend runs on. Quantized and ONNX Runtime models are CPU only.
+    """
+    if backend == "pytorch" and torch.cuda.is_available():
+        return torch.device("cuda")
+    return torch.device("cpu")
+
+def load_causal_lm(model_name, backend="pytorch", onnx_dir=None):
+    """
+    Load a causal language model (DialoGPT) for the given backend.
+
+    Args:
+        model_name (str): Hugging Face model name or local path
+        backend (str): One of BACKENDS
+        onnx_dir (str): Directory holding the exported ONNX model, if any
+
+    Returns:
+        A model exposing the transformers generate() API
+    """
+    if backend == "onnx":
+        from optimum.onnxruntime import ORTModelForCausalLM
+        return _load_onnx(ORTModelForCausalLM, model_name, onnx_dir, use_cache=True)
+
+    prefetch_model_files(model_name)
+    with MODEL_INIT_LOCK:
+        model = AutoModelForCausalLM.from_pretrained(model_name)
+    if backend == "int8":
+        model = quantize_dynamic_int8(model)
+    else:
+        share_weights_from_safetensors(model, model_name)
+    return model
+
+def load_sequence_classifier(model_name, backend="pytorch", onnx_dir=None):
+    """
+    Load a sequence classification model (DistilBERT sentiment) for the given backend.
+
+    Args:
+        model_name (str): Hugging Face model name or local path
+        backend (str): One of BACKENDS
+        onnx_dir (str): Directory holding the exported ONNX model, if any
+
+    Returns:
+        A model callable with tokenizer outputs that returns logits
+    """
+    if backend == "onnx":
+        from optimum.onnxruntime import ORTModelForSequenceClassification
+        return _load_onnx(ORTModelForSequenceClassification, model_name, onnx_dir)
+
+    prefetch_model_files(model_name)
+    with MODEL_INIT_LOCK:
+        model = AutoModelForSequenceClassification.from_pretrained(model_name)
+    if backend == "int8":
+        model = quantize_dynamic_int8(model)
+    else:
+        share_weights_from_safetensors(model, model_name)
+    return model
+
+def prefetch_model_files(model_name):
+    """
+    Download a Hub model's config, tokenizer and PyTorch weights into the local
+    cache, preferring safetensors weights. Local directories are left alone.
+
+    Runs outside MODEL_INIT_LOCK so several models can download at once.
+    """
+    if os.path.isdir(model_name):
+        return
+
+    try:
+        files = list_repo_files(model_name)
+        weights = "*.safetensors" if any(f.endswith(".safetensors") for f in files) else "pytorch_model*.bin"
+        snapshot_download(model_name, allow_patterns=["*.json", "*.txt", "*.model", weights])
+    except Exception as e:
+        # from_pretrained will fall back to the local cache or report the error
+        logger.warning(f"Could not prefetch {model_name}: {str(e)}")
+
+# safetensors dtype names -> torch dtypes
+SAFETENSORS_DTYPES = {
+    "F64": torch.float64,
+    "F32": torch.float32,
+    "F16": torch.float16,
+    "BF16": torch.bfloat16,
+    "I64": torch.int64,
+    "I32": torch.int32,
+    "I16": torch.int16,
+    "I8": torch.int8,
+    "U8": torch.uint8,
+    "BOOL": torch.bool,
+}
+
+def mmap_safetensors(path):
+    """
+    Memory-map a safetensors file and return its tensors as views of the mapping.
+
+    The file is mapped copy-on-write, so the weights live in the OS page cache
+    and are shared by every process that maps the same file (e.g. each
+    gunicorn worker) instead of each process holding a private copy.
+
+    Returns:
+        dict: Tensor name -> tensor backed by the mapped file
+    """
+    with open(path, "rb") as f:
+        header_size = struct.unpack("<Q", f.read(8))[0]
+        header = json.loads(f.read(header_size))
+
+    storage = torch.UntypedStorage.from_file(path, shared=False, nbytes=os.path.getsize(path))
+    data_start = 8 + header_size
+
+    tensors = {}
+    for name, info in header.items():
+        dtype = SAFETENSORS_DTYPES.get(info.get("dtype")) if name != "__metadata__" else None
+        if dtype is None:
+            continue
+
+        itemsize = torch.empty(0, dtype=dtype).element_size()
+        byte_offset = data_start + info["data_offsets"][0]
+        if byte_offset % itemsize:
+            continue  # Unaligned tensors cannot be viewed in place
+
+        tensors[name] = torch.empty(0, dtype=dtype).set_(storage, byte_offset // itemsize, info["shape"])
+
+    return tensors
+
+def share_weights_from_safetensors(model, model_name):
+    """
+    Point a loaded model's parameters at a memory-mapped copy of its
+    safetensors checkpoint, releasing the private copies made while loading.
+
+    Models without a safetensors checkpoint are left unchanged.
+
+    Returns:
+        int: Number of parameters now backed by the mapped file
+    """
+    if os.path.isdir(model_name):
+        path = os.path.join(model_name, "model.safetensors")
+    else:
+        path = try_to_load_from_cache(model_name, "model.safetensors")
+
+    if not isinstance(path, str) or not os.path.isfile(path):
+        logger.info(f"No safetensors checkpoint for {model_name}, weights stay in private memory")
+        return 0
+
+    tensors = mmap_safetensors(path)
+    prefix = f"{model.base_model_prefix}." if getattr(model, "base_model_prefix", "") else ""
+
+    shared = 0
+    for name, param in model.named_parameters():
+        # Checkpoints saved from the base model omit its prefix
+        tensor = tensors.get(name)
+        if tensor is None and prefix and name.startswith(prefix):
+            tensor = tensors.get(name[len(prefix):])
+
+        if tensor is not None and tensor.shape == param.shape and tensor.dtype == param.dtype \
+                and param.device.type == "cpu":
+            param.data = tensor
+            shared += 1
+
+    logger.info(f"Memory-mapped {shared} parameters of {model_name} from {path}")
+    return shared
+
+def quantize_dynamic_int8(model):
+    """
+    Quantize a model's Linear layers to int8 with dynamic activation scaling.
+
+    GPT-2 style models (DialoGPT) implement their projections with the
+    transformers Conv1D module rather than nn.Linear, so those are converted
+    to equivalent Linear layers first; otherwise only the output head would
+    be quantized.
+    """
+    model.eval()
+    _convert_conv1d_to_linear(model)
+    quantized = torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+    logger.info(f"Applied dynamic int8 quantization to {type(model).__name__}")
+    return quantized
+
+def compile_forward(model, max_graphs=8, dynamic=None):
+    """
+    Compile a PyTorch model's forward pass with torch.compile.
+
+    Compilation happens lazily, once per new input shape, so callers should
+    run every shape they use (see the warm_up methods) before serving, after
+    calling allow_compiled_graphs on that thread.
+
+    Args:
+        model: A PyTorch model (pytorch or int8 backend)
+        max_graphs (int): Graphs the caller expects to compile
+        dynamic (bool): Passed to torch.compile; True compiles for symbolic
+            shapes from the start instead of recompiling when a shape changes
+
+    Returns:
+        callable: The compiled forward, called like model.forward
+    """
+    if not isinstance(model, torch.nn.Module):
+        raise ValueError(f"Only PyTorch models can be compiled, not {type(model).__name__}")
+
+    global _compiled_graphs
+    with _compile_lock:
+        _compiled_graphs += max_graphs
+
+    return torch.compile(model.forward, dynamic=dynamic)
+
+def allow_compiled_graphs():
+    """
+    Raise dynamo's recompile limit on the calling thread (recent releases keep
+    the setting per thread) to fit the graphs of every compile_forward call.
+    On threads that don't call this, inputs of a shape that has no graph yet
+    run eagerly once the default limit is reached.
+    """
+    # Named cache_size_limit in older releases
+    config = torch._dynamo.config
+    limit = "recompile_limit" if hasattr(config, "recompile_limit") else "cache_size_limit"
+    setattr(config, limit, max(getattr(config, limit), _compiled_graphs))
+
+def _convert_conv1d_to_linear(module):
+    for name, child in module.named_children():
+        if isinstance(child, Conv1D):
+            # Conv1D stores its weight as (in_features, out_features)
+            in_features, out_features = child.weight.shape
+            linear = torch.nn.Linear(in_features, out_features)
+            linear.weight.data = child.weight.data.t().contiguous()
+            linear.bias.data = child.bias.data
+            setattr(module, name, linear)
+        else:
+            _convert_conv1d_to_linear(child)
+
+def _load_onnx(model_class, model_name, onnx_dir, **kwargs):
+    if onnx_dir and os.path.isdir(onnx_dir):
+        logger.info(f"Loading ONNX Runtime model from {onnx_dir}")
+        onnx_files = [f for f in os.listdir(onnx_dir) if f.endswith(".onnx")]
+        if len(onnx_files) == 1:
+            # Also picks up graphs quantized by export_models.py (model_quantized.onnx)
+            kwargs["file_name"] = onnx_files[0]
+        return model_class.from_pretrained(onnx_dir, **kwargs)
+
+    # No pre-exported graph: export now (slow, use export_models.py ahead of time)
+    logger.warning(f"No exported ONNX model found at {onnx_dir}, exporting {model_name} at startup")
+    with MODEL_INIT_LOCK:
+        return model_class.from_pretrained(model_name, export=True, **kwargs)
@@ -0,0 +1,139 @@
+import asyncio
+import logging
+import math
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import torch
+from utils.metrics import INFERENCE_PENDING, INFERENCE_REJECTED
+
+logger = logging.getLogger(__name__)
+
+class OverloadedError(Exception):
+    """
+    Raised when the inference executor's queue is full.
+    """
+    def __init__(self, message, retry_after=1):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+class InferenceExecutor:
+    """
+    Bounded thread pool that runs model inference off the event loop.
+
+    At most max_workers jobs run at once and at most max_queue more wait for
+    a worker; anything beyond that is rejected immediately with
+    OverloadedError rather than queued, so latency under overload stays
+    bounded and clients are told when to retry. torch's intra-op thread count
+    defaults to the cores divided among the workers, so concurrent inference
+    threads share the cores instead of oversubscribing them.
+
+    The pool and torch thread settings are set up on first use in each
+    process, so an executor created before gunicorn forks works in every
+    worker.
+    """
+    def __init__(self, max_workers=1, max_queue=32, torch_threads=None):
+        self.max_workers = max(1, int(max_workers))
+        self.max_queue = max(0, int(max_queue))
+        self.torch_threads = int(torch_threads) if torch_threads else max(1, (os.cpu_count() or 1) // self.max_workers)
+
+        self._executor = None
+        self._executor_pid = None
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._stats = {"submitted": 0, "completed": 0, "rejected": 0, "total_seconds": 0.0}
+
+        logger.info(f"Inference executor configured (workers={self.max_workers}, max_queue={self.max_queue}, "
+                    f"torch_threads={self.torch_threads})")
+
+    def _ensure_executor(self):
+        """
+        Create the thread pool for the current process if it does not exist.
+        Called with the lock held.
+        """
+        if self._executor_pid == os.getpid():
+            return
+        torch.set_num_threads(self.torch_threads)
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="inference")
+        self._executor_pid = os.getpid()
+
+    def submit(self, fn, *args, **kwargs):
+        """
+        Schedule fn(*args, **kwargs) on an inference thread.
+
+        Returns:
+            concurrent.futures.Future: The job's future
+
+        Raises:
+            OverloadedError: If every worker is busy and the queue is full
+        """
+        with self._lock:
+            if self._pending >= self.max_workers + self.max_queue:
+                self._stats["rejected"] += 1
+                INFERENCE_REJECTED.inc()
+                raise OverloadedError("Server is busy, please try again shortly", self._retry_after())
+            self._ensure_executor()
+            self._pending += 1
+            self._stats["submitted"] += 1
+            INFERENCE_PENDING.set(self._pending)
+            executor = self._executor
+
+        def job():
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                with self._lock:
+                    self._stats["completed"] += 1
+                    self._stats["total_seconds"] += time.perf_counter() - start
+
+        future = executor.submit(job)
+        future.add_done_callback(self._release)
+        return future
+
+    async def run(self, fn, *args, **kwargs):
+        """
+        Run fn on an inference thread and await its result from the event loop.
+        """
+        return await asyncio.wrap_future(self.submit(fn, *args, **kwargs))
+
+    def pending(self):
+        """
+        Number of jobs queued or running.
+        """
+        with self._lock:
+            return self._pending
+
+    def get_stats(self):
+        """
+        Snapshot of executor usage and admission statistics.
+        """
+        with self._lock:
+            stats = dict(self._stats)
+            stats["pending"] = self._pending
+        total_seconds = stats.pop("total_seconds")
+        stats["avg_job_ms"] = total_seconds / stats["completed"] * 1000.0 if stats["completed"] else 0.0
+        stats["max_workers"] = self.max_workers
+        stats["max_queue"] = self.max_queue
+        stats["torch_threads"] = self.torch_threads
+        return stats
+
+    def shutdown(self, wait=True):
+        if self._executor_pid == os.getpid():
+            self._executor.shutdown(wait=wait, cancel_futures=True)
+
+    def _release(self, future):
+        # Runs when a job finishes or is cancelled before it started
+        with self._lock:
+            self._pending -= 1
+            INFERENCE_PENDING.set(self._pending)
+
+    def _retry_after(self):
+        """
+        Estimate, in whole seconds, how long until the current backlog drains.
+        Called with the lock held.
+        """
+        completed = self._stats["completed"]
+        avg_seconds = self._stats["total_seconds"] / completed if completed else 1.0
+        return max(1, math.ceil(avg_seconds * self._pending / self.max_workers))
@@ -0,0 +1,121 @@
+import logging
+import threading
+from collections import OrderedDict
+from utils.metrics import CACHE_EVENTS
+
+logger = logging.getLogger(__name__)
+
+def cache_nbytes(past_key_values):
+    """
+    Approximate memory held by a model's past_key_values, in bytes.
+    """
+    tensors = []
+    if hasattr(past_key_values, "layers"):
+        for layer in past_key_values.layers:
+            tensors.extend([getattr(layer, "keys", None), getattr(layer, "values", None)])
+    elif hasattr(past_key_values, "key_cache"):
+        tensors.extend(past_key_values.key_cache)
+        tensors.extend(past_key_values.value_cache)
+    else:
+        for layer in past_key_values:
+            tensors.extend(layer)
+
+    return sum(t.numel() * t.element_size() for t in tensors if t is not None and hasattr(t, "numel"))
+
+def common_prefix_length(a, b):
+    """
+    Length of the shared prefix of two token id sequences.
+    """
+    length = 0
+    for x, y in zip(a, b):
+        if x != y:
+            break
+        length += 1
+    return length
+
+class KVCacheEntry:
+    """
+    Attention keys/values computed for a conversation's last turn, together
+    with the token ids they cover.
+    """
+    def __init__(self, token_ids, past_key_values):
+        self.token_ids = token_ids
+        self.past_key_values = past_key_values
+        self.nbytes = cache_nbytes(past_key_values)
+
+class KVCacheStore:
+    """
+    Per-conversation store of past_key_values with a memory budget and
+    least-recently-used eviction.
+
+    Entries are taken out of the store while a turn is being generated, so a
+    cache is never used by two requests at once; the updated cache is put
+    back when generation finishes.
+    """
+    def __init__(self, max_bytes=512 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._total_bytes = 0
+        self._stats = {"hits": 0, "misses": 0, "evictions": 0, "reused_tokens": 0}
+
+    def take(self, conversation_id):
+        """
+        Remove and return the cached entry for a conversation.
+
+        Returns:
+            KVCacheEntry or None: The entry, or None if nothing is cached
+        """
+        with self._lock:
+            entry = self._entries.pop(conversation_id, None)
+            if entry is None:
+                self._stats["misses"] += 1
+                CACHE_EVENTS.inc(cache="kv", result="miss")
+                return None
+            self._total_bytes -= entry.nbytes
+            return entry
+
+    def put(self, conversation_id, token_ids, past_key_values):
+        """
+        Store the cache for a conversation's latest turn, evicting the least
+        recently used conversations to stay within the memory budget.
+        """
+        entry = KVCacheEntry(list(token_ids), past_key_values)
+        if entry.nbytes > self.max_bytes:
+            logger.debug("KV cache for conversation %s exceeds budget, not storing", conversation_id)
+            return
+
+        with self._lock:
+            previous = self._entries.pop(conversation_id, None)
+            if previous is not None:
+                self._total_bytes -= previous.nbytes
+
+            while self._entries and self._total_bytes + entry.nbytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._total_bytes -= evicted.nbytes
+                self._stats["evictions"] += 1
+
+            self._entries[conversation_id] = entry
+            self._total_bytes += entry.nbytes
+
+    def record_hit(self, reused_tokens):
+        CACHE_EVENTS.inc(cache="kv", result="hit")
+        with self._lock:
+            self._stats["hits"] += 1
+            self._stats["reused_tokens"] += reused_tokens
+
+    def record_miss(self):
+        CACHE_EVENTS.inc(cache="kv", result="miss")
+        with self._lock:
+            self._stats["misses"] += 1
+
+    def get_stats(self):
+        """
+        Snapshot of store usage and hit statistics.
+        """
+        with self._lock:
+            stats = dict(self._stats)
+            stats["conversations"] = len(self._entries)
+            stats["bytes"] = self._total_bytes
+        stats["max_bytes"] = self.max_bytes
+        return stats
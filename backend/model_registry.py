@@ -0,0 +1,141 @@
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+class ModelNotReadyError(Exception):
+    """
+    Raised when a model is requested before it has finished loading.
+    """
+    pass
+
+class ModelRegistry:
+    """
+    Loads the application's models concurrently and tracks their readiness.
+
+    Loaders are registered by name and run in parallel, either in the
+    foreground (e.g. in the gunicorn master before workers fork) or on a
+    background thread so the process can answer liveness checks while the
+    weights are still loading.
+    """
+    def __init__(self):
+        self._loaders = {}
+        self._models = {}
+        self._status = {}
+        self._lock = threading.Lock()
+        self._ready = threading.Event()
+        self._loading_thread = None
+        self._post_load_hooks = []
+
+    def register(self, name, loader):
+        """
+        Register a zero-argument callable that builds a model.
+        """
+        with self._lock:
+            self._loaders[name] = loader
+            self._status[name] = {"state": "pending"}
+
+    def add_post_load_hook(self, hook):
+        """
+        Register a callable run with the registry once every model has loaded
+        and before it reports ready, e.g. to wrap models with set().
+        """
+        self._post_load_hooks.append(hook)
+
+    def load_all(self):
+        """
+        Run every registered loader in parallel and wait for them to finish.
+
+        Returns:
+            bool: True if every model loaded successfully
+        """
+        start = time.perf_counter()
+
+        with ThreadPoolExecutor(max_workers=max(1, len(self._loaders)), thread_name_prefix="model-loader") as executor:
+            for name, loader in self._loaders.items():
+                executor.submit(self._load, name, loader)
+
+        failed = [name for name, status in self.status().items() if status["state"] != "ready"]
+        if failed:
+            logger.error(f"Models failed to load: {', '.join(failed)}")
+            return False
+
+        for hook in self._post_load_hooks:
+            try:
+                hook(self)
+            except Exception as e:
+                logger.error(f"Error in post-load hook: {str(e)}")
+                return False
+
+        self._ready.set()
+        logger.info(f"All models loaded in {time.perf_counter() - start:.1f}s")
+        return True
+
+    def start_background_load(self):
+        """
+        Start loading all models on a background thread and return immediately.
+        """
+        self._loading_thread = threading.Thread(target=self.load_all, name="model-registry", daemon=True)
+        self._loading_thread.start()
+        return self._loading_thread
+
+    def get(self, name):
+        """
+        Get a loaded model by name.
+
+        Raises:
+            ModelNotReadyError: If the model has not finished loading
+        """
+        model = self._models.get(name)
+        if model is None:
+            raise ModelNotReadyError(f"Model '{name}' is {self._status.get(name, {}).get('state', 'unknown')}")
+        return model
+
+    def set(self, name, model):
+        """
+        Replace a loaded model, e.g. with a wrapper around it.
+        """
+        with self._lock:
+            self._models[name] = model
+
+    def is_ready(self):
+        return self._ready.is_set()
+
+    def wait_until_ready(self, timeout=None):
+        return self._ready.wait(timeout)
+
+    def update_status(self, name, **fields):
+        """
+        Add to or change a model's status, e.g. while a post-load hook warms it up.
+        """
+        with self._lock:
+            self._status[name].update(fields)
+
+    def status(self):
+        """
+        Loading state of each registered model.
+        """
+        with self._lock:
+            return {name: dict(status) for name, status in self._status.items()}
+
+    def _load(self, name, loader):
+        start = time.perf_counter()
+        with self._lock:
+            self._status[name] = {"state": "loading"}
+
+        try:
+            model = loader()
+        except Exception as e:
+            logger.error(f"Error loading model '{name}': {str(e)}")
+            with self._lock:
+                self._status[name] = {"state": "failed", "error": str(e)}
+            return
+
+        elapsed = time.perf_counter() - start
+        with self._lock:
+            self._models[name] = model
+            self._status[name] = {"state": "ready", "load_seconds": round(elapsed, 2)}
+
+        logger.info(f"Model '{name}' loaded in {elapsed:.1f}s")
@@ -0,0 +1,150 @@
+import logging
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from utils.metrics import RESPONSE_SOURCES
+
+logger = logging.getLogger(__name__)
+
+def _elapsed_ms(start):
+    return round((time.perf_counter() - start) * 1000, 2)
+
+class ChatPipeline:
+    """
+    Handles one user message end to end: the safety screen first, then
+    sentiment analysis and response generation side by side.
+
+    Sentiment runs on a small thread pool while generation runs on the
+    calling thread, so a turn takes about as long as generation alone instead
+    of sentiment plus generation. A message that trips the safety screen never
+    reaches the chat model; it gets a safety response (and its sentiment).
+
+    The thread pool is created on first use in each process, so a pipeline
+    created before gunicorn forks works in every worker.
+    """
+    def __init__(self, max_workers=4):
+        self.max_workers = max(1, int(max_workers))
+        self._executor = None
+        self._executor_pid = None
+        self._lock = threading.Lock()
+
+    def run(self, conversation_manager, sentiment_analyzer, user_message, generate):
+        """
+        Screen, analyze and answer a message.
+
+        Args:
+            conversation_manager: Screens the message and supplies safety responses
+            sentiment_analyzer: Analyzes the message's sentiment
+            user_message (str): The message from the user
+            generate: Zero-argument callable returning the chat response; only
+                called for messages that passed the safety screen, so it should
+                pass screened=True to generate_response
+
+        Returns:
+            dict: response, sentiment, confidence, safety_flagged and per-stage
+                timings in milliseconds
+        """
+        start = time.perf_counter()
+        timings = {}
+
+        safety_match = conversation_manager.screen_message(user_message)
+        timings["safety"] = _elapsed_ms(start)
+
+        sentiment_future = self._submit_sentiment(sentiment_analyzer, user_message, timings)
+
+        if safety_match is not None:
+            RESPONSE_SOURCES.inc(source="safety")
+            response = random.choice(conversation_manager.safety_responses)
+        else:
+            generation_start = time.perf_counter()
+            response = generate()
+            timings["generation"] = _elapsed_ms(generation_start)
+
+        sentiment, confidence = sentiment_future.result()
+        timings["total"] = _elapsed_ms(start)
+
+        return {
+            "response": response,
+            "sentiment": sentiment,
+            "confidence": confidence,
+            "safety_flagged": safety_match is not None,
+            "timings_ms": timings,
+        }
+
+    def stream(self, conversation_manager, sentiment_analyzer, user_message, stream_events):
+        """
+        Streaming counterpart of run.
+
+        Args:
+            conversation_manager: Screens the message and supplies safety responses
+            sentiment_analyzer: Analyzes the message's sentiment
+            user_message (str): The message from the user
+            stream_events: Zero-argument callable returning the generator from
+                ConversationManager.stream_response (with screened=True); only
+                called for messages that passed the safety screen
+
+        Yields:
+            dict: {"type": "sentiment", ...} as soon as sentiment is known (checked
+                between tokens), {"type": "token", ...} events from generation, then
+                {"type": "done", ...} with the final response, safety_flagged and timings
+        """
+        start = time.perf_counter()
+        timings = {}
+
+        safety_match = conversation_manager.screen_message(user_message)
+        timings["safety"] = _elapsed_ms(start)
+
+        sentiment_future = self._submit_sentiment(sentiment_analyzer, user_message, timings)
+        sentiment_sent = False
+
+        if safety_match is not None:
+            RESPONSE_SOURCES.inc(source="safety")
+            response = random.choice(conversation_manager.safety_responses)
+            events = iter([{"type": "token", "text": response}, {"type": "done", "response": response}])
+            # The response is ready at once, so lead with the sentiment as usual
+            sentiment_sent = True
+            yield self._sentiment_event(sentiment_future)
+        else:
+            events = stream_events()
+
+        generation_start = time.perf_counter()
+        try:
+            for event in events:
+                if not sentiment_sent and sentiment_future.done():
+                    sentiment_sent = True
+                    yield self._sentiment_event(sentiment_future)
+
+                if event["type"] == "done":
+                    if safety_match is None:
+                        timings["generation"] = _elapsed_ms(generation_start)
+                    if not sentiment_sent:
+                        sentiment_sent = True
+                        yield self._sentiment_event(sentiment_future)
+                    timings["total"] = _elapsed_ms(start)
+                    yield {**event, "safety_flagged": safety_match is not None, "timings_ms": timings}
+                else:
+                    yield event
+        finally:
+            # Closing this generator (client disconnect) stops generation too
+            if hasattr(events, "close"):
+                events.close()
+
+    def _submit_sentiment(self, sentiment_analyzer, user_message, timings):
+        def analyze():
+            start = time.perf_counter()
+            try:
+                return sentiment_analyzer.analyze(user_message)
+            finally:
+                timings["sentiment"] = _elapsed_ms(start)
+
+        with self._lock:
+            if self._executor_pid != os.getpid():
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="pipeline")
+                self._executor_pid = os.getpid()
+            return self._executor.submit(analyze)
+
+    def _sentiment_event(self, sentiment_future):
+        sentiment, confidence = sentiment_future.result()
+        return {"type": "sentiment", "sentiment": sentiment, "confidence": confidence}
@@ -0,0 +1,169 @@
+import hashlib
+import logging
+import random
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from utils.metrics import CACHE_EVENTS
+
+logger = logging.getLogger(__name__)
+
+_PUNCTUATION = re.compile(r"[^\w\s]")
+
+def normalize_message(text):
+    """
+    Normalize a message so trivially different phrasings share a key:
+    Unicode NFKC, lowercase, punctuation dropped and whitespace collapsed
+    ("Hello!!" and "hello" match).
+    """
+    text = unicodedata.normalize("NFKC", text).casefold()
+    return " ".join(_PUNCTUATION.sub(" ", text).split())
+
+class ResponseCache:
+    """
+    Pools of sampled replies keyed by a fingerprint of the recent context:
+    the normalized current message and the last few turns before it.
+
+    A key is served from the cache only once its pool holds pool_size
+    distinct replies; until then every request still goes to the model and
+    its reply is added to the pool. Hits pick a random reply from the pool
+    (avoiding the one served last for that key), so common openings like
+    "hello" stay varied instead of repeating one answer. Each reply expires
+    ttl_seconds after it was generated, after which the key fills up again
+    with fresh samples. Keys are evicted least recently used beyond
+    max_entries.
+
+    Only short messages are cached (at most max_message_words words); longer
+    messages rarely repeat and would just churn the cache.
+    """
+    def __init__(self, max_entries=1024, ttl_seconds=3600, pool_size=4, context_turns=1,
+                 max_message_words=8, namespace="response"):
+        self.max_entries = max(1, int(max_entries))
+        self.ttl_seconds = ttl_seconds
+        self.pool_size = max(1, int(pool_size))
+        self.context_turns = max(0, int(context_turns))
+        self.max_message_words = max_message_words
+        self.namespace = namespace
+
+        # key -> {"replies": [(normalized, reply, created_at)], "last": reply served last}
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "filled": 0, "duplicates": 0, "expired": 0,
+                       "evictions": 0, "uncacheable": 0}
+
+    def make_key(self, user_message, context=None):
+        """
+        Fingerprint a message and the turns before it.
+
+        Args:
+            user_message (str): The current message from the user
+            context (list): Previous (sender, text) pairs, oldest first
+
+        Returns:
+            str: The cache key, or None if the message is too long to cache
+        """
+        message = normalize_message(user_message)
+        if not message or len(message.split()) > self.max_message_words:
+            with self._lock:
+                self._stats["uncacheable"] += 1
+            return None
+
+        parts = []
+        if self.context_turns and context:
+            parts = [f"{sender}:{normalize_message(text)}" for sender, text in context[-self.context_turns:]]
+        parts.append(f"user:{message}")
+
+        digest = hashlib.sha256("\0".join(parts).encode("utf-8")).hexdigest()
+        return f"{self.namespace}:{digest}"
+
+    def get(self, key):
+        """
+        Pick a cached reply for the key.
+
+        Returns:
+            str: A reply from the key's pool, or None if the pool is not full yet
+                (the caller should generate and add its reply)
+        """
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._expire(entry, now)
+
+            if entry is None or len(entry["replies"]) < self.pool_size:
+                self._stats["misses"] += 1
+                CACHE_EVENTS.inc(cache=self.namespace, result="miss")
+                return None
+
+            self._entries.move_to_end(key)
+            choices = [reply for _, reply, _ in entry["replies"] if reply != entry["last"]]
+            reply = random.choice(choices or [reply for _, reply, _ in entry["replies"]])
+            entry["last"] = reply
+            self._stats["hits"] += 1
+
+        CACHE_EVENTS.inc(cache=self.namespace, result="hit")
+        return reply
+
+    def add(self, key, reply):
+        """
+        Add a freshly generated reply to the key's pool. Replies that normalize
+        to one already pooled are skipped, so the pool stays diverse.
+        """
+        normalized = normalize_message(reply)
+        if not normalized:
+            return
+
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                entry = self._entries[key] = {"replies": [], "last": None}
+            else:
+                self._expire(entry, now)
+            self._entries.move_to_end(key)
+
+            if len(entry["replies"]) >= self.pool_size:
+                return
+            if any(existing == normalized for existing, _, _ in entry["replies"]):
+                self._stats["duplicates"] += 1
+                return
+
+            entry["replies"].append((normalized, reply, now))
+            entry["last"] = reply
+            self._stats["filled"] += 1
+
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._stats["evictions"] += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def get_stats(self):
+        """
+        Hit/miss counters and current size of the cache.
+        """
+        with self._lock:
+            stats = dict(self._stats)
+            stats["keys"] = len(self._entries)
+            stats["ready_keys"] = sum(1 for entry in self._entries.values()
+                                      if len(entry["replies"]) >= self.pool_size)
+            stats["replies"] = sum(len(entry["replies"]) for entry in self._entries.values())
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+        stats["max_entries"] = self.max_entries
+        stats["pool_size"] = self.pool_size
+        stats["ttl_seconds"] = self.ttl_seconds
+        return stats
+
+    def _expire(self, entry, now):
+        if not self.ttl_seconds:
+            return
+        fresh = [item for item in entry["replies"] if now - item[2] < self.ttl_seconds]
+        expired = len(entry["replies"]) - len(fresh)
+        if expired:
+            entry["replies"] = fresh
+            self._stats["expired"] += expired
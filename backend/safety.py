@@ -0,0 +1,224 @@
+import os
+import re
+import json
+import time
+import logging
+import threading
+import unicodedata
+from collections import namedtuple
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PHRASES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "safety_phrases.json")
+
+# Result of a safety scan: the category and (normalized) phrase that matched
+SafetyMatch = namedtuple("SafetyMatch", ["category", "phrase"])
+
+# A compiled phrase list: the combined pattern, normalized phrase -> category,
+# and folded phrase -> normalized phrase. Replaced as a whole on reload, so a
+# scan never pairs one list's pattern with another's phrases
+_PhraseList = namedtuple("_PhraseList", ["pattern", "categories", "phrases"])
+
+def normalize_text(text):
+    """
+    Normalize text for phrase matching: compatibility-fold Unicode, lowercase,
+    strip accents, and reduce everything that isn't a letter or digit to
+    single spaces. Phrases and messages go through the same normalization.
+    """
+    text = unicodedata.normalize("NFKD", text).casefold()
+    text = "".join(ch for ch in text if not unicodedata.combining(ch))
+    text = re.sub(r"[\W_]+", " ", text)
+    return text.strip()
+
+def fold_repeats(text):
+    """
+    Collapse runs of the same letter ("suiccide" -> "suicide"), so doubled
+    or repeated letters in a message don't stop a phrase from matching.
+    Phrases are folded the same way before they are compiled.
+    """
+    return _REPEATED_LETTER.sub(r"\1", text)
+
+_REPEATED_LETTER = re.compile(r"([^\W\d_])\1+")
+
+# Endings allowed after a phrase's last word, so "suicides" matches "suicide"
+_PHRASE_SUFFIX = r"(?:s|es|d|ed|ing)?"
+
+def _trie_pattern(node):
+    """
+    Turn a character trie into a regex fragment. Shared prefixes are matched
+    once, so scan cost depends on phrase length rather than phrase count.
+    """
+    end = "" in node
+    alternatives = []
+    single_chars = []
+
+    for ch in sorted(key for key in node if key):
+        child = _trie_pattern(node[ch])
+        if child is None:
+            single_chars.append(re.escape(ch))
+        else:
+            alternatives.append(re.escape(ch) + child)
+
+    if not alternatives and not single_chars:
+        return None
+
+    if single_chars:
+        alternatives.append(single_chars[0] if len(single_chars) == 1 else f"[{''.join(single_chars)}]")
+
+    pattern = alternatives[0] if len(alternatives) == 1 else f"(?:{'|'.join(alternatives)})"
+    if end:
+        pattern = f"(?:{pattern})?"
+    return pattern
+
+def compile_phrases(phrases):
+    """
+    Compile normalized, folded phrases into one regex matching any of them
+    on word boundaries, with an optional ending (-s, -es, -d, -ed, -ing)
+    after the last word. Group 1 is the phrase that matched.
+
+    Args:
+        phrases (iterable): Normalized phrases passed through fold_repeats
+
+    Returns:
+        re.Pattern or None: Combined pattern, or None if there are no phrases
+    """
+    trie = {}
+    for phrase in phrases:
+        node = trie
+        for ch in phrase:
+            node = node.setdefault(ch, {})
+        node[""] = True
+
+    pattern = _trie_pattern(trie)
+    if pattern is None:
+        return None
+    return re.compile(rf"\b({pattern}){_PHRASE_SUFFIX}\b")
+
+class SafetyMatcher:
+    """
+    Screens messages against a list of crisis phrases grouped by category.
+
+    The whole phrase list is compiled into a single regex built from a trie
+    of the normalized phrases, so each message is scanned once however many
+    phrases there are. Repeated letters and common word endings are
+    tolerated, so misspellings like "suiccide" and forms like "suicides"
+    still match. The phrase file is checked for changes at most every
+    reload_interval seconds and recompiled without a restart.
+
+    The file also lists example messages that must be flagged. A phrase
+    list that misses any of them is reported and, once a list is active,
+    not loaded, so an edit cannot silently stop catching crisis messages.
+
+    Phrase file format (JSON):
+        {"categories": {"<category>": {"<language>": ["phrase", ...]}},
+         "examples": {"<category>": ["message that must match", ...]}}
+    """
+    def __init__(self, path=DEFAULT_PHRASES_PATH, reload_interval=5.0):
+        self.path = path
+        self.reload_interval = reload_interval
+
+        self._lock = threading.Lock()
+        self._state = _PhraseList(None, {}, {})
+        self._mtime = None
+        self._last_check = 0.0
+
+        self.reload()
+
+    @property
+    def phrase_count(self):
+        return len(self._state.categories)
+
+    def scan(self, text):
+        """
+        Check a message against the phrase list.
+
+        Args:
+            text (str): The message to screen
+
+        Returns:
+            SafetyMatch or None: The first matching category and phrase, if any
+        """
+        self._maybe_reload()
+
+        return self._search(self._state, text)
+
+    @staticmethod
+    def _search(state, text):
+        if state.pattern is None:
+            return None
+
+        match = state.pattern.search(fold_repeats(normalize_text(text)))
+        if match is None:
+            return None
+
+        phrase = state.phrases[match.group(1)]
+        return SafetyMatch(state.categories[phrase], phrase)
+
+    def reload(self):
+        """
+        Load and compile the phrase file, replacing the active list. If the file
+        cannot be read, or its phrases miss one of its examples, the previous
+        list stays active.
+
+        Returns:
+            bool: True if the phrase list was (re)loaded
+        """
+        try:
+            mtime = os.path.getmtime(self.path)
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except Exception as e:
+            logger.error(f"Error loading safety phrases from {self.path}: {str(e)}")
+            return False
+
+        # Normalized phrase -> category; earlier categories win on duplicates
+        categories = {}
+        for category, languages in data.get("categories", {}).items():
+            for phrases in languages.values():
+                for phrase in phrases:
+                    normalized = normalize_text(phrase)
+                    if normalized:
+                        categories.setdefault(normalized, category)
+
+        # Folded phrase -> normalized phrase, for reporting which one matched
+        phrases = {}
+        for phrase in categories:
+            phrases.setdefault(fold_repeats(phrase), phrase)
+
+        state = _PhraseList(compile_phrases(phrases), categories, phrases)
+
+        missed = []
+        for category, examples in data.get("examples", {}).items():
+            for example in examples:
+                match = self._search(state, example)
+                if match is None or match.category != category:
+                    missed.append(example)
+
+        if missed:
+            logger.error(f"Safety phrases in {self.path} miss {len(missed)} of their examples: {missed}")
+            if self._state.pattern is not None:
+                # Keep the previous list until the file changes again
+                self._mtime = mtime
+                return False
+
+        with self._lock:
+            self._state = state
+            self._mtime = mtime
+
+        logger.info(f"Loaded {len(categories)} safety phrases from {self.path}")
+        return True
+
+    def _maybe_reload(self):
+        now = time.monotonic()
+        if now - self._last_check < self.reload_interval:
+            return
+
+        self._last_check = now
+        try:
+            mtime = os.path.getmtime(self.path)
+        except OSError:
+            return
+
+        if mtime != self._mtime:
+            logger.info("Safety phrase file changed, reloading")
+            self.reload()
@@ -1,31 +1,83 @@
 import torch
-from transformers import AutoModelForSequenceClassification, AutoTokenizer
+from transformers import AutoTokenizer
 import logging
 import os
+import time
 import numpy as np
+from inference_backends import (allow_compiled_graphs, backend_device, compile_forward, get_backend,
+                                load_sequence_classifier)
+from utils.cache import InferenceResultCache
+from utils.metrics import stage
 
 logger = logging.getLogger(__name__)
 
+# Longest input, in tokens; longer messages are truncated
+MAX_INPUT_TOKENS = 128
+
+# Padded input lengths compiled inference is specialized to (see enable_compilation)
+DEFAULT_LENGTH_BUCKETS = (16, 32, 64, 128)
+
+# Representative messages run through the model at startup (see warm_up)
+WARMUP_MESSAGES = [
+    "Good morning! I slept well and had a lovely cup of tea.",
+    "I've been feeling a bit lonely since the winter started.",
+    "My daughter is visiting this weekend with the grandchildren.",
+    "The doctor changed my blood pressure medication again and I'm worried about it.",
+]
+
 class SentimentAnalyzer:
     """
     Analyzes the sentiment of text using a BERT-based model.
     """
-    def __init__(self):
+    def __init__(self, backend=None, onnx_dir=None, model_name=None):
+        """
+        Args:
+            backend (str): Inference backend (pytorch, int8 or onnx); defaults to INFERENCE_BACKEND
+            onnx_dir (str): Directory holding the exported ONNX model for the onnx backend
+            model_name (str): Hugging Face model name or local path; defaults to the SST-2 DistilBERT.
+                Models with negative/neutral/positive labels (e.g. a student trained by
+                ml_training/distill_sentiment.py) predict neutral themselves
+        """
         try:
             # Use pre-trained model from Hugging Face instead of local fine-tuned model
-            model_name = "distilbert-base-uncased-finetuned-sst-2-english"
-            logger.info(f"Using pre-trained model from Hugging Face: {model_name}")
+            model_name = model_name or "distilbert-base-uncased-finetuned-sst-2-english"
+            self.backend = get_backend(backend)
+            logger.info(f"Using pre-trained model from Hugging Face: {model_name} (backend: {self.backend})")
             
             # Load the sentiment model
             self.tokenizer = AutoTokenizer.from_pretrained(model_name)
-            self.model = AutoModelForSequenceClassification.from_pretrained(model_name)
+            self.model = load_sequence_classifier(model_name, self.backend, onnx_dir)
             
-            # Move to GPU if available
-            self.device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+            # Move to GPU if available (quantized and ONNX backends run on CPU)
+            self.device = backend_device(self.backend)
             self.model.to(self.device)
             
             # Define emotion labels (based on the model's output)
-            self.labels = ["negative", "positive"]  # This specific model has 2 classes
+            config = self.model.config
+            model_labels = [str(config.id2label[i]).lower() for i in range(config.num_labels)]
+            if sorted(model_labels) == ["negative", "neutral", "positive"]:
+                # Three-label model: neutral is one of its own classes
+                self.labels = model_labels
+                self.output_labels = self.labels
+                self.neutral_index = None
+                post_processing = "native"
+            else:
+                self.labels = ["negative", "positive"]  # This specific model has 2 classes
+                
+                # Labels that can be returned, including the threshold-based neutral class
+                self.output_labels = self.labels + ["neutral"]
+                self.neutral_index = self.output_labels.index("neutral")
+                post_processing = "neutral-0.4-0.6"
+            
+            # Identifies the model and post-processing that produced a cached result
+            self.model_version = f"{model_name}:{self.backend}:{post_processing}"
+            
+            # Optional result cache (see enable_result_cache)
+            self.result_cache = None
+            
+            # Optional compiled forward and the input lengths it is specialized to (see enable_compilation)
+            self.length_buckets = None
+            self._compiled_forward = None
             
             # Fallback emotion words for each category to provide more specific feedback
             self.emotion_words = {
@@ -49,34 +101,186 @@ class SentimentAnalyzer:
         Returns:
             tuple: (sentiment_label, confidence_score)
         """
-        try:
-            # Prepare input
-            inputs = self.tokenizer(text, return_tensors="pt", truncation=True, max_length=128).to(self.device)
-            
-            # Get model prediction
-            with torch.no_grad():
-                outputs = self.model(**inputs)
-                logits = outputs.logits
-                probabilities = torch.nn.functional.softmax(logits, dim=1)
-                
-            # Get predicted class and confidence
-            predicted_class = torch.argmax(probabilities, dim=1).item()
-            confidence = probabilities[0][predicted_class].item()
+        sentiment, confidence = self.analyze_many([text])[0]
+        
+        # The text itself is only logged as a hash (see utils.structured_logging)
+        logger.info("Sentiment analysis -> %s (confidence: %.2f)", sentiment, confidence,
+                    extra={"user_text": text, "sentiment": sentiment})
+        
+        return sentiment, confidence
+    
+    def analyze_many(self, texts, batch_size=32):
+        """
+        Analyze the sentiment of several texts in batches.
+        
+        Texts are sorted by token length so that each batch groups inputs of
+        similar size, and each batch is padded only to its own longest input.
+        
+        Args:
+            texts (list): The texts to analyze
+            batch_size (int): Maximum number of texts per forward pass
             
-            # Get sentiment label
-            sentiment = self.labels[predicted_class]
+        Returns:
+            list: (sentiment_label, confidence_score) for each text, in input order
+        """
+        if not texts:
+            return []
+        
+        try:
+            if self.result_cache is not None:
+                return self.result_cache.get_or_compute_many(
+                    list(texts), lambda missing: self._analyze_batched(missing, batch_size)
+                )
+            return self._analyze_batched(texts, batch_size)
+        except Exception as e:
+            logger.error("Error in sentiment analysis: %s", e)
+            # Fallback to neutral sentiment
+            return [("neutral", 0.33)] * len(texts)
+    
+    def enable_result_cache(self, shared_cache=None, max_entries=10000):
+        """
+        Cache results keyed by a hash of the normalized text and the model version.
+        
+        Args:
+            shared_cache: Optional Flask-Caching instance used as a second tier (e.g. Redis)
+            max_entries (int): Size of the in-process LRU tier
             
-            # If we need a "neutral" category, use confidence thresholds
-            if 0.4 <= confidence <= 0.6:
-                sentiment = "neutral"
+        Returns:
+            InferenceResultCache: The cache now used by analyze and analyze_many
+        """
+        self.result_cache = InferenceResultCache(
+            self.model_version,
+            max_entries=max_entries,
+            shared_cache=shared_cache,
+            namespace="sentiment"
+        )
+        return self.result_cache
+    
+    def enable_compilation(self, length_buckets=DEFAULT_LENGTH_BUCKETS):
+        """
+        Run the model through torch.compile, padding every batch to the
+        nearest of a fixed set of lengths so that only a few graphs are
+        compiled: one per length for single messages, one per length for
+        batches. Compilation is slow, so call warm_up before serving.
+        
+        Args:
+            length_buckets (tuple): Padded input lengths; inputs longer than the
+                largest are truncated to it
+        """
+        self.length_buckets = tuple(sorted({min(int(length), MAX_INPUT_TOKENS) for length in length_buckets}))
+        if self.length_buckets[-1] < MAX_INPUT_TOKENS:
+            self.length_buckets += (MAX_INPUT_TOKENS,)
+        self._compiled_forward = compile_forward(self.model, max_graphs=2 * len(self.length_buckets))
+        logger.info("Compiled sentiment inference for input lengths %s", self.length_buckets)
+    
+    def disable_compilation(self):
+        self.length_buckets = None
+        self._compiled_forward = None
+    
+    def warm_up(self):
+        """
+        Run representative inputs through the tokenizer and model, so kernel
+        initialization, allocator growth and (with enable_compilation) graph
+        compilation happen before the first request. Results are not cached.
+        If compiled inference fails, it is disabled and the eager model used.
+        
+        Returns:
+            float: Seconds spent warming up
+        """
+        start = time.perf_counter()
+        if self._compiled_forward is not None:
+            allow_compiled_graphs()
+        try:
+            self._warm_up_inputs()
+        except Exception as e:
+            if self._compiled_forward is None:
+                raise
+            logger.error("Compiled sentiment inference failed, using the eager model: %s", e)
+            self.disable_compilation()
+            self._warm_up_inputs()
+        
+        elapsed = time.perf_counter() - start
+        logger.info("Sentiment model warmed up in %.1fs", elapsed)
+        return elapsed
+    
+    def _warm_up_inputs(self):
+        self._analyze_batched(WARMUP_MESSAGES, len(WARMUP_MESSAGES))
+        
+        # Every input length at batch sizes 1 and 2 (compiled graphs specialize on single inputs)
+        token_ids = self.tokenizer(" ".join(WARMUP_MESSAGES * 8), truncation=True,
+                                   max_length=MAX_INPUT_TOKENS)["input_ids"]
+        for length in self.length_buckets or DEFAULT_LENGTH_BUCKETS:
+            encoding = token_ids[:length - 1] + token_ids[-1:]
+            self._score_encodings([encoding], 1)
+            self._score_encodings([encoding, encoding], 2)
+    
+    def _analyze_batched(self, texts, batch_size):
+        """
+        Score texts in length-sorted batches. Errors propagate to the caller
+        so that fallback results are never cached.
+        """
+        # Tokenize without padding; padding is applied per batch below
+        with stage("sentiment_tokenize"):
+            encodings = self.tokenizer(list(texts), truncation=True, max_length=MAX_INPUT_TOKENS)["input_ids"]
+        
+        results = self._score_encodings(encodings, batch_size)
+        
+        logger.debug("Sentiment analysis: scored %d texts", len(texts))
+        
+        return results
+    
+    def _score_encodings(self, encodings, batch_size):
+        # Bucket inputs of similar length together
+        order = sorted(range(len(encodings)), key=lambda i: len(encodings[i]))
+        
+        results = [None] * len(encodings)
+        for start in range(0, len(order), batch_size):
+            indices = order[start:start + batch_size]
+            batch = {"input_ids": [encodings[i] for i in indices]}
+            if self.length_buckets is not None:
+                # Pad to a length the compiled graphs were built for
+                longest = len(batch["input_ids"][-1])
+                length = next(bucket for bucket in self.length_buckets if bucket >= longest)
+                inputs = self.tokenizer.pad(batch, padding="max_length", max_length=length, return_tensors="pt")
+            else:
+                inputs = self.tokenizer.pad(batch, return_tensors="pt")
             
-            logger.info(f"Sentiment analysis: '{text}' -> {sentiment} (confidence: {confidence:.2f})")
+            labels, confidences = self._predict(inputs.to(self.device))
             
-            return sentiment, confidence
-        except Exception as e:
-            logger.error(f"Error in sentiment analysis: {str(e)}")
-            # Fallback to neutral sentiment
-            return "neutral", 0.33
+            for i, label, confidence in zip(indices, labels, confidences):
+                results[i] = (self.output_labels[label], confidence)
+        
+        return results
+    
+    def _predict(self, inputs):
+        """
+        Run one padded batch through the model.
+        
+        Returns:
+            tuple: (label indices into output_labels, confidence scores)
+        """
+        # Get model prediction
+        with stage("sentiment_forward"), torch.no_grad():
+            if self._compiled_forward is not None:
+                # One graph per padded length, each shared by every batch size above 1
+                for tensor in inputs.values():
+                    torch._dynamo.mark_static(tensor, 1)
+                    if tensor.shape[0] > 1:
+                        torch._dynamo.mark_dynamic(tensor, 0)
+                logits = self._compiled_forward(**inputs).logits
+            else:
+                logits = self.model(**inputs).logits
+            probabilities = torch.nn.functional.softmax(logits, dim=1)
+        
+        # Get predicted class and confidence
+        confidences, predicted = torch.max(probabilities, dim=1)
+        
+        # If we need a "neutral" category, use confidence thresholds
+        if self.neutral_index is not None:
+            neutral = (confidences >= 0.4) & (confidences <= 0.6)
+            predicted = torch.where(neutral, torch.full_like(predicted, self.neutral_index), predicted)
+        
+        return predicted.tolist(), confidences.tolist()
     
     def get_emotion_word(self, sentiment):
         """
@@ -0,0 +1,237 @@
+import hashlib
+import logging
+import struct
+import threading
+import time
+import uuid
+from array import array
+from collections import OrderedDict, namedtuple
+
+logger = logging.getLogger(__name__)
+
+# One message in a session. token_ids is the model's encoding of the
+# formatted turn ("User: ...\n"), cached so prompts are assembled without
+# re-tokenizing earlier turns; None when it has to be re-encoded from text.
+Turn = namedtuple("Turn", ["sender", "text", "token_ids"])
+
+# Packed turn layout: sender byte, tokenizer fingerprint, text length, token
+# count, UTF-8 text, uint32 token ids
+_TURN_HEADER = struct.Struct("<cQII")
+
+def tokenizer_fingerprint(tokenizer):
+    """
+    A 64-bit fingerprint of a tokenizer's name and vocabulary, stored with
+    persisted token ids so ids from a different tokenizer are never reused.
+    """
+    digest = hashlib.blake2b(digest_size=8)
+    digest.update(str(getattr(tokenizer, "name_or_path", "")).encode("utf-8"))
+    for token, token_id in sorted(tokenizer.get_vocab().items(), key=lambda item: item[1]):
+        digest.update(f"\0{token_id}:{token}".encode("utf-8"))
+    return int.from_bytes(digest.digest(), "little")
+
+def pack_turn(turn, fingerprint=0):
+    """
+    Serialize a turn to bytes, tagging its token ids with the fingerprint of
+    the tokenizer that produced them.
+    """
+    text = turn.text.encode("utf-8")
+    token_ids = array("I", turn.token_ids if turn.token_ids is not None else [])
+    sender = b"u" if turn.sender == "user" else b"b"
+    return _TURN_HEADER.pack(sender, fingerprint, len(text), len(token_ids)) + text + token_ids.tobytes()
+
+def unpack_turn(data, fingerprint=None):
+    """
+    Deserialize a turn packed by pack_turn. Its token ids are dropped (None)
+    unless they were packed with the given tokenizer fingerprint.
+    """
+    sender, packed_fingerprint, text_length, token_count = _TURN_HEADER.unpack_from(data)
+    offset = _TURN_HEADER.size
+    text = data[offset:offset + text_length].decode("utf-8")
+    token_ids = None
+    if fingerprint is not None and packed_fingerprint == fingerprint and token_count:
+        token_ids = array("I")
+        token_ids.frombytes(data[offset + text_length:offset + text_length + token_count * token_ids.itemsize])
+    return Turn("user" if sender == b"u" else "bot", text, token_ids)
+
+class SessionNotFoundError(KeyError):
+    """
+    Raised when a session does not exist or has expired.
+    """
+    pass
+
+class InMemorySessionStore:
+    """
+    Conversation sessions kept in process memory.
+
+    Each session is an append-only log of turns (text plus cached token ids,
+    stored as a compact uint32 array). Sessions expire after ttl_seconds
+    without activity; when there are more than max_sessions, the least
+    recently used ones are dropped first.
+    """
+    def __init__(self, ttl_seconds=3600, max_sessions=10000, max_turns=200):
+        self.ttl_seconds = ttl_seconds
+        self.max_sessions = max_sessions
+        self.max_turns = max_turns
+        # Turns never outlive the process, so their token ids always match
+        # the loaded tokenizer; kept for parity with RedisSessionStore
+        self.tokenizer_fingerprint = None
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"created": 0, "expired": 0, "evicted": 0}
+
+    def create(self, turns=None):
+        """
+        Start a new session, optionally seeded with existing turns.
+
+        Returns:
+            str: The new session ID
+        """
+        session_id = uuid.uuid4().hex
+        with self._lock:
+            self._expire()
+            self._sessions[session_id] = [time.monotonic(), list(turns or [])[-self.max_turns:]]
+            self._stats["created"] += 1
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+                self._stats["evicted"] += 1
+        return session_id
+
+    def get_turns(self, session_id, limit=None):
+        """
+        Get a session's turns, oldest first.
+
+        Args:
+            session_id (str): The session
+            limit (int): Only return the most recent limit turns
+
+        Raises:
+            SessionNotFoundError: If the session does not exist or has expired
+        """
+        with self._lock:
+            turns = self._touch(session_id)[1]
+            return list(turns[-limit:] if limit else turns)
+
+    def append(self, session_id, *turns):
+        """
+        Add turns to the end of a session.
+
+        Raises:
+            SessionNotFoundError: If the session does not exist or has expired
+        """
+        with self._lock:
+            session = self._touch(session_id)
+            session[1].extend(turns)
+            if len(session[1]) > self.max_turns:
+                del session[1][:-self.max_turns]
+
+    def delete(self, session_id):
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["sessions"] = len(self._sessions)
+            stats["turns"] = sum(len(session[1]) for session in self._sessions.values())
+        stats["backend"] = "memory"
+        stats["ttl_seconds"] = self.ttl_seconds
+        return stats
+
+    def _touch(self, session_id):
+        """
+        Look up a live session and mark it as used. Called with the lock held.
+        """
+        self._expire()
+        session = self._sessions.get(session_id)
+        if session is None:
+            raise SessionNotFoundError(session_id)
+        session[0] = time.monotonic()
+        self._sessions.move_to_end(session_id)
+        return session
+
+    def _expire(self):
+        # Sessions are ordered by last use, so expired ones are at the front
+        cutoff = time.monotonic() - self.ttl_seconds
+        while self._sessions:
+            session_id, session = next(iter(self._sessions.items()))
+            if session[0] > cutoff:
+                break
+            del self._sessions[session_id]
+            self._stats["expired"] += 1
+
+class RedisSessionStore:
+    """
+    Conversation sessions kept in Redis, shared by every serving process.
+
+    Each session is a Redis list of packed turns plus a marker key, both
+    expiring after ttl_seconds without activity.
+
+    Sessions outlive the process, so turns are packed with the fingerprint
+    of the chat tokenizer (set tokenizer_fingerprint once it is loaded).
+    Turns read back under a different tokenizer, e.g. after CHAT_MODEL_NAME
+    changes, have no token ids and are re-encoded from their text.
+    """
+    def __init__(self, redis_url, ttl_seconds=3600, max_turns=200, prefix="chat-session"):
+        import redis
+
+        self.client = redis.Redis.from_url(redis_url)
+        self.ttl_seconds = ttl_seconds
+        self.max_turns = max_turns
+        self.prefix = prefix
+        self.tokenizer_fingerprint = None
+
+    def create(self, turns=None):
+        session_id = uuid.uuid4().hex
+        marker, turns_key = self._keys(session_id)
+        pipeline = self.client.pipeline()
+        pipeline.set(marker, int(time.time()), ex=self.ttl_seconds)
+        if turns:
+            pipeline.rpush(turns_key, *[pack_turn(turn, self._fingerprint()) for turn in list(turns)[-self.max_turns:]])
+            pipeline.expire(turns_key, self.ttl_seconds)
+        pipeline.execute()
+        return session_id
+
+    def get_turns(self, session_id, limit=None):
+        marker, turns_key = self._keys(session_id)
+        pipeline = self.client.pipeline()
+        pipeline.expire(marker, self.ttl_seconds)
+        pipeline.expire(turns_key, self.ttl_seconds)
+        pipeline.lrange(turns_key, -limit if limit else 0, -1)
+        exists, _, packed = pipeline.execute()
+        if not exists:
+            raise SessionNotFoundError(session_id)
+        return [unpack_turn(data, self.tokenizer_fingerprint) for data in packed]
+
+    def append(self, session_id, *turns):
+        marker, turns_key = self._keys(session_id)
+        if not self.client.expire(marker, self.ttl_seconds):
+            raise SessionNotFoundError(session_id)
+
+        pipeline = self.client.pipeline()
+        pipeline.rpush(turns_key, *[pack_turn(turn, self._fingerprint()) for turn in turns])
+        pipeline.ltrim(turns_key, -self.max_turns, -1)
+        pipeline.expire(turns_key, self.ttl_seconds)
+        pipeline.execute()
+
+    def delete(self, session_id):
+        self.client.delete(*self._keys(session_id))
+
+    def get_stats(self):
+        return {"backend": "redis", "ttl_seconds": self.ttl_seconds}
+
+    def _fingerprint(self):
+        return self.tokenizer_fingerprint or 0
+
+    def _keys(self, session_id):
+        return f"{self.prefix}:{session_id}", f"{self.prefix}:{session_id}:turns"
+
+def create_session_store(redis_url=None, ttl_seconds=3600, max_sessions=10000):
+    """
+    Build the session store: Redis when a URL is given, otherwise in memory.
+    """
+    if redis_url:
+        logger.info("Using Redis for conversation sessions")
+        return RedisSessionStore(redis_url, ttl_seconds=ttl_seconds)
+
+    logger.info("Using in-memory conversation sessions")
+    return InMemorySessionStore(ttl_seconds=ttl_seconds, max_sessions=max_sessions)
@@ -0,0 +1,241 @@
+import logging
+import threading
+import time
+import torch
+from transformers import (
+    DynamicCache,
+    LogitsProcessorList,
+    NoRepeatNGramLogitsProcessor,
+    TemperatureLogitsWarper,
+    TopKLogitsWarper,
+    TopPLogitsWarper,
+)
+from utils.metrics import (
+    DECODE_THROUGHPUT,
+    GENERATED_TOKENS,
+    SPECULATIVE_ACCEPTED,
+    SPECULATIVE_DRAFTED,
+    STAGE_LATENCY,
+)
+
+logger = logging.getLogger(__name__)
+
+def build_logits_processors(generation_kwargs):
+    """
+    The logits processors and warpers generate() applies for the given
+    sampling settings, in the same order.
+    """
+    processors = LogitsProcessorList()
+    if generation_kwargs.get("no_repeat_ngram_size"):
+        processors.append(NoRepeatNGramLogitsProcessor(generation_kwargs["no_repeat_ngram_size"]))
+
+    if generation_kwargs.get("do_sample"):
+        temperature = generation_kwargs.get("temperature", 1.0)
+        if temperature and temperature != 1.0:
+            processors.append(TemperatureLogitsWarper(temperature))
+        if generation_kwargs.get("top_k"):
+            processors.append(TopKLogitsWarper(generation_kwargs["top_k"]))
+        if generation_kwargs.get("top_p", 1.0) < 1.0:
+            processors.append(TopPLogitsWarper(generation_kwargs["top_p"]))
+
+    return processors
+
+class SpeculativeOutput:
+    """
+    Result of SpeculativeDecoder.generate, shaped like generate()'s output
+    with return_dict_in_generate=True.
+    """
+    def __init__(self, sequences, past_key_values):
+        self.sequences = sequences
+        self.past_key_values = past_key_values
+
+class SpeculativeDecoder:
+    """
+    Speculative decoding with a small draft model proposing tokens for a
+    larger target model that shares its tokenizer (e.g. DialoGPT-small for
+    DialoGPT-medium).
+
+    Each round the draft model samples num_draft_tokens tokens one at a
+    time, then the target model scores all of them in a single forward pass.
+    Drafted tokens are accepted with probability min(1, p/q) (p, q: target
+    and draft probabilities after the same logits processors), and the first
+    rejected one is resampled from the residual distribution, so the output
+    follows the target model's sampling distribution exactly. With greedy
+    settings a drafted token is accepted when it matches the target's choice.
+
+    Single sequence only; the draft cache is private to each call.
+    """
+    def __init__(self, target_model, draft_model, generation_kwargs, num_draft_tokens=4):
+        self.target_model = target_model
+        self.draft_model = draft_model
+        self.generation_kwargs = dict(generation_kwargs)
+        self.num_draft_tokens = max(1, int(num_draft_tokens))
+        self.do_sample = bool(self.generation_kwargs.get("do_sample"))
+        self.logits_processors = build_logits_processors(self.generation_kwargs)
+
+        self._lock = threading.Lock()
+        self._stats = {"calls": 0, "rounds": 0, "drafted": 0, "accepted": 0, "tokens": 0, "seconds": 0.0}
+
+    def generate(self, input_ids, max_new_tokens, eos_token_id=None, past_key_values=None, streamer=None,
+                 stop_event=None, stopping_criteria=None):
+        """
+        Generate up to max_new_tokens tokens after input_ids.
+
+        Args:
+            input_ids (torch.Tensor): Prompt of shape (1, seq_len)
+            max_new_tokens (int): Generation budget
+            eos_token_id (int): Stop after this token
+            past_key_values: Optional target model cache for a prefix of input_ids
+            streamer: Optional streamer receiving tokens as they are accepted
+            stop_event (threading.Event): Optional event stopping generation between rounds
+            stopping_criteria: Optional StoppingCriteria checked on the sequence after each round
+
+        Returns:
+            SpeculativeOutput: Prompt plus generated tokens, and the target model cache
+        """
+        start = time.perf_counter()
+        first_token_time = None
+
+        sequence = input_ids
+        prompt_length = input_ids.shape[1]
+        target_cache = past_key_values if past_key_values is not None else DynamicCache()
+        draft_cache = DynamicCache()
+        drafted = accepted = rounds = 0
+
+        if streamer is not None:
+            streamer.put(input_ids.cpu())
+
+        with torch.no_grad():
+            while sequence.shape[1] - prompt_length < max_new_tokens:
+                if stop_event is not None and stop_event.is_set():
+                    break
+
+                # Always leave room for the token the target model adds itself
+                remaining = max_new_tokens - (sequence.shape[1] - prompt_length)
+                num_draft = min(self.num_draft_tokens, remaining - 1)
+
+                candidates, draft_probs = self._draft(sequence, draft_cache, num_draft)
+                new_tokens, num_accepted = self._verify(sequence, candidates, draft_probs, target_cache)
+
+                rounds += 1
+                drafted += num_draft
+                accepted += num_accepted
+
+                # Keep only cache entries for tokens that are now part of the sequence
+                kept_length = sequence.shape[1] + num_accepted
+                for cache in (target_cache, draft_cache):
+                    excess = cache.get_seq_length() - kept_length
+                    if excess > 0:
+                        cache.crop(-excess)
+
+                new_token_list = new_tokens[0].tolist()
+                finished = eos_token_id is not None and eos_token_id in new_token_list
+                if finished:
+                    new_tokens = new_tokens[:, :new_token_list.index(eos_token_id) + 1]
+
+                sequence = torch.cat([sequence, new_tokens], dim=1)
+                if streamer is not None:
+                    streamer.put(new_tokens[0].cpu())
+                if first_token_time is None:
+                    first_token_time = time.perf_counter()
+                if stopping_criteria is not None and bool(stopping_criteria(sequence, None).all()):
+                    break
+                if finished:
+                    break
+
+        if streamer is not None:
+            streamer.end()
+
+        self._record(start, first_token_time or time.perf_counter(), sequence.shape[1] - prompt_length,
+                     rounds, drafted, accepted)
+        return SpeculativeOutput(sequence, target_cache)
+
+    def get_stats(self):
+        """
+        Acceptance rate and throughput over every call so far.
+        """
+        with self._lock:
+            stats = dict(self._stats)
+        stats["num_draft_tokens"] = self.num_draft_tokens
+        stats["acceptance_rate"] = stats["accepted"] / stats["drafted"] if stats["drafted"] else 0.0
+        stats["tokens_per_round"] = stats["tokens"] / stats["rounds"] if stats["rounds"] else 0.0
+        stats["tokens_per_second"] = stats["tokens"] / stats["seconds"] if stats["seconds"] else 0.0
+        return stats
+
+    def _draft(self, sequence, draft_cache, num_draft):
+        """
+        Sample num_draft tokens from the draft model.
+
+        Returns:
+            tuple: (sequence plus drafted tokens, draft probabilities for each drafted token)
+        """
+        candidates = sequence
+        draft_probs = []
+        for _ in range(num_draft):
+            new_input = candidates[:, draft_cache.get_seq_length():]
+            logits = self.draft_model(new_input, past_key_values=draft_cache, use_cache=True).logits[:, -1, :]
+            probs = self._probabilities(candidates, logits)
+            token = torch.multinomial(probs, 1) if self.do_sample else probs.argmax(dim=-1, keepdim=True)
+            draft_probs.append(probs)
+            candidates = torch.cat([candidates, token], dim=1)
+        return candidates, draft_probs
+
+    def _verify(self, sequence, candidates, draft_probs, target_cache):
+        """
+        Score the drafted tokens with the target model and decide how many to keep.
+
+        Returns:
+            tuple: (accepted tokens plus one token sampled from the target, number accepted)
+        """
+        start = sequence.shape[1]
+        new_input = candidates[:, target_cache.get_seq_length():]
+        logits = self.target_model(new_input, past_key_values=target_cache, use_cache=True).logits
+
+        # Logits predicting each drafted token, plus one for the token after them
+        offset = logits.shape[1] - (candidates.shape[1] - start) - 1
+
+        for i, q in enumerate(draft_probs):
+            p = self._probabilities(candidates[:, :start + i], logits[:, offset + i, :])
+            token = candidates[0, start + i]
+
+            if self.do_sample:
+                if torch.rand(1).item() < min(1.0, (p[0, token] / q[0, token]).item()):
+                    continue
+                # Rejected: resample from where the target puts more mass than the draft
+                residual = torch.clamp(p - q, min=0)
+                residual = residual if residual.sum() > 0 else p
+                replacement = torch.multinomial(residual / residual.sum(), 1)
+            else:
+                replacement = p.argmax(dim=-1, keepdim=True)
+                if replacement.item() == token.item():
+                    continue
+
+            return torch.cat([candidates[:, start:start + i], replacement], dim=1), i
+
+        # Every drafted token was accepted; the target adds one more
+        num_draft = len(draft_probs)
+        p = self._probabilities(candidates, logits[:, offset + num_draft, :])
+        bonus = torch.multinomial(p, 1) if self.do_sample else p.argmax(dim=-1, keepdim=True)
+        return torch.cat([candidates[:, start:], bonus], dim=1), num_draft
+
+    def _probabilities(self, input_ids, logits):
+        scores = self.logits_processors(input_ids, logits.float())
+        return torch.softmax(scores, dim=-1)
+
+    def _record(self, start, first_token_time, tokens, rounds, drafted, accepted):
+        end = time.perf_counter()
+        STAGE_LATENCY.observe(first_token_time - start, stage="generate_prefill")
+        STAGE_LATENCY.observe(end - first_token_time, stage="generate_decode")
+        GENERATED_TOKENS.inc(tokens)
+        SPECULATIVE_DRAFTED.inc(drafted)
+        SPECULATIVE_ACCEPTED.inc(accepted)
+        if tokens > 1 and end > first_token_time:
+            DECODE_THROUGHPUT.observe((tokens - 1) / (end - first_token_time))
+
+        with self._lock:
+            self._stats["calls"] += 1
+            self._stats["rounds"] += rounds
+            self._stats["drafted"] += drafted
+            self._stats["accepted"] += accepted
+            self._stats["tokens"] += tokens
+            self._stats["seconds"] += end - start
@@ -0,0 +1,90 @@
+import re
+import torch
+from transformers import StoppingCriteria
+
+class StreamingResponseCleaner:
+    """
+    Applies the response display rules incrementally while tokens stream in.
+
+    Whitespace is collapsed as text arrives, and the sentence-based length
+    cap from ConversationManager._clean_response is tracked on the fly. Once
+    the sentence currently being generated can no longer fit under the cap,
+    the cleaner is marked as capped so generation can stop early.
+    """
+    def __init__(self, max_chars=200):
+        self.max_chars = max_chars
+        self.capped = False
+        self._raw = ""
+        self._emitted = ""
+        self._kept_sentences = []
+
+    @property
+    def raw_text(self):
+        return self._raw
+
+    def feed(self, chunk):
+        """
+        Add newly decoded text.
+
+        Args:
+            chunk (str): Text decoded since the last call
+
+        Returns:
+            str: Whitespace-normalized text to send to the client (may be empty)
+        """
+        if self.capped:
+            return ""
+
+        self._raw += chunk
+        text = re.sub(r'\s+', ' ', self._raw).strip()
+
+        # Same sentence packing as _clean_response; the last sentence is still
+        # being generated and only grows, so once it overflows it never fits
+        sentences = re.split(r'(?<=[.!?])\s+', text)
+        kept = []
+        current_length = 0
+        for sentence in sentences:
+            if current_length + len(sentence) <= self.max_chars:
+                kept.append(sentence)
+                current_length += len(sentence) + 1  # +1 for space
+            else:
+                self.capped = True
+                break
+
+        if self.capped:
+            self._kept_sentences = kept
+            return ""
+
+        delta = text[len(self._emitted):]
+        self._emitted = text
+        return delta
+
+    def capped_response(self):
+        """
+        The final response when generation was stopped at the length cap:
+        every complete sentence that fits under the cap.
+        """
+        return ' '.join(self._kept_sentences)
+
+class EventStoppingCriteria(StoppingCriteria):
+    """
+    Stops generation as soon as the given threading.Event is set.
+    """
+    def __init__(self, event):
+        self.event = event
+
+    def __call__(self, input_ids, scores, **kwargs):
+        return torch.full((input_ids.shape[0],), self.event.is_set(), dtype=torch.bool, device=input_ids.device)
+
+class CancellationStoppingCriteria(StoppingCriteria):
+    """
+    Stops each row of a (batched) generate call once that request's cancel
+    event is set, e.g. because its client disconnected. Rows without an event
+    run to completion; generate returns once every row has stopped.
+    """
+    def __init__(self, events):
+        self.events = list(events)
+
+    def __call__(self, input_ids, scores, **kwargs):
+        cancelled = [event is not None and event.is_set() for event in self.events]
+        return torch.tensor(cancelled, dtype=torch.bool, device=input_ids.device)
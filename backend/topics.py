@@ -0,0 +1,387 @@
+import hashlib
+import json
+import logging
+import math
+import os
+import re
+import tempfile
+import threading
+import time
+from collections import Counter, OrderedDict, namedtuple
+from functools import lru_cache
+import numpy as np
+from utils.metrics import CACHE_EVENTS
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CATALOG_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "topics.json")
+
+# Bump when the embedding changes, so persisted matrices are rebuilt
+EMBEDDING_VERSION = 1
+
+MOODS = ("positive", "neutral", "negative")
+
+# One entry of the topic catalog
+Topic = namedtuple("Topic", ["text", "category", "moods", "keywords"])
+
+_STOPWORDS = frozenset("""
+    a about all am an and any are as at be been but by can could did do does for from had has have
+    how i if im in into is it its just like me my of on or our so some than that the their them then
+    there these they this to too up us was we were what when where which who why will with would you
+    your yours youd youve ive ill dont he she him her his bit lately really very much quite get got
+""".split())
+
+_WORD = re.compile(r"[^\W_]+")
+
+def tokenize(text):
+    """
+    Lowercase content words of a message, with common suffixes stripped so
+    "birds", "walking" and "visited" match "bird", "walk" and "visit".
+    """
+    words = []
+    for word in _WORD.findall(text.casefold()):
+        if word in _STOPWORDS or len(word) < 2:
+            continue
+        if len(word) > 5 and word.endswith("ing"):
+            word = word[:-3]
+        elif len(word) > 4 and word.endswith("ed"):
+            word = word[:-2]
+        elif len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+            word = word[:-1]
+        if len(word) > 3 and word.endswith("e"):
+            # "bake", "baked" and "baking" all become "bak"
+            word = word[:-1]
+        words.append(word)
+    return words
+
+def text_features(text):
+    """
+    Count a text's words and pairs of adjacent words.
+    """
+    words = tokenize(text)
+    return Counter(words + [f"{first} {second}" for first, second in zip(words, words[1:])])
+
+@lru_cache(maxsize=65536)
+def feature_projection(feature, dim, hashes=4):
+    """
+    Map a feature to a few signed buckets of a dim-wide vector. Spreading each
+    feature over several buckets keeps two features that share one bucket
+    from looking identical, unlike hashing each to a single bucket.
+
+    Returns:
+        tuple: (bucket indices, signs) as numpy arrays
+    """
+    digest = hashlib.blake2b(feature.encode("utf-8"), digest_size=4 * hashes).digest()
+    values = np.frombuffer(digest, dtype="<u4").astype(np.int64)
+    signs = np.where(values & 1, 1.0, -1.0).astype(np.float32) / np.float32(np.sqrt(hashes))
+    return (values >> 1) % dim, signs
+
+def load_catalog(path):
+    """
+    Read a topic catalog.
+
+    Catalog file format (JSON):
+        {"categories": {"<category>": {"moods": [...], "keywords": [...], "topics": ["...", ...]}}}
+
+    moods lists the sentiments the category's topics suit; keywords are
+    extra words the topics are matched on.
+
+    Returns:
+        list: Topic per catalog entry, in file order
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+
+    topics = []
+    for category, entry in data.get("categories", {}).items():
+        moods = tuple(mood for mood in entry.get("moods", MOODS) if mood in MOODS)
+        keywords = tuple(entry.get("keywords", ()))
+        topics.extend(Topic(text, category, moods, keywords) for text in entry.get("topics", ()))
+    return topics
+
+class TopicEngine:
+    """
+    Picks conversation topics that fit a user's recent messages and mood,
+    from a catalog of hundreds (or many thousands) of curated topics, without
+    running a model per request.
+
+    Every topic (its text, category and keywords) is embedded once as an
+    IDF-weighted bag of words and pairs of words, projected into dim
+    dimensions by hashing (see feature_projection). The L2-normalized matrix
+    and the IDF weights are saved under index_dir and the matrix is
+    memory-mapped, so restarts and every serving process share one copy. A new or edited
+    catalog gets a new file (the name includes a fingerprint of the catalog).
+
+    A request embeds the user's recent messages the same way (newer messages
+    weigh more), scores the whole catalog with one matrix-vector product,
+    boosts topics suited to the current sentiment and re-ranks the best
+    candidates with maximal marginal relevance, so the suggestions are
+    relevant but not four variations of one topic. Topics the user has just
+    sent are left out. With no messages yet, suggestions are a varied sample
+    suited to the mood.
+
+    Results are cached per user (one entry each, LRU beyond cache_size,
+    expiring after cache_ttl_seconds) and reused until their messages or
+    sentiment change.
+    """
+    def __init__(self, path=DEFAULT_CATALOG_PATH, index_dir=None, dim=512, keyword_weight=0.5, mood_weight=0.05,
+                 diversity=0.1, candidates=64, recent_messages=6, recency_decay=0.6, jitter=0.05, cache_size=10000,
+                 cache_ttl_seconds=300):
+        self.path = path
+        self.index_dir = index_dir
+        self.dim = int(dim)
+        self.keyword_weight = keyword_weight
+        self.mood_weight = mood_weight
+        self.diversity = diversity
+        self.candidates = max(1, int(candidates))
+        self.recent_messages = max(1, int(recent_messages))
+        self.recency_decay = recency_decay
+        self.jitter = jitter
+        self.cache_size = max(1, int(cache_size))
+        self.cache_ttl_seconds = cache_ttl_seconds
+
+        self.topics = load_catalog(path)
+        self.texts = [topic.text for topic in self.topics]
+        self._rows_by_words = {" ".join(_WORD.findall(text.casefold())): row for row, text in enumerate(self.texts)}
+        self._mood_masks = {
+            mood: np.array([mood in topic.moods for topic in self.topics], dtype=np.float32) for mood in MOODS
+        }
+
+        self.fingerprint = self._fingerprint()
+        self.matrix, self.idf, self.index_path = self._load_index()
+
+        # user key -> (context fingerprint, topics, created_at)
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self._rng = np.random.default_rng()
+        self._stats = {"suggestions": 0, "hits": 0, "misses": 0, "expired": 0, "evictions": 0}
+
+    def embed(self, texts, weights=None):
+        """
+        Embed texts into one L2-normalized query vector.
+
+        Args:
+            texts (list): Messages to combine
+            weights (list): Weight per message (default equal)
+
+        Returns:
+            numpy.ndarray: (dim,) float32 vector, all zeros if no text has content words
+        """
+        query = np.zeros(self.dim, dtype=np.float32)
+        for text, weight in zip(texts, weights or [1.0] * len(texts)):
+            vector = self._weighted_vector(text_features(text))
+            norm = np.linalg.norm(vector)
+            if norm:
+                query += weight * vector / norm
+
+        norm = np.linalg.norm(query)
+        return query / norm if norm else query
+
+    def suggest(self, messages=(), sentiment=None, count=4, user_key=None):
+        """
+        Suggest topics for a conversation.
+
+        Args:
+            messages (list): The user's messages so far, oldest first
+            sentiment (str): Sentiment of the latest message, one of MOODS
+            count (int): Number of topics to return
+            user_key (str): Identifies the user (e.g. the session id) for
+                caching; None skips the cache
+
+        Returns:
+            list: Topic texts, best first
+        """
+        messages = [message for message in messages if message and message.strip()][-self.recent_messages:]
+        sentiment = sentiment if sentiment in MOODS else None
+        count = max(1, min(int(count), len(self.topics)))
+
+        context = None
+        if user_key is not None:
+            context = hashlib.sha256("\0".join([sentiment or "", str(count)] + messages).encode("utf-8")).hexdigest()
+            cached = self._cache_get(user_key, context)
+            if cached is not None:
+                return cached
+
+        weights = [self.recency_decay ** age for age in range(len(messages) - 1, -1, -1)]
+        scores = self.matrix @ self.embed(messages, weights)
+        if sentiment is not None:
+            scores += self.mood_weight * self._mood_masks[sentiment]
+        if self.jitter:
+            scores += self._rng.uniform(0.0, self.jitter, size=scores.shape[0]).astype(np.float32)
+
+        # Don't suggest what the user has just said (e.g. a topic they picked)
+        for message in messages:
+            row = self._rows_by_words.get(" ".join(_WORD.findall(message.casefold())))
+            if row is not None:
+                scores[row] = -np.inf
+
+        selected = [self.texts[row] for row in self._rerank(scores, count)]
+        with self._lock:
+            self._stats["suggestions"] += 1
+        if user_key is not None:
+            self._cache_put(user_key, context, selected)
+        return selected
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+
+    def get_stats(self):
+        """
+        Catalog size, index location and per-user cache counters.
+        """
+        with self._lock:
+            stats = dict(self._stats)
+            stats["cached_users"] = len(self._cache)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+        stats["topics"] = len(self.topics)
+        stats["categories"] = len({topic.category for topic in self.topics})
+        stats["dim"] = self.dim
+        stats["fingerprint"] = self.fingerprint
+        stats["index_path"] = self.index_path
+        stats["memory_mapped"] = isinstance(self.matrix, np.memmap)
+        stats["cache_size"] = self.cache_size
+        stats["cache_ttl_seconds"] = self.cache_ttl_seconds
+        return stats
+
+    def _rerank(self, scores, count):
+        """
+        Maximal marginal relevance over the top candidates: each pick trades
+        its score against its similarity to the topics already picked.
+        """
+        size = min(len(scores), max(self.candidates, count))
+        candidates = np.sort(np.argpartition(-scores, size - 1)[:size])
+        candidates = candidates[np.isfinite(scores[candidates])]
+        candidate_scores = scores[candidates]
+        vectors = np.asarray(self.matrix[candidates])
+        similarity = vectors @ vectors.T
+
+        selected = []
+        redundancy = np.full(len(candidates), -np.inf, dtype=np.float32)
+        for _ in range(min(count, len(candidates))):
+            if selected:
+                value = (1.0 - self.diversity) * candidate_scores - self.diversity * redundancy
+            else:
+                value = candidate_scores.copy()
+            value[selected] = -np.inf
+            best = int(np.argmax(value))
+            selected.append(best)
+            redundancy = np.maximum(redundancy, np.maximum(similarity[best], 0.0))
+        return [int(candidates[index]) for index in selected]
+
+    def _weighted_vector(self, features):
+        # Features the catalog never uses can't match any topic and are skipped
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for feature, count in features.items():
+            idf = self.idf.get(feature)
+            if idf is not None:
+                buckets, signs = feature_projection(feature, self.dim)
+                np.add.at(vector, buckets, signs * ((1.0 + np.log(count)) * idf))
+        return vector
+
+    def _fingerprint(self):
+        digest = hashlib.sha256(f"v{EMBEDDING_VERSION}:{self.dim}:{self.keyword_weight}".encode("utf-8"))
+        with open(self.path, "rb") as f:
+            digest.update(f.read())
+        return digest.hexdigest()[:16]
+
+    def _load_index(self):
+        """
+        Memory-map the persisted topic matrix for this catalog, building and
+        saving it first if there is none. Falls back to an in-memory matrix if
+        index_dir is unset or not writable.
+        """
+        if self.index_dir:
+            matrix_path = os.path.join(self.index_dir, f"topics-{self.fingerprint}.npy")
+            idf_path = os.path.join(self.index_dir, f"topics-{self.fingerprint}.idf.json")
+            if os.path.exists(matrix_path) and os.path.exists(idf_path):
+                logger.info("Memory-mapping topic index %s", matrix_path)
+                with open(idf_path, "r", encoding="utf-8") as f:
+                    return np.load(matrix_path, mmap_mode="r"), json.load(f), matrix_path
+
+        start = time.perf_counter()
+        matrix, idf = self._build_index()
+        logger.info("Embedded %d topics in %.2fs", len(self.topics), time.perf_counter() - start)
+
+        if not self.index_dir:
+            return matrix, idf, None
+        try:
+            os.makedirs(self.index_dir, exist_ok=True)
+            # Write then rename, so processes starting together never load a
+            # partial file. mkstemp creates files as 0600; open them up so
+            # serving processes running as another user can map them too
+            fd, tmp_path = tempfile.mkstemp(dir=self.index_dir, suffix=".json")
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(idf, f, ensure_ascii=False)
+            os.chmod(tmp_path, 0o644)
+            os.replace(tmp_path, idf_path)
+            fd, tmp_path = tempfile.mkstemp(dir=self.index_dir, suffix=".npy")
+            with os.fdopen(fd, "wb") as f:
+                np.save(f, matrix)
+            os.chmod(tmp_path, 0o644)
+            os.replace(tmp_path, matrix_path)
+        except OSError as e:
+            logger.warning("Could not save topic index to %s, keeping it in memory: %s", self.index_dir, e)
+            return matrix, idf, None
+        return np.load(matrix_path, mmap_mode="r"), idf, matrix_path
+
+    def _build_index(self):
+        # A topic's own words, and its category name and keywords, which
+        # every topic in the category shares and so count for less
+        rows = [(text_features(topic.text), text_features(" ".join((topic.category.replace("_", " "),) + topic.keywords)))
+                for topic in self.topics]
+
+        document_frequency = Counter()
+        for features, shared in rows:
+            document_frequency.update(set(features) | set(shared))
+        self.idf = {feature: math.log((1.0 + len(rows)) / (1.0 + count)) + 1.0
+                    for feature, count in document_frequency.items()}
+
+        # Weight every (topic, feature) pair, then project them all and
+        # scatter them into the matrix in one call
+        feature_ids = {}
+        row_indices, pair_features, weights = [], [], []
+        for row, (features, shared) in enumerate(rows):
+            for counts, scale in ((features, 1.0), (shared, self.keyword_weight)):
+                for feature, count in counts.items():
+                    row_indices.append(row)
+                    pair_features.append(feature_ids.setdefault(feature, len(feature_ids)))
+                    weights.append(scale * (1.0 + math.log(count)) * self.idf[feature])
+
+        matrix = np.zeros((len(rows), self.dim), dtype=np.float32)
+        if feature_ids:
+            projections = [feature_projection(feature, self.dim) for feature in feature_ids]
+            buckets = np.stack([feature_buckets for feature_buckets, _ in projections])[pair_features]
+            signs = np.stack([feature_signs for _, feature_signs in projections])[pair_features]
+            rows_per_bucket = np.repeat(np.array(row_indices), buckets.shape[1])
+            np.add.at(matrix, (rows_per_bucket, buckets.ravel()),
+                      (signs * np.array(weights, dtype=np.float32)[:, None]).ravel())
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        matrix /= np.where(norms > 0, norms, 1.0)
+        return matrix, self.idf
+
+    def _cache_get(self, user_key, context):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._cache.get(user_key)
+            if entry is not None and self.cache_ttl_seconds and now - entry[2] >= self.cache_ttl_seconds:
+                del self._cache[user_key]
+                self._stats["expired"] += 1
+                entry = None
+            if entry is None or entry[0] != context:
+                self._stats["misses"] += 1
+                CACHE_EVENTS.inc(cache="topics", result="miss")
+                return None
+            self._cache.move_to_end(user_key)
+            self._stats["hits"] += 1
+        CACHE_EVENTS.inc(cache="topics", result="hit")
+        return list(entry[1])
+
+    def _cache_put(self, user_key, context, selected):
+        with self._lock:
+            self._cache[user_key] = (context, list(selected), time.monotonic())
+            self._cache.move_to_end(user_key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+                self._stats["evictions"] += 1
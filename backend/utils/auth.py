@@ -0,0 +1,41 @@
+import hmac
+import os
+from functools import wraps
+from flask import jsonify, request
+
+# Header carrying the admin token (an "Authorization: Bearer <token>" header works too)
+ADMIN_TOKEN_HEADER = "X-Admin-Token"
+
+def is_admin(headers):
+    """
+    Check request headers for the admin token set in ADMIN_TOKEN. Always
+    False when ADMIN_TOKEN is unset, so admin features stay off by default.
+
+    Args:
+        headers: Case-insensitive request headers (Flask or Starlette)
+
+    Returns:
+        bool: True if the request carries the admin token
+    """
+    token = os.environ.get('ADMIN_TOKEN')
+    if not token:
+        return False
+
+    provided = headers.get(ADMIN_TOKEN_HEADER)
+    if provided is None:
+        authorization = headers.get("Authorization", "")
+        if not authorization.startswith("Bearer "):
+            return False
+        provided = authorization[len("Bearer "):]
+    return hmac.compare_digest(provided.encode("utf-8"), token.encode("utf-8"))
+
+def admin_required(f):
+    """
+    Decorator answering 401 for Flask requests without the admin token.
+    """
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        if not is_admin(request.headers):
+            return jsonify({"error": "Admin token required"}), 401
+        return f(*args, **kwargs)
+    return decorated_function
@@ -1,5 +1,12 @@
 from flask_caching import Cache
+from array import array
+from collections import OrderedDict
+from concurrent.futures import Future
+import hashlib
 import logging
+import threading
+import unicodedata
+from utils.metrics import CACHE_EVENTS
 
 logger = logging.getLogger(__name__)
 
@@ -33,4 +40,206 @@ def setup_cache(app):
     
     logger.info(f"Cache initialized with type: {cache_config['CACHE_TYPE']}")
     
-    return cache
\ No newline at end of file
+    return cache
+
+class InferenceResultCache:
+    """
+    Cache for deterministic model outputs keyed by a hash of the normalized
+    full input and the model version.
+    
+    A bounded in-process LRU tier sits in front of an optional shared tier
+    (the Flask-Caching instance from setup_cache, e.g. Redis). Concurrent
+    lookups for the same key are single-flighted: only one caller computes
+    the result while the others wait for it.
+    """
+    def __init__(self, model_version, max_entries=10000, shared_cache=None, shared_timeout=0, namespace="inference"):
+        self.model_version = model_version
+        self.max_entries = max_entries
+        self.shared_cache = shared_cache
+        self.shared_timeout = shared_timeout  # 0 = no expiry; outputs are deterministic
+        self.namespace = namespace
+        
+        self._entries = OrderedDict()
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self._stats = {"local_hits": 0, "shared_hits": 0, "misses": 0, "coalesced": 0, "evictions": 0}
+    
+    @staticmethod
+    def normalize(text):
+        """
+        Normalize text so equivalent inputs share a key: Unicode NFC and
+        collapsed whitespace.
+        """
+        return " ".join(unicodedata.normalize("NFC", text).split())
+    
+    def make_key(self, text):
+        digest = hashlib.sha256(f"{self.model_version}\0{self.normalize(text)}".encode("utf-8")).hexdigest()
+        return f"{self.namespace}:{digest}"
+    
+    def get_or_compute_many(self, texts, compute_many):
+        """
+        Look up results for several texts, computing only the missing ones.
+        
+        Args:
+            texts (list): Inputs to look up
+            compute_many (callable): Computes results for a list of texts, in order
+            
+        Returns:
+            list: One result per input text, in input order
+        """
+        keys = [self.make_key(text) for text in texts]
+        results = {}
+        owned = {}     # key -> (text, future) this call must compute
+        waiting = {}   # key -> future computed by another caller
+        
+        with self._lock:
+            for key, text in zip(keys, texts):
+                if key in results or key in owned or key in waiting:
+                    continue
+                if key in self._entries:
+                    self._entries.move_to_end(key)
+                    results[key] = self._entries[key]
+                    self._stats["local_hits"] += 1
+                    CACHE_EVENTS.inc(cache=self.namespace, result="hit")
+                elif key in self._inflight:
+                    waiting[key] = self._inflight[key]
+                    self._stats["coalesced"] += 1
+                    CACHE_EVENTS.inc(cache=self.namespace, result="coalesced")
+                else:
+                    owned[key] = (text, Future())
+                    self._inflight[key] = owned[key][1]
+        
+        try:
+            # Second tier: shared cache
+            if owned and self.shared_cache is not None:
+                for key in list(owned):
+                    value = self._shared_get(key)
+                    if value is not None:
+                        text, future = owned.pop(key)
+                        results[key] = value
+                        self._store(key, value)
+                        future.set_result(value)
+                        with self._lock:
+                            self._stats["shared_hits"] += 1
+                        CACHE_EVENTS.inc(cache=self.namespace, result="shared_hit")
+            
+            # Compute what is left in one call
+            if owned:
+                missing = list(owned)
+                values = compute_many([owned[key][0] for key in missing])
+                with self._lock:
+                    self._stats["misses"] += len(missing)
+                CACHE_EVENTS.inc(len(missing), cache=self.namespace, result="miss")
+                for key, value in zip(missing, values):
+                    results[key] = value
+                    self._store(key, value)
+                    self._shared_set(key, value)
+                    owned[key][1].set_result(value)
+        except Exception as e:
+            for _, future in owned.values():
+                if not future.done():
+                    future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                for key in owned:
+                    self._inflight.pop(key, None)
+        
+        for key, future in waiting.items():
+            results[key] = future.result()
+        
+        return [results[key] for key in keys]
+    
+    def get_stats(self):
+        """
+        Hit/miss counters and current size of the local tier.
+        """
+        with self._lock:
+            stats = dict(self._stats)
+            stats["entries"] = len(self._entries)
+        lookups = stats["local_hits"] + stats["shared_hits"] + stats["misses"] + stats["coalesced"]
+        stats["hit_rate"] = (lookups - stats["misses"]) / lookups if lookups else 0.0
+        stats["max_entries"] = self.max_entries
+        stats["model_version"] = self.model_version
+        return stats
+    
+    def _store(self, key, value):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._stats["evictions"] += 1
+    
+    def _shared_get(self, key):
+        try:
+            value = self.shared_cache.get(key)
+            return tuple(value) if isinstance(value, list) else value
+        except Exception as e:
+            logger.warning("Shared cache lookup failed: %s", e)
+            return None
+    
+    def _shared_set(self, key, value):
+        if self.shared_cache is None:
+            return
+        try:
+            self.shared_cache.set(key, value, timeout=self.shared_timeout)
+        except Exception as e:
+            logger.warning("Shared cache write failed: %s", e)
+
+class TurnTokenCache:
+    """
+    LRU cache of token ids for formatted conversation turns ("User: ...\n"),
+    so turns resent with every stateless request (and the same turn seen by
+    several conversations) are tokenized once.
+    """
+    def __init__(self, tokenizer, max_entries=4096, namespace="turn_tokens"):
+        self.tokenizer = tokenizer
+        self.max_entries = max_entries
+        self.namespace = namespace
+        
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "evictions": 0, "tokenized_chars": 0}
+    
+    def encode(self, text):
+        """
+        Token ids for a formatted turn.
+        
+        Args:
+            text (str): The formatted turn
+            
+        Returns:
+            array: The turn's token ids (array('I')); treat as read-only
+        """
+        with self._lock:
+            token_ids = self._entries.get(text)
+            if token_ids is not None:
+                self._entries.move_to_end(text)
+                self._stats["hits"] += 1
+        if token_ids is not None:
+            CACHE_EVENTS.inc(cache=self.namespace, result="hit")
+            return token_ids
+        
+        token_ids = array('I', self.tokenizer.encode(text))
+        CACHE_EVENTS.inc(cache=self.namespace, result="miss")
+        with self._lock:
+            self._stats["misses"] += 1
+            self._stats["tokenized_chars"] += len(text)
+            self._entries[text] = token_ids
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._stats["evictions"] += 1
+        return token_ids
+    
+    def get_stats(self):
+        """
+        Hit/miss counters and current size of the cache.
+        """
+        with self._lock:
+            stats = dict(self._stats)
+            stats["entries"] = len(self._entries)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+        stats["max_entries"] = self.max_entries
+        return stats
@@ -1,10 +1,239 @@
+import bisect
 import logging
+import threading
 import time
+from contextlib import contextmanager
 from functools import wraps
-from flask import request, g
+import torch
+from flask import Response, current_app, request, g
+from transformers import StoppingCriteria
 
 logger = logging.getLogger(__name__)
 
+# Latency buckets in seconds, from sub-millisecond stages up to long generations
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+def _format_labels(labelnames, values, extra=None):
+    pairs = list(zip(labelnames, values)) + (extra or [])
+    if not pairs:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in pairs)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+
+class Counter:
+    """
+    Monotonically increasing value per label set.
+    """
+    type = "counter"
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels.get(name, "") for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            return [(self.name, key, value, None) for key, value in self._values.items()]
+
+class Gauge(Counter):
+    """
+    Value per label set that can go up and down.
+    """
+    type = "gauge"
+
+    def set(self, value, **labels):
+        key = tuple(labels.get(name, "") for name in self.labelnames)
+        with self._lock:
+            self._values[key] = value
+
+class Histogram:
+    """
+    Distribution of observed values in cumulative buckets, per label set.
+    """
+    type = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(labels.get(name, "") for name in self.labelnames)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def samples(self):
+        with self._lock:
+            series = {key: (list(counts), total, count) for key, (counts, total, count) in self._series.items()}
+
+        samples = []
+        for key, (counts, total, count) in series.items():
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                samples.append((f"{self.name}_bucket", key, cumulative, [("le", le)]))
+            samples.append((f"{self.name}_sum", key, total, None))
+            samples.append((f"{self.name}_count", key, count, None))
+        return samples
+
+class MetricsRegistry:
+    """
+    Holds the process's metrics and renders them in the Prometheus text format.
+    """
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric):
+        with self._lock:
+            return self._metrics.setdefault(metric.name, metric)
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=()):
+        return self._register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self):
+        lines = []
+        with self._lock:
+            metrics = list(self._metrics.values())
+
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            for name, key, value, extra in metric.samples():
+                lines.append(f"{name}{_format_labels(metric.labelnames, key, extra)} {value}")
+
+        return "\n".join(lines) + "\n"
+
+REGISTRY = MetricsRegistry()
+
+REQUEST_LATENCY = REGISTRY.histogram(
+    "chatbot_http_request_duration_seconds", "HTTP request latency by endpoint", ["method", "endpoint", "status"])
+STAGE_LATENCY = REGISTRY.histogram(
+    "chatbot_stage_duration_seconds", "Time spent in each internal pipeline stage", ["stage"])
+GENERATED_TOKENS = REGISTRY.counter(
+    "chatbot_generated_tokens_total", "Tokens generated by the chat model")
+DECODE_THROUGHPUT = REGISTRY.histogram(
+    "chatbot_decode_tokens_per_second", "Decode throughput per generate call",
+    buckets=(1, 2, 5, 10, 20, 50, 100, 200, 500, 1000))
+CACHE_EVENTS = REGISTRY.counter(
+    "chatbot_cache_events_total", "Cache lookups by cache and result", ["cache", "result"])
+BATCH_SIZE = REGISTRY.histogram(
+    "chatbot_generate_batch_size", "Requests per batched generate call", buckets=(1, 2, 4, 8, 16, 32))
+QUEUE_DEPTH = REGISTRY.gauge(
+    "chatbot_generate_queue_depth", "Chat requests waiting to be batched")
+INFERENCE_PENDING = REGISTRY.gauge(
+    "chatbot_inference_pending", "Inference jobs queued or running on the ASGI inference executor")
+INFERENCE_REJECTED = REGISTRY.counter(
+    "chatbot_inference_rejected_total", "Inference jobs rejected by admission control")
+REQUESTS_CANCELLED = REGISTRY.counter(
+    "chatbot_requests_cancelled_total", "Requests abandoned because the client disconnected", ["endpoint"])
+SPECULATIVE_DRAFTED = REGISTRY.counter(
+    "chatbot_speculative_drafted_tokens_total", "Tokens proposed by the speculative decoding draft model")
+SPECULATIVE_ACCEPTED = REGISTRY.counter(
+    "chatbot_speculative_accepted_tokens_total", "Draft tokens accepted by the chat model")
+DISCARDED_TOKENS = REGISTRY.counter(
+    "chatbot_discarded_tokens_total", "Generated tokens cut from responses by cleanup or the length cap")
+GENERATION_STOPS = REGISTRY.counter(
+    "chatbot_generation_stops_total", "Chat generations by why they stopped", ["reason"])
+LOG_RECORDS = REGISTRY.counter(
+    "chatbot_log_records_total", "Log records by outcome (queued, dropped, sampled_out, rate_limited)", ["result"])
+RESPONSE_SOURCES = REGISTRY.counter(
+    "chatbot_responses_total", "Chat responses by where they came from (model, cache, safety, fallback)", ["source"])
+PROFILES = REGISTRY.counter(
+    "chatbot_profiles_total", "Request profiles by outcome (started, saved, failed, skipped_busy)", ["result"])
+
+# Whether a request profile is being recorded (see utils.profiling)
+_trace_spans = False
+
+def enable_trace_spans(enabled):
+    """
+    Turn labelling of stages in torch profiler traces on or off.
+    """
+    global _trace_spans
+    _trace_spans = enabled
+
+@contextmanager
+def trace_span(name):
+    """
+    Context manager labelling a block in torch profiler traces. Does nothing
+    unless a profile is being recorded.
+    """
+    if not _trace_spans:
+        yield
+        return
+    with torch.profiler.record_function(name):
+        yield
+
+@contextmanager
+def stage(name):
+    """
+    Context manager timing a pipeline stage into the stage latency histogram
+    (and labelling it in profiler traces).
+    """
+    start = time.perf_counter()
+    try:
+        with trace_span(name):
+            yield
+    finally:
+        STAGE_LATENCY.observe(time.perf_counter() - start, stage=name)
+
+class GenerationTimer(StoppingCriteria):
+    """
+    Stopping criterion that never stops generation but timestamps each step,
+    splitting a generate call into prefill (prompt forward pass and first
+    token) and decode (every later token).
+    """
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.first_step = None
+        self.steps = 0
+
+    def __call__(self, input_ids, scores, **kwargs):
+        if self.first_step is None:
+            self.first_step = time.perf_counter()
+        self.steps += 1
+        return torch.zeros((input_ids.shape[0],), dtype=torch.bool, device=input_ids.device)
+
+    def record(self, batch_size=1):
+        """
+        Record prefill/decode latency and decode throughput once generate returns.
+        """
+        end = time.perf_counter()
+        if self.first_step is None:
+            return
+
+        STAGE_LATENCY.observe(self.first_step - self.start, stage="generate_prefill")
+        decode_seconds = end - self.first_step
+        STAGE_LATENCY.observe(decode_seconds, stage="generate_decode")
+
+        GENERATED_TOKENS.inc(self.steps * batch_size)
+        decode_tokens = (self.steps - 1) * batch_size
+        if decode_tokens > 0 and decode_seconds > 0:
+            DECODE_THROUGHPUT.observe(decode_tokens / decode_seconds)
+
 def log_api_call(f):
     """
     Decorator to log API calls with timing information
@@ -20,22 +249,48 @@ def log_api_call(f):
         # Record start time
         start_time = time.time()
         
-        # Get endpoint information
+        # Get endpoint information; record latency by route template to keep
+        # label cardinality bounded
         endpoint = request.path
         method = request.method
+        rule = request.url_rule.rule if request.url_rule else endpoint
         
-        # Execute the function
-        response = f(*args, **kwargs)
-        
-        # Calculate response time in milliseconds
-        response_time = int((time.time() - start_time) * 1000)
-        
-        # Get status code
-        status_code = response[1] if isinstance(response, tuple) and len(response) > 1 else 200
-        
-        # Log the API call
-        logger.info(f"API {method} {endpoint} - Status: {status_code} - Time: {response_time}ms")
+        def record(status_code):
+            # Calculate response time in milliseconds
+            elapsed = time.time() - start_time
+            response_time = int(elapsed * 1000)
+            
+            REQUEST_LATENCY.observe(elapsed, method=method, endpoint=rule, status=str(status_code))
+            
+            # Log the API call
+            logger.info("API %s %s - Status: %s - Time: %sms", method, endpoint, status_code, response_time,
+                        extra={"method": method, "endpoint": rule, "status": status_code,
+                               "duration_ms": response_time})
         
-        return response
+        status_code = 500
+        streamed = False
+        try:
+            # Execute the function; errors it raises go through the app's error
+            # handlers here (e.g. 503 while models load) so they are counted too
+            try:
+                response = f(*args, **kwargs)
+            except Exception as e:
+                response = current_app.handle_user_exception(e)
+            
+            # Get status code
+            if isinstance(response, tuple):
+                status_code = response[1] if len(response) > 1 else 200
+            else:
+                status_code = getattr(response, "status_code", getattr(response, "code", 200))
+            
+            # Streamed bodies are still being generated; record once they are sent
+            if isinstance(response, Response) and response.is_streamed:
+                response.call_on_close(lambda: record(status_code))
+                streamed = True
+            
+            return response
+        finally:
+            if not streamed:
+                record(status_code)
     
     return decorated_function
\ No newline at end of file
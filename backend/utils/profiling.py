@@ -0,0 +1,447 @@
+import gzip
+import json
+import logging
+import os
+import re
+import sys
+import tempfile
+import threading
+import time
+import uuid
+import torch
+from torch.profiler import ProfilerActivity, profile
+from utils.auth import is_admin
+from utils.metrics import PROFILES, enable_trace_spans
+
+logger = logging.getLogger(__name__)
+
+# Request header asking for the request to be profiled (with the admin token)
+PROFILE_HEADER = "X-Profile"
+
+# Response header naming the profile recorded for the request
+PROFILE_ID_HEADER = "X-Profile-Id"
+
+# Admin and monitoring endpoints are never profiled
+EXCLUDED_PREFIXES = ("/api/admin", "/api/stats", "/metrics", "/health", "/ready")
+
+# Trace process id holding the sampled Python stacks, apart from torch's events
+SAMPLES_PID = 0
+
+_PROFILE_ID = re.compile(r"^[0-9a-f]{32}$")
+
+def _torch_profiler():
+    activities = [ProfilerActivity.CPU]
+    if torch.cuda.is_available():
+        activities.append(ProfilerActivity.CUDA)
+    try:
+        # Also record ops run on batching and inference executor threads
+        config = torch._C._profiler._ExperimentalConfig(profile_all_threads=True)
+        return profile(activities=activities, experimental_config=config)
+    except (AttributeError, TypeError):
+        return profile(activities=activities)
+
+class PythonSampler:
+    """
+    Samples the Python stack of every thread at a fixed interval from a
+    background thread, and turns the samples into flame-chart trace events
+    (consecutive samples sharing a frame become one span). Sampling stops
+    after max_rounds intervals.
+    """
+    def __init__(self, interval_ms=5, max_rounds=12000, max_depth=64):
+        self.interval = interval_ms / 1000.0
+        self.max_rounds = max_rounds
+        self.max_depth = max_depth
+        self.rounds = 0
+        self.samples = []
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="profile-sampler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def trace_events(self, base_us, pid=SAMPLES_PID):
+        """
+        Chrome trace events for the samples, one track per thread.
+
+        Args:
+            base_us (int): Epoch time (microseconds) that trace timestamps count from
+            pid (int): Trace process id to put the tracks under
+        """
+        events = []
+        names = {}
+        open_frames = {}
+        interval_us = int(self.interval * 1e6)
+
+        def close(tid, frames, end_us):
+            for frame, start_us in reversed(frames):
+                events.append({"ph": "X", "name": frame, "cat": "python", "pid": pid, "tid": tid,
+                               "ts": start_us - base_us, "dur": max(1, end_us - start_us)})
+
+        for now_us, sampled in self._by_time():
+            for tid in list(open_frames):
+                if tid not in sampled:
+                    close(tid, open_frames.pop(tid), now_us)
+
+            for tid, (name, stack) in sampled.items():
+                names[tid] = name
+                frames = open_frames.setdefault(tid, [])
+                common = 0
+                while common < len(frames) and common < len(stack) and frames[common][0] == stack[common]:
+                    common += 1
+                close(tid, frames[common:], now_us)
+                del frames[common:]
+                frames.extend((frame, now_us) for frame in stack[common:])
+
+        end_us = self.samples[-1][0] + interval_us if self.samples else 0
+        for tid, frames in open_frames.items():
+            close(tid, frames, end_us)
+
+        events.append({"ph": "M", "name": "process_name", "pid": pid, "tid": 0,
+                       "args": {"name": f"Python stacks (sampled every {interval_us // 1000}ms)"}})
+        events.extend({"ph": "M", "name": "thread_name", "pid": pid, "tid": tid, "args": {"name": name}}
+                      for tid, name in names.items())
+        return events
+
+    def _by_time(self):
+        batch, current = {}, None
+        for now_us, tid, name, stack in self.samples:
+            if now_us != current:
+                if batch:
+                    yield current, batch
+                batch, current = {}, now_us
+            batch[tid] = (name, stack)
+        if batch:
+            yield current, batch
+
+    def _run(self):
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval) and self.rounds < self.max_rounds:
+            self.rounds += 1
+            now_us = time.time_ns() // 1000
+            threads = {thread.ident: thread for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                stack = []
+                while frame is not None and len(stack) < self.max_depth:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                thread = threads.get(ident)
+                tid = thread.native_id if thread is not None and thread.native_id else ident
+                name = thread.name if thread is not None else str(ident)
+                self.samples.append((now_us, tid, name, tuple(reversed(stack))))
+
+class ProfileStore:
+    """
+    Bounded on-disk ring buffer of request profiles: each profile is a
+    gzipped Chrome trace (<id>.json.gz) and a small metadata file
+    (<id>.meta.json). Beyond max_profiles or max_bytes the oldest profiles
+    are deleted. Serving processes can share the directory.
+    """
+    def __init__(self, directory, max_profiles=20, max_bytes=500 * 1024 * 1024):
+        self.directory = directory
+        self.max_profiles = max(1, int(max_profiles))
+        self.max_bytes = int(max_bytes)
+        self._lock = threading.Lock()
+
+    def save(self, profile_id, trace, metadata):
+        """
+        Write a profile and drop the oldest ones beyond the limits.
+
+        Returns:
+            dict: The metadata as stored, including the trace size in bytes
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        trace_path = self._path(profile_id, ".json.gz")
+        self._write(trace_path, gzip.compress(json.dumps(trace).encode("utf-8"), compresslevel=1))
+        metadata = dict(metadata, id=profile_id, bytes=os.path.getsize(trace_path))
+        self._write(self._path(profile_id, ".meta.json"), json.dumps(metadata).encode("utf-8"))
+        self._prune()
+        return metadata
+
+    def list(self):
+        """
+        Metadata of every stored profile, newest first.
+        """
+        profiles = []
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return profiles
+
+        for name in names:
+            if not name.endswith(".meta.json"):
+                continue
+            try:
+                with open(os.path.join(self.directory, name), "r", encoding="utf-8") as f:
+                    profiles.append(json.load(f))
+            except (OSError, ValueError):
+                # Deleted by another process or half written
+                continue
+        return sorted(profiles, key=lambda metadata: metadata.get("started_at", 0), reverse=True)
+
+    def trace_path(self, profile_id):
+        """
+        Path of a stored trace, or None if there is no such profile.
+        """
+        if not _PROFILE_ID.match(profile_id):
+            return None
+        path = self._path(profile_id, ".json.gz")
+        return path if os.path.exists(path) else None
+
+    def _path(self, profile_id, suffix):
+        return os.path.join(self.directory, profile_id + suffix)
+
+    def _write(self, path, data):
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    def _prune(self):
+        with self._lock:
+            total = 0
+            for count, metadata in enumerate(self.list()):
+                total += metadata.get("bytes", 0)
+                if count >= self.max_profiles or total > self.max_bytes:
+                    for suffix in (".json.gz", ".meta.json"):
+                        try:
+                            os.remove(self._path(metadata["id"], suffix))
+                        except FileNotFoundError:
+                            pass
+
+class ProfileSession:
+    """
+    One request being profiled: a torch profiler over every thread plus the
+    Python stack sampler. start and stop must run on the same thread (the
+    torch profiler requires it); save does the slow part (export, merge,
+    compress, write) and can run anywhere.
+    """
+    def __init__(self, profiler, method, path, trigger):
+        self.profiler = profiler
+        self.profile_id = uuid.uuid4().hex
+        self.method = method
+        self.path = path
+        self.trigger = trigger
+        self.status = None
+        self.started_at = None
+        self.duration_ms = None
+        self._torch = None
+        self._sampler = PythonSampler(interval_ms=profiler.sample_interval_ms,
+                                      max_rounds=profiler.max_seconds * 1000 // profiler.sample_interval_ms)
+
+    def start(self):
+        self._torch = _torch_profiler()
+        self._torch.__enter__()
+        enable_trace_spans(True)
+        self._sampler.start()
+        self.started_at = time.time()
+
+    def stop(self, status):
+        self.duration_ms = (time.time() - self.started_at) * 1000
+        self.status = status
+        try:
+            enable_trace_spans(False)
+            self._sampler.stop()
+            self._torch.__exit__(None, None, None)
+        finally:
+            self.profiler._release()
+
+    def save(self):
+        """
+        Merge the torch trace and the sampled stacks into one Chrome trace
+        and store it.
+
+        Returns:
+            dict: The stored profile's metadata, or None if saving failed
+        """
+        try:
+            fd, torch_trace_path = tempfile.mkstemp(suffix=".json")
+            os.close(fd)
+            try:
+                self._torch.export_chrome_trace(torch_trace_path)
+                with open(torch_trace_path, "r", encoding="utf-8") as f:
+                    trace = json.load(f)
+            finally:
+                os.remove(torch_trace_path)
+
+            # Torch timestamps count from baseTimeNanoseconds; put the samples on the same clock
+            base_us = trace.get("baseTimeNanoseconds", 0) // 1000
+            torch_events = len(trace.get("traceEvents", []))
+            trace.setdefault("traceEvents", []).extend(self._sampler.trace_events(base_us))
+            trace["traceEvents"].append({
+                "ph": "X", "name": f"{self.method} {self.path}", "cat": "request", "pid": SAMPLES_PID, "tid": 0,
+                "ts": int(self.started_at * 1e6) - base_us, "dur": int(self.duration_ms * 1000),
+                "args": {"status": self.status, "profile_id": self.profile_id},
+            })
+
+            metadata = {
+                "method": self.method,
+                "path": self.path,
+                "status": self.status,
+                "trigger": self.trigger,
+                "started_at": self.started_at,
+                "duration_ms": round(self.duration_ms, 1),
+                "torch_events": torch_events,
+                "python_samples": self._sampler.rounds,
+            }
+            trace["profile"] = dict(metadata, id=self.profile_id)
+            metadata = self.profiler.store.save(self.profile_id, trace, metadata)
+        except Exception as e:
+            logger.error("Error saving profile %s: %s", self.profile_id, e)
+            self.profiler._count("failed")
+            return None
+        finally:
+            self._torch = None
+            self._sampler = None
+
+        self.profiler._count("saved")
+        logger.info("Saved profile %s for %s %s (%.0fms)", self.profile_id, self.method, self.path,
+                    self.duration_ms)
+        return metadata
+
+    def finish(self, status):
+        """
+        Stop and save; for servers that end a request on the thread that started it.
+        """
+        self.stop(status)
+        return self.save()
+
+class RequestProfiler:
+    """
+    Opt-in profiling of individual requests.
+
+    A request is profiled when it carries "X-Profile: 1" together with the
+    admin token, or when an admin has armed the profiler for the next few
+    requests (optionally only those under a path prefix). Each profile covers
+    the whole request: torch operator timings on every thread (tokenization,
+    generate, sentiment inference, with the pipeline stages labelled) and
+    sampled Python stacks (for at most max_seconds), saved to the
+    ProfileStore as one Chrome trace.
+
+    One request is profiled at a time per process; others selected
+    meanwhile run normally and are counted as skipped. Nothing is installed
+    unless profiling is enabled, so a disabled profiler costs nothing.
+    """
+    def __init__(self, store, sample_interval_ms=5, max_seconds=60):
+        self.store = store
+        self.sample_interval_ms = max(1, int(sample_interval_ms))
+        self.max_seconds = max_seconds
+
+        self._armed = 0
+        self._armed_prefix = None
+        self._busy = threading.Lock()
+        self._lock = threading.Lock()
+        self._stats = {"started": 0, "saved": 0, "failed": 0, "skipped_busy": 0}
+
+    def arm(self, count, path_prefix=None):
+        """
+        Profile the next count requests (0 disarms), only those whose path
+        starts with path_prefix if given.
+        """
+        with self._lock:
+            self._armed = max(0, int(count))
+            self._armed_prefix = path_prefix or None
+
+    def start_request(self, method, path, headers):
+        """
+        Start profiling a request if it was selected.
+
+        Args:
+            method (str): HTTP method
+            path (str): Request path
+            headers: Case-insensitive request headers
+
+        Returns:
+            ProfileSession or None: The running session if the request is profiled
+        """
+        if path.startswith(EXCLUDED_PREFIXES):
+            return None
+
+        if headers.get(PROFILE_HEADER) == "1" and is_admin(headers):
+            trigger = "header"
+        elif self._armed and (self._armed_prefix is None or path.startswith(self._armed_prefix)):
+            trigger = "armed"
+        else:
+            return None
+
+        if not self._busy.acquire(blocking=False):
+            self._count("skipped_busy")
+            return None
+
+        if trigger == "armed":
+            with self._lock:
+                if not self._armed:
+                    self._busy.release()
+                    return None
+                self._armed -= 1
+
+        session = ProfileSession(self, method, path, trigger)
+        try:
+            session.start()
+        except Exception as e:
+            logger.error("Error starting profile: %s", e)
+            self._busy.release()
+            self._count("failed")
+            return None
+
+        self._count("started")
+        return session
+
+    def get_stats(self):
+        """
+        Profiles started, saved, failed and skipped, and what is armed.
+        """
+        with self._lock:
+            stats = dict(self._stats)
+            stats["armed"] = self._armed
+            stats["armed_prefix"] = self._armed_prefix
+        stats["busy"] = self._busy.locked()
+        stats["sample_interval_ms"] = self.sample_interval_ms
+        stats["directory"] = self.store.directory
+        stats["max_profiles"] = self.store.max_profiles
+        stats["stored"] = len(self.store.list())
+        return stats
+
+    def _release(self):
+        self._busy.release()
+
+    def _count(self, result):
+        PROFILES.inc(result=result)
+        with self._lock:
+            self._stats[result] += 1
+
+def create_request_profiler():
+    """
+    Build the request profiler from the environment, or None when profiling
+    is off:
+
+        PROFILING                   1 enables request profiling (default 0)
+        PROFILE_DIR                 where traces are kept (profiles)
+        PROFILE_MAX_TRACES          traces kept before the oldest are deleted (20)
+        PROFILE_MAX_MB              total size of kept traces (500)
+        PROFILE_SAMPLE_INTERVAL_MS  Python stack sampling interval (5)
+
+    Requests are selected with the admin token (ADMIN_TOKEN), either per
+    request or by arming the profiler through the admin endpoint.
+    """
+    if os.environ.get('PROFILING', '0') != '1':
+        return None
+    if not os.environ.get('ADMIN_TOKEN'):
+        logger.warning("PROFILING=1 has no effect without ADMIN_TOKEN")
+        return None
+
+    store = ProfileStore(
+        os.environ.get('PROFILE_DIR', 'profiles'),
+        max_profiles=int(os.environ.get('PROFILE_MAX_TRACES', 20)),
+        max_bytes=int(float(os.environ.get('PROFILE_MAX_MB', 500)) * 1024 * 1024),
+    )
+    return RequestProfiler(store, sample_interval_ms=int(os.environ.get('PROFILE_SAMPLE_INTERVAL_MS', 5)))
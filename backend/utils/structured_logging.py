@@ -0,0 +1,263 @@
+import atexit
+import copy
+import hashlib
+import json
+import logging
+import os
+import queue
+import random
+import threading
+import time
+from logging.handlers import QueueHandler, QueueListener
+from utils.metrics import LOG_RECORDS
+
+# Record attributes (passed with extra=) that hold text written by users or
+# the model; redacted to a hash and length unless LOG_REDACT=0
+REDACTED_FIELDS = ("user_text", "response_text")
+
+# Attributes every LogRecord has; anything else was passed with extra=
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+TEXT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+_pipeline = None
+
+def redact(text):
+    """
+    Replace text with a short hash and its length, so the same message can be
+    correlated across log lines without being stored.
+    """
+    digest = hashlib.sha256(text.encode("utf-8")).hexdigest()[:12]
+    return f"<redacted sha256:{digest} len:{len(text)}>"
+
+def _record_fields(record, redact_text):
+    fields = {}
+    for key, value in record.__dict__.items():
+        if key in _RECORD_ATTRIBUTES or key.startswith("_"):
+            continue
+        if key in REDACTED_FIELDS and redact_text and isinstance(value, str):
+            value = redact(value)
+        fields[key] = value
+    return fields
+
+class JsonFormatter(logging.Formatter):
+    """
+    One JSON object per line: timestamp, level, logger, the formatted
+    message and any fields passed with extra=.
+    """
+    def __init__(self, redact_text=True):
+        super().__init__()
+        self.redact_text = redact_text
+
+    def format(self, record):
+        entry = {
+            "ts": time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(record.created)) + f".{int(record.msecs):03d}Z",
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        entry.update(_record_fields(record, self.redact_text))
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exc_info"] = record.exc_text
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+class TextFormatter(logging.Formatter):
+    """
+    The classic "time - logger - level - message" line, followed by any
+    fields passed with extra= as key=value pairs.
+    """
+    def __init__(self, redact_text=True):
+        super().__init__(TEXT_FORMAT)
+        self.redact_text = redact_text
+
+    def format(self, record):
+        line = super().format(record)
+        fields = _record_fields(record, self.redact_text)
+        if fields:
+            line += " " + " ".join(f"{key}={value}" for key, value in fields.items())
+        return line
+
+class InfoSamplingFilter(logging.Filter):
+    """
+    Thins out INFO and DEBUG records; warnings and errors always pass.
+
+    sample_rate keeps that fraction of records at random. rate_limit caps
+    each message template (the unformatted msg, per logger) at that many
+    records per second with a token bucket, so one chatty call site can't
+    crowd out the rest.
+    """
+    def __init__(self, sample_rate=1.0, rate_limit=0, max_templates=1024):
+        super().__init__()
+        self.sample_rate = sample_rate
+        self.rate_limit = rate_limit
+        self.max_templates = max_templates
+        self.sampled_out = 0
+        self.rate_limited = 0
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        if record.levelno > logging.INFO:
+            return True
+
+        if self.sample_rate < 1.0 and random.random() >= self.sample_rate:
+            self.sampled_out += 1
+            LOG_RECORDS.inc(result="sampled_out")
+            return False
+
+        if self.rate_limit:
+            key = (record.name, record.msg)
+            now = time.monotonic()
+            with self._lock:
+                if key not in self._buckets and len(self._buckets) >= self.max_templates:
+                    self._buckets.clear()
+                tokens, last = self._buckets.get(key, (self.rate_limit, now))
+                tokens = min(self.rate_limit, tokens + (now - last) * self.rate_limit)
+                allowed = tokens >= 1
+                self._buckets[key] = (tokens - 1 if allowed else tokens, now)
+            if not allowed:
+                self.rate_limited += 1
+                LOG_RECORDS.inc(result="rate_limited")
+                return False
+
+        return True
+
+class BoundedQueueHandler(QueueHandler):
+    """
+    Hands records to the writer thread through a bounded queue without
+    blocking: when the queue is full the record is dropped and counted.
+
+    Records are queued unformatted (message templates and their arguments),
+    so the message is only built on the writer thread. Exception tracebacks
+    are rendered before queuing because they refer to live stack frames.
+    """
+    def __init__(self, maxsize=10000):
+        super().__init__(queue.Queue(maxsize))
+        self.maxsize = maxsize
+        self.queued = 0
+        self.dropped = 0
+
+    def prepare(self, record):
+        if record.exc_info:
+            record = copy.copy(record)
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+            LOG_RECORDS.inc(result="dropped")
+        else:
+            self.queued += 1
+            LOG_RECORDS.inc(result="queued")
+
+class _WriterListener(QueueListener):
+    def enqueue_sentinel(self):
+        # Wait for room rather than failing when the queue is full at shutdown
+        self.queue.put(self._sentinel)
+
+class LogPipeline:
+    """
+    Root logging through a bounded queue and a background writer thread, so
+    request threads never wait on log I/O.
+
+    The writer thread does not survive fork, so a child process (a gunicorn
+    worker forked from a preloading master, or a model worker) gets a fresh
+    queue and writer thread.
+    """
+    def __init__(self, target, queue_size=10000, sample_rate=1.0, rate_limit=0):
+        self.target = target
+        self.handler = BoundedQueueHandler(maxsize=queue_size)
+        self.filter = InfoSamplingFilter(sample_rate=sample_rate, rate_limit=rate_limit)
+        self.handler.addFilter(self.filter)
+        self._listener = None
+
+    def start(self):
+        self._listener = _WriterListener(self.handler.queue, self.target, respect_handler_level=True)
+        self._listener.start()
+        os.register_at_fork(after_in_child=self._after_fork)
+
+    def stop(self):
+        """
+        Write out every queued record and stop the writer thread.
+        """
+        if self._listener is not None:
+            self._listener.stop()
+            self._listener = None
+
+    def get_stats(self):
+        """
+        Records queued, dropped and filtered out in this process.
+        """
+        return {
+            "queued": self.handler.queued,
+            "dropped": self.handler.dropped,
+            "sampled_out": self.filter.sampled_out,
+            "rate_limited": self.filter.rate_limited,
+            "queue_depth": self.handler.queue.qsize(),
+            "queue_size": self.handler.maxsize,
+            "sample_rate": self.filter.sample_rate,
+            "rate_limit": self.filter.rate_limit,
+        }
+
+    def _after_fork(self):
+        if self._listener is None:
+            return
+        self.handler.queue = queue.Queue(self.handler.maxsize)
+        self.handler.queued = self.handler.dropped = 0
+        self.filter.sampled_out = self.filter.rate_limited = 0
+        self._listener = _WriterListener(self.handler.queue, self.target, respect_handler_level=True)
+        self._listener.start()
+
+def setup_logging(level=logging.INFO):
+    """
+    Configure root logging for the server from the environment:
+
+        LOG_FORMAT              json (default) or text
+        LOG_REDACT              1 (default) hashes user and model text fields
+        LOG_QUEUE_SIZE          records buffered for the writer thread (10000)
+        LOG_INFO_SAMPLE_RATE    fraction of INFO/DEBUG records kept (1.0)
+        LOG_INFO_RATE_LIMIT     INFO/DEBUG records per second per message (0 = no limit)
+
+    Safe to call more than once; later calls return the existing pipeline.
+
+    Returns:
+        LogPipeline: The pipeline now handling root logging
+    """
+    global _pipeline
+    if _pipeline is not None:
+        return _pipeline
+
+    redact_text = os.environ.get('LOG_REDACT', '1') == '1'
+    target = logging.StreamHandler()
+    if os.environ.get('LOG_FORMAT', 'json') == 'json':
+        target.setFormatter(JsonFormatter(redact_text))
+    else:
+        target.setFormatter(TextFormatter(redact_text))
+
+    _pipeline = LogPipeline(
+        target,
+        queue_size=int(os.environ.get('LOG_QUEUE_SIZE', 10000)),
+        sample_rate=float(os.environ.get('LOG_INFO_SAMPLE_RATE', 1.0)),
+        rate_limit=float(os.environ.get('LOG_INFO_RATE_LIMIT', 0)),
+    )
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(_pipeline.handler)
+    root.setLevel(level)
+    _pipeline.start()
+    atexit.register(_pipeline.stop)
+    return _pipeline
+
+def get_log_pipeline():
+    """
+    The pipeline configured by setup_logging, or None.
+    """
+    return _pipeline
@@ -0,0 +1,342 @@
+import itertools
+import logging
+import multiprocessing
+import os
+import queue
+import random
+import threading
+import time
+import zlib
+from concurrent.futures import Future, ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+def _share_model_memory(model):
+    """
+    Move a model's parameters and buffers into shared memory so forked
+    workers map the same pages instead of copying them on write.
+
+    Returns:
+        bool: True if the model supports shared memory (ONNX Runtime models don't)
+    """
+    if not hasattr(model, "share_memory"):
+        return False
+    model.share_memory()
+    return True
+
+def _worker_cores(index, cores_per_worker):
+    """
+    CPU cores for the index-th worker: consecutive blocks of the cores this
+    process may run on, wrapping around when workers outnumber them.
+    """
+    available = sorted(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else list(range(os.cpu_count() or 1))
+    start = (index * cores_per_worker) % len(available)
+    return [available[(start + i) % len(available)] for i in range(min(cores_per_worker, len(available)))]
+
+def _worker_main(index, cores, conversation_manager, sentiment_analyzer, jobs, results, threads):
+    """
+    Entry point of an inference process. Pins itself to its cores, then runs
+    jobs from its queue on a few threads (so concurrent chat jobs can still be
+    batched together) and reports results back to the front process.
+    """
+    import torch
+
+    if cores and hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, cores)
+    torch.set_num_threads(max(1, len(cores)))
+
+    handlers = {
+        "chat": lambda p: conversation_manager.generate_response(
+            p["message"], p.get("conversation_history"), p.get("conversation_id"),
+            session_turns=p.get("session_turns"), screened=p.get("screened", False)),
+        "sentiment": lambda p: sentiment_analyzer.analyze_many(p["messages"]),
+    }
+
+    def run(job_id, kind, payload):
+        try:
+            results.put((index, job_id, True, handlers[kind](payload)))
+        except Exception as e:
+            logger.error("Worker %s failed %s job: %s", index, kind, e)
+            results.put((index, job_id, False, str(e)))
+
+    logger.info(f"Model worker {index} (pid {os.getpid()}) serving on cores {cores}")
+    with ThreadPoolExecutor(max_workers=threads, thread_name_prefix=f"model-worker-{index}") as executor:
+        while True:
+            job = jobs.get()
+            if job is None:
+                break
+            executor.submit(run, *job)
+
+class WorkerPool:
+    """
+    Pool of inference processes sharing one copy of the model weights.
+
+    The front process loads the models once and moves their weights into
+    shared memory; worker processes are forked from it, so every worker maps
+    the same weights instead of loading its own copy. Each worker is pinned
+    to its own block of cores and receives jobs over its own queue.
+
+    Chat jobs with a conversation ID always go to the same worker, so
+    per-conversation state kept in that process (e.g. the attention cache)
+    stays warm; other jobs go to the worker with the fewest jobs in flight.
+    Workers that die are restarted and their in-flight jobs fail.
+
+    The workers are forked on first use by each serving process, so when the
+    pool is created before gunicorn forks (MODEL_PRELOAD=1) every gunicorn
+    worker gets its own workers, queues and dispatcher thread.
+
+    Requires the fork start method (Linux).
+    """
+    def __init__(self, conversation_manager, sentiment_analyzer, num_workers=2, cores_per_worker=None,
+                 threads_per_worker=4):
+        self.conversation_manager = conversation_manager
+        self.sentiment_analyzer = sentiment_analyzer
+        self.num_workers = max(1, int(num_workers))
+        self.cores_per_worker = int(cores_per_worker or max(1, (os.cpu_count() or 1) // self.num_workers))
+        self.threads_per_worker = max(1, int(threads_per_worker))
+
+        self._context = multiprocessing.get_context("fork")
+        self._results = None
+        self._workers = [None] * self.num_workers
+        self._job_queues = [None] * self.num_workers
+        self._cores = [[] for _ in range(self.num_workers)]
+        self._pending = {}
+        self._in_flight = [0] * self.num_workers
+        self._completed = [0] * self.num_workers
+        self._restarts = 0
+        self._job_ids = itertools.count()
+        self._lock = threading.Lock()
+        self._start_lock = threading.Lock()
+        self._dispatcher = None
+        self._running = False
+        self._pool_pid = None
+
+    def start(self):
+        """
+        Share the model weights. The worker processes are forked by
+        _ensure_workers when this process first submits a job.
+        """
+        models = [self.conversation_manager.model, self.sentiment_analyzer.model]
+        if getattr(self.conversation_manager, "speculative_decoder", None) is not None:
+            models.append(self.conversation_manager.speculative_decoder.draft_model)
+        for model in models:
+            if not _share_model_memory(model):
+                logger.warning(f"{type(model).__name__} does not support shared memory; "
+                               f"workers share it copy-on-write only")
+        return self
+
+    def _ensure_workers(self):
+        """
+        Fork the worker processes and start the result dispatcher for the
+        current process if it does not have them yet. State inherited from a
+        parent process (queues, pending jobs, the dispatcher) is discarded:
+        those pipes and threads belong to the parent.
+        """
+        if self._pool_pid == os.getpid():
+            return
+
+        with self._start_lock:
+            if self._pool_pid == os.getpid():
+                return
+            with self._lock:
+                self._results = self._context.Queue()
+                self._workers = [None] * self.num_workers
+                self._job_queues = [None] * self.num_workers
+                self._pending = {}
+                self._in_flight = [0] * self.num_workers
+                self._completed = [0] * self.num_workers
+                self._restarts = 0
+                self._running = True
+                for index in range(self.num_workers):
+                    self._start_worker(index)
+
+            self._dispatcher = threading.Thread(target=self._dispatch_results, name="model-pool-results",
+                                                daemon=True)
+            self._dispatcher.start()
+            self._pool_pid = os.getpid()
+
+        logger.info(f"Started {self.num_workers} model workers ({self.cores_per_worker} cores each) "
+                    f"for pid {os.getpid()}")
+
+    def submit(self, kind, payload, routing_key=None):
+        """
+        Send a job to a worker.
+
+        Args:
+            kind (str): "chat" or "sentiment"
+            payload (dict): Job arguments
+            routing_key (str): Optional key (e.g. conversation ID); jobs with the
+                same key always run on the same worker
+
+        Returns:
+            concurrent.futures.Future: Resolves to the job's result
+        """
+        self._ensure_workers()
+        future = Future()
+        with self._lock:
+            if routing_key:
+                index = zlib.crc32(str(routing_key).encode("utf-8")) % self.num_workers
+            else:
+                index = min(range(self.num_workers), key=lambda i: self._in_flight[i])
+            job_id = next(self._job_ids)
+            self._pending[job_id] = (index, future)
+            self._in_flight[index] += 1
+            jobs = self._job_queues[index]
+
+        jobs.put((job_id, kind, payload))
+        return future
+
+    def generate_response(self, user_message, conversation_history=None, conversation_id=None, session_turns=None,
+                          screened=False):
+        return self.submit("chat", {
+            "message": user_message,
+            "conversation_history": conversation_history,
+            "conversation_id": conversation_id,
+            "session_turns": session_turns,
+            "screened": screened,
+        }, routing_key=conversation_id).result()
+
+    def analyze_many(self, texts):
+        return self.submit("sentiment", {"messages": list(texts)}).result()
+
+    def get_stats(self):
+        """
+        Per-worker process, core and job statistics.
+        """
+        started = self._pool_pid == os.getpid()
+        with self._lock:
+            workers = [{
+                "index": index,
+                "pid": process.pid if process is not None else None,
+                "alive": process is not None and process.is_alive(),
+                "cores": self._cores[index],
+                "in_flight": self._in_flight[index],
+                "completed": self._completed[index],
+            } for index, process in enumerate(self._workers if started else [None] * self.num_workers)]
+            return {"workers": workers, "restarts": self._restarts, "threads_per_worker": self.threads_per_worker}
+
+    def shutdown(self, timeout=5):
+        """
+        Stop every worker after its queued jobs finish.
+        """
+        if self._pool_pid != os.getpid():
+            return
+        self._running = False
+        for jobs in self._job_queues:
+            if jobs is not None:
+                jobs.put(None)
+        for process in self._workers:
+            if process is not None:
+                process.join(timeout)
+                if process.is_alive():
+                    process.terminate()
+
+    def _start_worker(self, index):
+        cores = _worker_cores(index, self.cores_per_worker)
+        jobs = self._context.Queue()
+        process = self._context.Process(
+            target=_worker_main,
+            args=(index, cores, self.conversation_manager, self.sentiment_analyzer, jobs, self._results,
+                  self.threads_per_worker),
+            name=f"model-worker-{index}",
+            daemon=True,
+        )
+        process.start()
+        self._workers[index] = process
+        self._job_queues[index] = jobs
+        self._cores[index] = cores
+
+    def _dispatch_results(self):
+        last_check = time.monotonic()
+        while self._running:
+            if time.monotonic() - last_check >= 1.0:
+                self._check_workers()
+                last_check = time.monotonic()
+
+            try:
+                index, job_id, ok, result = self._results.get(timeout=1.0)
+            except queue.Empty:
+                continue
+
+            with self._lock:
+                entry = self._pending.pop(job_id, None)
+                if entry is None:
+                    continue
+                self._in_flight[index] -= 1
+                self._completed[index] += 1
+
+            future = entry[1]
+            if ok:
+                future.set_result(result)
+            else:
+                future.set_exception(RuntimeError(result))
+
+    def _check_workers(self):
+        """
+        Restart dead workers and fail the jobs they were running.
+        """
+        for index, process in enumerate(self._workers):
+            if not self._running or process.is_alive():
+                continue
+
+            logger.error(f"Model worker {index} (pid {process.pid}) exited with code {process.exitcode}, restarting")
+            with self._lock:
+                lost = [(job_id, future) for job_id, (i, future) in self._pending.items() if i == index]
+                for job_id, _ in lost:
+                    del self._pending[job_id]
+                self._in_flight[index] = 0
+                self._restarts += 1
+                self._start_worker(index)
+
+            for _, future in lost:
+                future.set_exception(RuntimeError(f"Model worker {index} exited"))
+
+class PooledConversationManager:
+    """
+    Stands in for the ConversationManager in the front process: responses are
+    generated by the worker pool, while streaming and everything else use the
+    front process's own (shared-weight) manager.
+    """
+    def __init__(self, pool):
+        self.pool = pool
+
+    def generate_response(self, user_message, conversation_history=None, conversation_id=None, cancel_event=None,
+                          session_turns=None, screened=False):
+        # Cancellation is not forwarded to worker processes; the job runs to completion
+        try:
+            return self.pool.generate_response(user_message, conversation_history, conversation_id, session_turns,
+                                               screened=screened)
+        except Exception as e:
+            logger.error("Error generating response in worker pool: %s", e)
+            return random.choice(self.pool.conversation_manager.fallback_responses)
+
+    def __getattr__(self, name):
+        return getattr(self.pool.conversation_manager, name)
+
+class PooledSentimentAnalyzer:
+    """
+    Stands in for the SentimentAnalyzer in the front process: cached results
+    are served locally and only cache misses are sent to the worker pool.
+    """
+    def __init__(self, pool):
+        self.pool = pool
+
+    def analyze(self, text):
+        return self.analyze_many([text])[0]
+
+    def analyze_many(self, texts, batch_size=32):
+        if not texts:
+            return []
+
+        result_cache = self.pool.sentiment_analyzer.result_cache
+        try:
+            if result_cache is not None:
+                return result_cache.get_or_compute_many(list(texts), self.pool.analyze_many)
+            return self.pool.analyze_many(texts)
+        except Exception as e:
+            logger.error("Error in pooled sentiment analysis: %s", e)
+            # Fallback to neutral sentiment
+            return [("neutral", 0.33)] * len(texts)
+
+    def __getattr__(self, name):
+        return getattr(self.pool.sentiment_analyzer, name)
@@ -1,4 +1,4 @@
-import React, { useState, useEffect } from 'react';
+import React, { useState, useEffect, useRef } from 'react';
 import ChatWindow from './components/ChatWindow';
 import InputBox from './components/InputBox';
 import SentimentDisplay from './components/SentimentDisplay';
@@ -6,7 +6,7 @@ import Avatar from './components/Avatar';
 import WelcomeScreen from './components/WelcomeScreen';
 import TopicSuggestion from './components/TopicSuggestion';
 import Settings from './components/Settings';
-import { fetchChatResponse, fetchSentimentAnalysis } from './utils/api';
+import { createSession, streamChatPipeline } from './utils/api';
 import useSpeechSynthesis from './hooks/useSpeechSynthesis';
 import useLocalStorage from './hooks/useLocalStorage';
 
@@ -23,6 +23,8 @@ function App() {
     userName: 'Friend'
   });
   const [isSettingsOpen, setIsSettingsOpen] = useState(false);
+  // Server-side session holding the conversation history; created on the first message
+  const sessionIdRef = useRef(null);
   
   const { speak, isSpeaking, cancel } = useSpeechSynthesis();
 
@@ -69,6 +71,32 @@ function App() {
     }
   };
 
+  const updateBotMessage = (id, text) => {
+    setMessages(prevMessages => {
+      if (!prevMessages.some(msg => msg.id === id)) {
+        return [...prevMessages, { id, text, sender: 'bot', timestamp: new Date() }];
+      }
+      return prevMessages.map(msg => (msg.id === id ? { ...msg, text } : msg));
+    });
+  };
+
+  const streamInSession = async (text, history, callbacks) => {
+    if (!sessionIdRef.current) {
+      sessionIdRef.current = await createSession(history);
+    }
+
+    try {
+      return await streamChatPipeline(text, sessionIdRef.current, callbacks);
+    } catch (error) {
+      if (error.status !== 404) {
+        throw error;
+      }
+      // The session expired on the server; restore it from the messages shown
+      sessionIdRef.current = await createSession(history);
+      return await streamChatPipeline(text, sessionIdRef.current, callbacks);
+    }
+  };
+
   const handleSendMessage = async (text) => {
     // Add user message to chat
     const userMessage = {
@@ -83,15 +111,28 @@ function App() {
     setIsLoading(true);
     
     try {
-      // Get sentiment analysis
-      const sentimentResponse = await fetchSentimentAnalysis(text);
-      setCurrentSentiment(sentimentResponse.sentiment);
-      
-      // Get chatbot response
-      const chatbotResponse = await fetchChatResponse(text, messages);
+      // One request: sentiment arrives first, then the chatbot response
+      // streams into a bot message as it is generated
+      const botMessageId = Date.now() + 1;
+      let hasStreamed = false;
+      const chatbotResponse = await streamInSession(text, messages, {
+        onSentiment: (sentimentResponse) => setCurrentSentiment(sentimentResponse.sentiment),
+        onToken: (partialText) => {
+          hasStreamed = true;
+          setIsLoading(false);
+          updateBotMessage(botMessageId, partialText);
+        },
+      });
       
-      // Add bot message
-      addBotMessage(chatbotResponse.response);
+      // Replace the streamed preview with the final cleaned response
+      if (hasStreamed) {
+        updateBotMessage(botMessageId, chatbotResponse.response);
+        if (settings.textToSpeech) {
+          speak(chatbotResponse.response);
+        }
+      } else {
+        addBotMessage(chatbotResponse.response);
+      }
     } catch (error) {
       console.error("Error communicating with backend:", error);
       addBotMessage("I'm having trouble connecting right now. Could we try again in a moment?");
@@ -147,7 +188,11 @@ function App() {
               />
               
               {messages.length < 3 && (
-                <TopicSuggestion onSelectTopic={handleTopicSelection} />
+                <TopicSuggestion
+                  onSelectTopic={handleTopicSelection}
+                  sessionId={sessionIdRef.current}
+                  sentiment={currentSentiment}
+                />
               )}
             </div>
           </main>
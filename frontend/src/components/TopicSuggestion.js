@@ -1,16 +1,16 @@
 import React, { useState, useEffect } from 'react';
 import { fetchTopicSuggestions } from '../utils/api';
 
-const TopicSuggestion = ({ onSelectTopic }) => {
+const TopicSuggestion = ({ onSelectTopic, sessionId, sentiment }) => {
   const [topics, setTopics] = useState([]);
   const [isLoading, setIsLoading] = useState(true);
 
   useEffect(() => {
-    // Fetch topic suggestions from the API
+    // Fetch topic suggestions from the API, again whenever the conversation's mood changes
     const getTopics = async () => {
       try {
         setIsLoading(true);
-        const response = await fetchTopicSuggestions();
+        const response = await fetchTopicSuggestions(sessionId, sentiment);
         setTopics(response.topics);
       } catch (error) {
         console.error('Error fetching topic suggestions:', error);
@@ -27,7 +27,7 @@ const TopicSuggestion = ({ onSelectTopic }) => {
     };
 
     getTopics();
-  }, []);
+  }, [sessionId, sentiment]);
 
   // Handle topic selection
   const handleSelectTopic = (topic) => {
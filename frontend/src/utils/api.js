@@ -2,21 +2,95 @@
 const API_BASE_URL = process.env.REACT_APP_API_URL || 'http://localhost:5000';
 
 /**
- * Get a response from the chatbot API
- * @param {string} message - User's message
- * @param {Array} history - Previous messages in the conversation
- * @returns {Promise<Object>} - Response from the chatbot
+ * Build an Error for a failed API response, keeping the HTTP status
+ * @param {Response} response - The failed response
+ * @returns {Error} - Error with a status property
+ */
+const apiError = (response) => {
+  const error = new Error(`API error: ${response.status}`);
+  error.status = response.status;
+  return error;
+};
+
+/**
+ * Read Server-Sent Events from a streaming response until the "done" event
+ * @param {Response} response - Streaming response
+ * @param {Object} handlers - Called with each event's data, keyed by event type
+ * @returns {Promise<Object>} - Data of the final "done" event
+ */
+const readEventStream = async (response, handlers) => {
+  const reader = response.body.getReader();
+  const decoder = new TextDecoder();
+  let buffer = '';
+
+  while (true) {
+    const { value, done } = await reader.read();
+    if (done) break;
+
+    buffer += decoder.decode(value, { stream: true });
+    const events = buffer.split('\n\n');
+    buffer = events.pop();
+
+    for (const rawEvent of events) {
+      const lines = rawEvent.split('\n');
+      const eventType = (lines.find(line => line.startsWith('event:')) || '').slice(6).trim();
+      const data = JSON.parse((lines.find(line => line.startsWith('data:')) || 'data:{}').slice(5));
+
+      if (eventType === 'done') {
+        return data;
+      }
+      if (handlers[eventType]) {
+        handlers[eventType](data);
+      }
+    }
+  }
+
+  throw new Error('Stream ended before the response was complete');
+};
+
+/**
+ * Start a conversation session on the server, which then keeps the history
+ * @param {Array} history - Messages already shown, used to seed the session
+ * @returns {Promise<string>} - The new session ID
  */
-export const fetchChatResponse = async (message, history = []) => {
+export const createSession = async (history = []) => {
   try {
     // Format conversation history for the API
-    const formattedHistory = history
+    const turns = history
       .filter(msg => msg.text.trim() !== '')
       .map(msg => ({
         text: msg.text,
         sender: msg.sender
       }));
 
+    const response = await fetch(`${API_BASE_URL}/api/sessions`, {
+      method: 'POST',
+      headers: {
+        'Content-Type': 'application/json',
+      },
+      body: JSON.stringify({ turns }),
+    });
+
+    if (!response.ok) {
+      throw apiError(response);
+    }
+
+    const data = await response.json();
+    return data.session_id;
+  } catch (error) {
+    console.error('Error creating session:', error);
+    throw error;
+  }
+};
+
+/**
+ * Get a response from the chatbot API
+ * @param {string} message - User's message
+ * @param {string} sessionId - Server-side session holding the conversation history
+ * @returns {Promise<Object>} - Response from the chatbot
+ */
+export const fetchChatResponse = async (message, sessionId) => {
+  try {
     const response = await fetch(`${API_BASE_URL}/api/chat`, {
       method: 'POST',
       headers: {
@@ -24,12 +98,12 @@ export const fetchChatResponse = async (message, history = []) => {
       },
       body: JSON.stringify({
         message,
-        conversation_history: formattedHistory,
+        session_id: sessionId,
       }),
     });
 
     if (!response.ok) {
-      throw new Error(`API error: ${response.status}`);
+      throw apiError(response);
     }
 
     return await response.json();
@@ -39,6 +113,86 @@ export const fetchChatResponse = async (message, history = []) => {
   }
 };
 
+/**
+ * Stream a response from the chatbot API as it is generated
+ * @param {string} message - User's message
+ * @param {string} sessionId - Server-side session holding the conversation history
+ * @param {Function} onToken - Called with the text received so far whenever new tokens arrive
+ * @returns {Promise<Object>} - Final response from the chatbot once streaming completes
+ */
+export const streamChatResponse = async (message, sessionId, onToken = () => {}) => {
+  try {
+    const response = await fetch(`${API_BASE_URL}/api/chat/stream`, {
+      method: 'POST',
+      headers: {
+        'Content-Type': 'application/json',
+        'Accept': 'text/event-stream',
+      },
+      body: JSON.stringify({
+        message,
+        session_id: sessionId,
+      }),
+    });
+
+    if (!response.ok) {
+      throw apiError(response);
+    }
+
+    // The final response is the fully cleaned text and replaces the streamed preview
+    let streamedText = '';
+    return await readEventStream(response, {
+      token: (data) => {
+        streamedText += data.text;
+        onToken(streamedText);
+      },
+    });
+  } catch (error) {
+    console.error('Error streaming chat response:', error);
+    throw error;
+  }
+};
+
+/**
+ * Send a message through the chat pipeline: one request that returns the
+ * message's sentiment and streams the chatbot's response
+ * @param {string} message - User's message
+ * @param {string} sessionId - Server-side session holding the conversation history
+ * @param {Object} callbacks - onSentiment(result) once the sentiment is known,
+ *   onToken(textSoFar) whenever new tokens arrive
+ * @returns {Promise<Object>} - Final response from the chatbot once streaming completes
+ */
+export const streamChatPipeline = async (message, sessionId, { onSentiment = () => {}, onToken = () => {} } = {}) => {
+  try {
+    const response = await fetch(`${API_BASE_URL}/api/chat/pipeline/stream`, {
+      method: 'POST',
+      headers: {
+        'Content-Type': 'application/json',
+        'Accept': 'text/event-stream',
+      },
+      body: JSON.stringify({
+        message,
+        session_id: sessionId,
+      }),
+    });
+
+    if (!response.ok) {
+      throw apiError(response);
+    }
+
+    let streamedText = '';
+    return await readEventStream(response, {
+      sentiment: onSentiment,
+      token: (data) => {
+        streamedText += data.text;
+        onToken(streamedText);
+      },
+    });
+  } catch (error) {
+    console.error('Error streaming chat pipeline:', error);
+    throw error;
+  }
+};
+
 /**
  * Get sentiment analysis for a message
  * @param {string} message - Text to analyze
@@ -69,9 +223,13 @@ export const fetchSentimentAnalysis = async (message) => {
  * Get suggested conversation topics
  * @returns {Promise<Array>} - List of conversation topic suggestions
  */
-export const fetchTopicSuggestions = async () => {
+export const fetchTopicSuggestions = async (sessionId, sentiment) => {
   try {
-    const response = await fetch(`${API_BASE_URL}/api/topics`);
+    // Topics are picked to fit the session's conversation and current mood
+    const params = new URLSearchParams();
+    if (sessionId) params.set('session_id', sessionId);
+    if (sentiment) params.set('sentiment', sentiment);
+    const response = await fetch(`${API_BASE_URL}/api/topics?${params.toString()}`);
     
     if (!response.ok) {
       throw new Error(`API error: ${response.status}`);
@@ -0,0 +1,165 @@
+"""
+Benchmark training throughput with padded vs packed batches.
+
+Builds a synthetic dataset of conversations with realistic, skewed lengths
+and trains a small randomly initialized GPT-2 on it for a fixed number of
+steps in three layouts:
+
+    padded   one conversation per sample, padded to the longest in the batch
+    grouped  as padded, but batches are drawn from conversations of similar
+             length (length-grouped sampling)
+    packed   conversations concatenated and cut into full blocks, as written
+             by utils.dataset_shards (no padding at all)
+
+and reports samples/sec, real (non-padding) tokens/sec and the fraction of
+compute spent on padding. Run from the ml_training directory:
+
+    python benchmarks/bench_packing.py --steps 30 --output packing.json
+"""
+import json
+import time
+import random
+import argparse
+
+import numpy as np
+import torch
+from transformers import GPT2Config, GPT2LMHeadModel
+
+PAD_ID = 0
+EOS_ID = 1
+
+def synthetic_conversations(count, vocab_size, block_size, seed):
+    """
+    Token sequences with log-normally distributed lengths (most short, a few
+    near the block size), each ending with the end-of-text token.
+    """
+    rng = np.random.default_rng(seed)
+    lengths = np.clip(rng.lognormal(mean=3.3, sigma=0.6, size=count).astype(int), 8, block_size - 1)
+    return [np.append(rng.integers(2, vocab_size, size=length), EOS_ID) for length in lengths]
+
+def padded_batches(conversations, batch_size, grouped, seed):
+    order = list(range(len(conversations)))
+    random.Random(seed).shuffle(order)
+    if grouped:
+        # Sort within mega-batches of 50 batches, then shuffle the batches
+        mega = batch_size * 50
+        order = [i for start in range(0, len(order), mega)
+                 for i in sorted(order[start:start + mega], key=lambda i: len(conversations[i]))]
+    batches = [order[start:start + batch_size] for start in range(0, len(order), batch_size)]
+    if grouped:
+        random.Random(seed).shuffle(batches)
+
+    for batch in batches:
+        longest = max(len(conversations[i]) for i in batch)
+        input_ids = torch.full((len(batch), longest), PAD_ID, dtype=torch.long)
+        attention_mask = torch.zeros((len(batch), longest), dtype=torch.long)
+        for row, i in enumerate(batch):
+            input_ids[row, :len(conversations[i])] = torch.from_numpy(conversations[i])
+            attention_mask[row, :len(conversations[i])] = 1
+        labels = input_ids.masked_fill(attention_mask == 0, -100)
+        yield input_ids, attention_mask, labels
+
+def packed_batches(conversations, batch_size, block_size, seed):
+    stream = np.concatenate(conversations)
+    blocks = torch.from_numpy(stream[:len(stream) // block_size * block_size].reshape(-1, block_size)).long()
+    order = torch.randperm(len(blocks), generator=torch.Generator().manual_seed(seed))
+    for start in range(0, len(order), batch_size):
+        input_ids = blocks[order[start:start + batch_size]]
+        yield input_ids, torch.ones_like(input_ids), input_ids.clone()
+
+def train_steps(model, batches, steps):
+    """
+    Run optimizer steps, returning samples, real tokens, padded tokens and seconds.
+    """
+    optimizer = torch.optim.AdamW(model.parameters(), lr=1e-4)
+    model.train()
+    samples = real_tokens = total_tokens = 0
+
+    start = time.perf_counter()
+    for _, (input_ids, attention_mask, labels) in zip(range(steps), batches):
+        loss = model(input_ids=input_ids, attention_mask=attention_mask, labels=labels).loss
+        loss.backward()
+        optimizer.step()
+        optimizer.zero_grad()
+
+        samples += input_ids.shape[0]
+        real_tokens += int(attention_mask.sum())
+        total_tokens += input_ids.numel()
+    return samples, real_tokens, total_tokens, time.perf_counter() - start
+
+def main(args):
+    torch.manual_seed(args.seed)
+    torch.set_num_threads(args.torch_threads or torch.get_num_threads())
+
+    conversations = synthetic_conversations(args.conversations, args.vocab_size, args.block_size, args.seed)
+    mean_length = float(np.mean([len(c) for c in conversations]))
+    print(f"{len(conversations)} synthetic conversations, mean length {mean_length:.1f} tokens, "
+          f"block size {args.block_size}")
+
+    config = GPT2Config(vocab_size=args.vocab_size, n_positions=args.block_size, n_embd=args.n_embd,
+                        n_layer=args.n_layer, n_head=max(1, args.n_embd // 64),
+                        bos_token_id=EOS_ID, eos_token_id=EOS_ID, pad_token_id=PAD_ID)
+    initial_state = GPT2LMHeadModel(config).state_dict()
+
+    layouts = {
+        "padded": lambda: padded_batches(conversations, args.batch_size, False, args.seed),
+        "grouped": lambda: padded_batches(conversations, args.batch_size, True, args.seed),
+        "packed": lambda: packed_batches(conversations, args.batch_size, args.block_size, args.seed),
+    }
+
+    results = []
+    for layout in args.layouts:
+        model = GPT2LMHeadModel(config)
+        model.load_state_dict(initial_state)
+
+        # Warm up before measuring
+        train_steps(model, layouts[layout](), 2)
+        samples, real_tokens, total_tokens, seconds = train_steps(model, layouts[layout](), args.steps)
+
+        result = {
+            "layout": layout,
+            "steps": args.steps,
+            "samples_per_second": samples / seconds,
+            "tokens_per_second": real_tokens / seconds,
+            "padding_fraction": 1 - real_tokens / total_tokens,
+            "seconds": seconds,
+        }
+        results.append(result)
+        print(f"{layout:<8} | {result['samples_per_second']:8.1f} samples/s | "
+              f"{result['tokens_per_second']:9.0f} tokens/s | padding {result['padding_fraction']:6.1%}")
+
+    baseline = next((r for r in results if r["layout"] == "padded"), None)
+    if baseline:
+        for result in results:
+            result["tokens_per_second_vs_padded"] = result["tokens_per_second"] / baseline["tokens_per_second"]
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"mean_length": mean_length, "block_size": args.block_size, "results": results}, f, indent=2)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark padded vs packed training throughput")
+    parser.add_argument("--layouts", nargs="+", choices=["padded", "grouped", "packed"],
+                        default=["padded", "grouped", "packed"], help="Batch layouts to compare")
+    parser.add_argument("--steps", type=int, default=30,
+                        help="Optimizer steps measured per layout")
+    parser.add_argument("--batch_size", type=int, default=8,
+                        help="Samples per step")
+    parser.add_argument("--block_size", type=int, default=128,
+                        help="Block size for packing (and the maximum conversation length)")
+    parser.add_argument("--conversations", type=int, default=5000,
+                        help="Synthetic conversations to generate")
+    parser.add_argument("--vocab_size", type=int, default=2000,
+                        help="Vocabulary of the stand-in model")
+    parser.add_argument("--n_layer", type=int, default=4,
+                        help="Layers in the stand-in model")
+    parser.add_argument("--n_embd", type=int, default=256,
+                        help="Hidden size of the stand-in model")
+    parser.add_argument("--torch_threads", type=int, default=None,
+                        help="torch intra-op threads (default: torch's default)")
+    parser.add_argument("--seed", type=int, default=0,
+                        help="Random seed")
+    parser.add_argument("--output", type=str, default=None,
+                        help="Optional path for JSON results")
+
+    main(parser.parse_args())
@@ -0,0 +1,364 @@
+"""
+Script to distill the sentiment model into a small student that predicts
+negative, neutral and positive directly.
+
+The teacher (by default the two-label SST-2 DistilBERT the backend serves)
+labels a corpus of messages in batches. The backend's neutral class is the
+teacher's 0.4-0.6 confidence band, so the teacher's logits are folded into
+three-way logits whose argmax is exactly the label the backend would
+return. A small DistilBERT (few layers, narrow hidden size, the teacher's
+tokenizer) is trained on the softened three-way targets and saved with
+native labels, ready to use as SENTIMENT_MODEL_NAME.
+"""
+import os
+import json
+import math
+import random
+import logging
+import argparse
+import numpy as np
+import torch
+from transformers import (
+    AutoModelForSequenceClassification,
+    AutoTokenizer,
+    DistilBertConfig,
+    DistilBertForSequenceClassification,
+    Trainer,
+    TrainingArguments
+)
+from utils.data_processing import extract_messages
+from utils.dataset_shards import find_source_files, iter_records
+from utils.throughput import ThroughputCallback
+
+# Set up logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    handlers=[
+        logging.StreamHandler(),
+        logging.FileHandler("training_sentiment.log")
+    ]
+)
+logger = logging.getLogger(__name__)
+
+STUDENT_LABELS = ["negative", "neutral", "positive"]
+
+# Upper edge of the teacher confidence band the backend reports as neutral
+NEUTRAL_CONFIDENCE = 0.6
+
+def load_messages(data_paths, user_only=False, min_chars=2):
+    """
+    Collect distinct messages from conversation files (JSON array, JSONL or
+    CSV, see utils.data_processing) and plain text files with one message
+    per line.
+    """
+    messages = {}
+    for path in data_paths:
+        files = [path] if path.endswith(".txt") else find_source_files([path])
+        for file_path in files:
+            if file_path.endswith(".txt"):
+                with open(file_path, "r", encoding="utf-8") as f:
+                    texts = [" ".join(line.split()) for line in f]
+            else:
+                texts = [text for record in iter_records(file_path)
+                         for text in extract_messages(record, user_only=user_only)]
+            for text in texts:
+                if len(text) >= min_chars:
+                    messages.setdefault(text, None)
+    return list(messages)
+
+def predict_logits(texts, model, tokenizer, batch_size=64, max_length=128):
+    """
+    A classifier's logits for each text, computed in length-sorted batches.
+
+    Returns:
+        np.ndarray: float32 logits, one row per text
+    """
+    encodings = tokenizer(list(texts), truncation=True, max_length=max_length)["input_ids"]
+    order = sorted(range(len(texts)), key=lambda i: len(encodings[i]))
+    logits = np.zeros((len(texts), model.config.num_labels), dtype=np.float32)
+
+    model.eval()
+    for batch_number, start in enumerate(range(0, len(order), batch_size)):
+        indices = order[start:start + batch_size]
+        inputs = tokenizer.pad({"input_ids": [encodings[i] for i in indices]}, return_tensors="pt")
+        with torch.no_grad():
+            logits[indices] = model(**inputs.to(model.device)).logits.float().cpu().numpy()
+        if (batch_number + 1) % 100 == 0:
+            logger.info(f"Scored {start + len(indices)}/{len(texts)} messages")
+
+    return logits
+
+def load_teacher_labels(labels_path, texts, teacher, tokenizer, batch_size, max_length):
+    """
+    Teacher logits for texts, reusing those saved at labels_path and
+    appending the ones labeled now, so reruns only label new messages.
+    """
+    saved = {}
+    if os.path.exists(labels_path):
+        with open(labels_path, "r", encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    entry = json.loads(line)
+                    saved[entry["text"]] = entry["logits"]
+        logger.info(f"Loaded {len(saved)} teacher labels from {labels_path}")
+
+    missing = [text for text in texts if text not in saved]
+    if missing:
+        logger.info(f"Labeling {len(missing)} messages with the teacher")
+        logits = predict_logits(missing, teacher, tokenizer, batch_size, max_length)
+        os.makedirs(os.path.dirname(os.path.abspath(labels_path)), exist_ok=True)
+        with open(labels_path, "a", encoding="utf-8") as f:
+            for text, row in zip(missing, logits.tolist()):
+                saved[text] = row
+                f.write(json.dumps({"text": text, "logits": row}) + "\n")
+
+    return np.array([saved[text] for text in texts], dtype=np.float32)
+
+def three_way_logits(teacher_logits):
+    """
+    Fold the teacher's logits into negative/neutral/positive logits.
+
+    Two-label logits become [-d/2, c, d/2], where d is the positive minus
+    negative logit and c is half the margin at NEUTRAL_CONFIDENCE, so the
+    neutral logit is highest exactly when the teacher's confidence is
+    inside the backend's neutral band. Teachers that already have three
+    labels are used as they are.
+    """
+    if teacher_logits.shape[1] == 3:
+        return teacher_logits
+
+    margin = teacher_logits[:, 1] - teacher_logits[:, 0]
+    neutral = 0.5 * math.log(NEUTRAL_CONFIDENCE / (1 - NEUTRAL_CONFIDENCE))
+    return np.stack([-margin / 2, np.full_like(margin, neutral), margin / 2], axis=1)
+
+def build_student(teacher, n_layers=2, dim=256, n_heads=4):
+    """
+    A small DistilBERT classifier over the teacher's vocabulary. Its word
+    embeddings start from the teacher's, projected onto their top principal
+    components, so the student doesn't have to learn the vocabulary from
+    scratch.
+    """
+    config = DistilBertConfig(
+        vocab_size=teacher.config.vocab_size,
+        dim=dim,
+        hidden_dim=dim * 4,
+        n_layers=n_layers,
+        n_heads=n_heads,
+        pad_token_id=teacher.config.pad_token_id or 0,
+        num_labels=len(STUDENT_LABELS),
+        id2label=dict(enumerate(STUDENT_LABELS)),
+        label2id={label: i for i, label in enumerate(STUDENT_LABELS)},
+    )
+    student = DistilBertForSequenceClassification(config)
+
+    embeddings = teacher.get_input_embeddings().weight.detach().float()
+    if embeddings.shape[0] == config.vocab_size and embeddings.shape[1] > dim:
+        centered = embeddings - embeddings.mean(dim=0)
+        _, _, components = torch.pca_lowrank(centered, q=dim, center=False)
+        projected = centered @ components
+        # Match the scale of freshly initialized embeddings
+        projected *= config.initializer_range / projected.std()
+        student.get_input_embeddings().weight.data.copy_(projected)
+
+    return student
+
+class DistillationDataset(torch.utils.data.Dataset):
+    """
+    Tokenized messages with the teacher's three-way logits.
+    """
+    def __init__(self, encodings, teacher_logits):
+        self.encodings = encodings
+        self.teacher_logits = teacher_logits
+
+    def __len__(self):
+        return len(self.encodings)
+
+    def __getitem__(self, index):
+        return {"input_ids": self.encodings[index], "teacher_logits": self.teacher_logits[index]}
+
+class DistillationTrainer(Trainer):
+    """
+    Trainer whose loss is the temperature-scaled KL divergence from the
+    teacher's soft labels, mixed with cross-entropy on its hard labels.
+    """
+    def __init__(self, *args, temperature=2.0, alpha=0.7, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.temperature = temperature
+        self.alpha = alpha
+
+    def compute_loss(self, model, inputs, return_outputs=False, num_items_in_batch=None):
+        teacher_logits = inputs.pop("teacher_logits")
+        outputs = model(**inputs)
+        logits = outputs.logits
+
+        soft_loss = torch.nn.functional.kl_div(
+            torch.nn.functional.log_softmax(logits / self.temperature, dim=-1),
+            torch.nn.functional.softmax(teacher_logits / self.temperature, dim=-1),
+            reduction="batchmean"
+        ) * self.temperature ** 2
+        hard_loss = torch.nn.functional.cross_entropy(logits, teacher_logits.argmax(dim=-1))
+        loss = self.alpha * soft_loss + (1 - self.alpha) * hard_loss
+
+        return (loss, outputs) if return_outputs else loss
+
+def make_collator(tokenizer):
+    def collate(features):
+        batch = tokenizer.pad({"input_ids": [feature["input_ids"] for feature in features]}, return_tensors="pt")
+        batch["teacher_logits"] = torch.tensor(np.stack([feature["teacher_logits"] for feature in features]))
+        return batch
+    return collate
+
+def evaluate_agreement(student, tokenizer, texts, teacher_logits, batch_size=64, max_length=128):
+    """
+    How often the student picks the label the teacher would be served with.
+    """
+    student_logits = predict_logits(texts, student, tokenizer, batch_size, max_length)
+    teacher_labels = teacher_logits.argmax(axis=1)
+    student_labels = student_logits.argmax(axis=1)
+
+    report = {
+        "messages": len(texts),
+        "agreement": float((teacher_labels == student_labels).mean()) if len(texts) else None,
+        "per_label": {},
+    }
+    for index, label in enumerate(STUDENT_LABELS):
+        mask = teacher_labels == index
+        report["per_label"][label] = {
+            "teacher_count": int(mask.sum()),
+            "agreement": float((student_labels[mask] == index).mean()) if mask.any() else None,
+        }
+    return report
+
+def distill(args):
+    """
+    Label the corpus with the teacher, train the student and save it.
+    """
+    logger.info(f"Loading teacher model: {args.teacher_model}")
+    tokenizer = AutoTokenizer.from_pretrained(args.teacher_model)
+    teacher = AutoModelForSequenceClassification.from_pretrained(args.teacher_model)
+    if teacher.config.num_labels not in (2, 3):
+        raise ValueError(f"Teacher must have 2 or 3 labels, not {teacher.config.num_labels}")
+    if torch.cuda.is_available():
+        teacher.to("cuda")
+
+    texts = load_messages(args.data_path, user_only=args.user_only)
+    random.Random(args.seed).shuffle(texts)
+    if args.max_messages:
+        texts = texts[:args.max_messages]
+    if len(texts) < 10:
+        raise ValueError(f"Found only {len(texts)} messages in {args.data_path}")
+    logger.info(f"Distilling on {len(texts)} distinct messages")
+
+    labels_path = args.labels_path or os.path.join(args.output_dir, "teacher_labels.jsonl")
+    teacher_logits = three_way_logits(load_teacher_labels(
+        labels_path, texts, teacher, tokenizer, args.label_batch_size, args.max_length))
+    distribution = np.bincount(teacher_logits.argmax(axis=1), minlength=3) / len(texts)
+    logger.info("Teacher labels: " + ", ".join(
+        f"{label} {share:.1%}" for label, share in zip(STUDENT_LABELS, distribution)))
+
+    # Hold out a slice of the corpus to measure agreement on
+    eval_size = max(1, int(len(texts) * args.eval_fraction))
+    train_texts, eval_texts = texts[eval_size:], texts[:eval_size]
+    train_logits, eval_logits = teacher_logits[eval_size:], teacher_logits[:eval_size]
+
+    student = build_student(teacher, n_layers=args.n_layers, dim=args.dim, n_heads=args.n_heads)
+    teacher.to("cpu")
+    logger.info(f"Student: {sum(p.numel() for p in student.parameters()) / 1e6:.1f}M parameters, "
+                f"teacher: {sum(p.numel() for p in teacher.parameters()) / 1e6:.1f}M")
+
+    encodings = tokenizer(train_texts, truncation=True, max_length=args.max_length)["input_ids"]
+    train_dataset = DistillationDataset(encodings, train_logits)
+    mean_tokens = sum(len(ids) for ids in encodings) / len(encodings)
+
+    training_args = TrainingArguments(
+        output_dir=args.output_dir,
+        num_train_epochs=args.epochs,
+        per_device_train_batch_size=args.batch_size,
+        learning_rate=args.learning_rate,
+        warmup_steps=min(500, len(train_dataset) // args.batch_size),
+        weight_decay=0.01,
+        logging_steps=args.logging_steps,
+        save_strategy="no",
+        # Keep teacher_logits, which the model's forward doesn't take
+        remove_unused_columns=False,
+        report_to=[],
+        seed=args.seed,
+    )
+
+    trainer = DistillationTrainer(
+        model=student,
+        args=training_args,
+        data_collator=make_collator(tokenizer),
+        train_dataset=train_dataset,
+        callbacks=[ThroughputCallback(args.batch_size * max(1, torch.cuda.device_count()), round(mean_tokens))],
+        temperature=args.temperature,
+        alpha=args.alpha,
+    )
+
+    logger.info("Starting distillation...")
+    trainer.train()
+
+    student = trainer.model.to("cpu")
+    report = evaluate_agreement(student, tokenizer, eval_texts, eval_logits, args.label_batch_size,
+                                args.max_length)
+    report["teacher_model"] = args.teacher_model
+    report["student_parameters"] = sum(p.numel() for p in student.parameters())
+    report["teacher_parameters"] = sum(p.numel() for p in teacher.parameters())
+    report["teacher_label_distribution"] = dict(zip(STUDENT_LABELS, distribution.tolist()))
+    logger.info(f"Agreement with the teacher on {report['messages']} held-out messages: {report['agreement']:.1%}")
+
+    # Save model and tokenizer
+    logger.info(f"Saving student model to {args.output_dir}")
+    student.save_pretrained(args.output_dir)
+    tokenizer.save_pretrained(args.output_dir)
+    with open(os.path.join(args.output_dir, "distillation_report.json"), "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+
+    logger.info("Distillation complete!")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Distill the sentiment model into a small three-label student")
+    parser.add_argument("--teacher_model", type=str, default="distilbert-base-uncased-finetuned-sst-2-english",
+                        help="Teacher sentiment model (two labels with the backend's neutral band, or three)")
+    parser.add_argument("--data_path", type=str, nargs="+", required=True,
+                        help="Conversation data files (JSON array, JSONL or CSV), text files with one message "
+                             "per line, or directories of conversation files")
+    parser.add_argument("--user_only", action="store_true",
+                        help="Only use the user's messages from conversations")
+    parser.add_argument("--max_messages", type=int, default=None,
+                        help="Use at most this many distinct messages")
+    parser.add_argument("--labels_path", type=str, default=None,
+                        help="Teacher labels, reused across runs (default: <output_dir>/teacher_labels.jsonl)")
+    parser.add_argument("--label_batch_size", type=int, default=64,
+                        help="Messages per teacher forward pass")
+    parser.add_argument("--max_length", type=int, default=128,
+                        help="Tokens per message (longer messages are truncated, as in the backend)")
+    parser.add_argument("--output_dir", type=str, default="./sentiment_student",
+                        help="Directory to save the student model")
+    parser.add_argument("--n_layers", type=int, default=2,
+                        help="Student transformer layers")
+    parser.add_argument("--dim", type=int, default=256,
+                        help="Student hidden size")
+    parser.add_argument("--n_heads", type=int, default=4,
+                        help="Student attention heads")
+    parser.add_argument("--epochs", type=int, default=3,
+                        help="Number of training epochs")
+    parser.add_argument("--batch_size", type=int, default=64,
+                        help="Training batch size")
+    parser.add_argument("--learning_rate", type=float, default=3e-4,
+                        help="Learning rate")
+    parser.add_argument("--temperature", type=float, default=2.0,
+                        help="Softmax temperature for the teacher's soft labels")
+    parser.add_argument("--alpha", type=float, default=0.7,
+                        help="Weight of the soft-label loss (the rest is cross-entropy on hard labels)")
+    parser.add_argument("--eval_fraction", type=float, default=0.05,
+                        help="Share of messages held out to measure agreement with the teacher")
+    parser.add_argument("--logging_steps", type=int, default=100,
+                        help="Log training stats every X steps")
+    parser.add_argument("--seed", type=int, default=42,
+                        help="Random seed for shuffling and initialization")
+
+    args = parser.parse_args()
+
+    distill(args)
@@ -2,21 +2,20 @@
 Script to fine-tune DialoGPT model on elderly-appropriate conversations
 """
 import os
-import json
+import math
 import torch
 import logging
 import argparse
-import pandas as pd
-from tqdm import tqdm
 from transformers import (
     AutoModelForCausalLM,
     AutoTokenizer,
-    TextDataset,
-    DataCollatorForLanguageModeling,
     Trainer,
-    TrainingArguments
+    TrainingArguments,
+    default_data_collator
 )
-from utils.data_processing import preprocess_conversations
+from transformers.trainer_utils import get_last_checkpoint
+from utils.dataset_shards import ShardedBlockDataset, prepare_shards
+from utils.throughput import ThroughputCallback
 
 # Set up logging
 logging.basicConfig(
@@ -29,42 +28,23 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-def prepare_dataset(data_path, output_dir, tokenizer):
+def prepare_dataset(data_paths, shard_dir, tokenizer, block_size=128, num_workers=None):
     """
-    Prepare the dataset for training. Converts conversation data to text files.
+    Prepare the dataset for training. Streams the conversation files through
+    tokenization into memory-mapped shards (reusing shards of unchanged files)
+    and returns a dataset reading from them.
     """
-    os.makedirs(output_dir, exist_ok=True)
-    
-    # Load and preprocess conversations
-    if data_path.endswith('.json'):
-        with open(data_path, 'r', encoding='utf-8') as f:
-            conversations = json.load(f)
-    elif data_path.endswith('.csv'):
-        df = pd.read_csv(data_path)
-        conversations = df.to_dict('records')
-    else:
-        raise ValueError(f"Unsupported file format: {data_path}")
-    
-    logger.info(f"Loaded {len(conversations)} conversations from {data_path}")
-    
-    # Preprocess conversations into training format
-    processed_conversations = preprocess_conversations(conversations)
-    
-    # Save as text file for TextDataset
-    train_file = os.path.join(output_dir, "train.txt")
-    with open(train_file, 'w', encoding='utf-8') as f:
-        for conversation in processed_conversations:
-            f.write(conversation + "\n")
-    
-    logger.info(f"Saved processed conversations to {train_file}")
-    
-    # Create datasets
-    train_dataset = TextDataset(
-        tokenizer=tokenizer,
-        file_path=train_file,
-        block_size=128
+    shard_dirs = prepare_shards(
+        data_paths,
+        shard_dir,
+        tokenizer,
+        block_size=block_size,
+        num_workers=num_workers
     )
     
+    train_dataset = ShardedBlockDataset(shard_dirs)
+    logger.info(f"Training on {len(train_dataset)} blocks of {block_size} tokens from {len(shard_dirs)} files")
+    
     return train_dataset
 
 def train_model(args):
@@ -83,15 +63,18 @@ def train_model(args):
     logger.info("Preparing dataset...")
     train_dataset = prepare_dataset(
         args.data_path,
-        args.output_dir,
-        tokenizer
+        args.shard_dir or os.path.join(args.output_dir, "data"),
+        tokenizer,
+        block_size=args.block_size,
+        num_workers=args.num_workers
     )
     
-    # Data collator
-    data_collator = DataCollatorForLanguageModeling(
-        tokenizer=tokenizer,
-        mlm=False
-    )
+    # Reach the effective batch size by accumulating gradients over several
+    # per-device batches
+    gradient_accumulation_steps = max(1, math.ceil((args.effective_batch_size or args.batch_size) / args.batch_size))
+    samples_per_step = args.batch_size * gradient_accumulation_steps * max(1, torch.cuda.device_count())
+    logger.info(f"Batch size {args.batch_size} x {gradient_accumulation_steps} accumulation steps "
+                f"= {samples_per_step} samples per optimizer step")
     
     # Training arguments
     training_args = TrainingArguments(
@@ -99,8 +82,9 @@ def train_model(args):
         overwrite_output_dir=True,
         num_train_epochs=args.epochs,
         per_device_train_batch_size=args.batch_size,
+        gradient_accumulation_steps=gradient_accumulation_steps,
         save_steps=args.save_steps,
-        save_total_limit=2,
+        save_total_limit=args.save_total_limit,
         prediction_loss_only=True,
         logging_dir=os.path.join(args.output_dir, "logs"),
         logging_steps=args.logging_steps,
@@ -109,17 +93,26 @@ def train_model(args):
         weight_decay=0.01,
     )
     
-    # Initialize trainer
+    # Initialize trainer. Blocks are packed, so batches need no padding and
+    # every token (including the end-of-text separators) is trained on
     trainer = Trainer(
         model=model,
         args=training_args,
-        data_collator=data_collator,
+        data_collator=default_data_collator,
         train_dataset=train_dataset,
+        callbacks=[ThroughputCallback(samples_per_step, train_dataset.block_size)],
     )
     
+    # Pick up from the latest checkpoint of an interrupted run
+    last_checkpoint = None
+    if not args.no_resume and os.path.isdir(args.output_dir):
+        last_checkpoint = get_last_checkpoint(args.output_dir)
+    if last_checkpoint:
+        logger.info(f"Resuming training from {last_checkpoint}")
+    
     # Train model
     logger.info("Starting training...")
-    trainer.train()
+    trainer.train(resume_from_checkpoint=last_checkpoint)
     
     # Save model and tokenizer
     logger.info(f"Saving fine-tuned model to {args.output_dir}")
@@ -132,16 +125,28 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Fine-tune DialoGPT for elderly companion chatbot")
     parser.add_argument("--base_model", type=str, default="microsoft/DialoGPT-medium", 
                         help="Base model to fine-tune")
-    parser.add_argument("--data_path", type=str, required=True, 
-                        help="Path to conversation data (JSON or CSV)")
+    parser.add_argument("--data_path", type=str, nargs="+", required=True, 
+                        help="Conversation data files (JSON array, JSONL or CSV) or directories of them")
+    parser.add_argument("--shard_dir", type=str, default=None, 
+                        help="Where to keep tokenized shards (default: <output_dir>/data)")
+    parser.add_argument("--block_size", type=int, default=128, 
+                        help="Tokens per training example")
+    parser.add_argument("--num_workers", type=int, default=None, 
+                        help="Tokenization processes (default: all cores)")
     parser.add_argument("--output_dir", type=str, default="./output", 
                         help="Directory to save the fine-tuned model")
     parser.add_argument("--epochs", type=int, default=3, 
                         help="Number of training epochs")
     parser.add_argument("--batch_size", type=int, default=4, 
                         help="Training batch size")
+    parser.add_argument("--effective_batch_size", type=int, default=None, 
+                        help="Samples per optimizer step, reached by gradient accumulation (default: batch_size)")
     parser.add_argument("--save_steps", type=int, default=1000, 
                         help="Save checkpoint every X steps")
+    parser.add_argument("--save_total_limit", type=int, default=2, 
+                        help="Checkpoints to keep in output_dir")
+    parser.add_argument("--no_resume", action="store_true", 
+                        help="Start from scratch even if output_dir has checkpoints")
     parser.add_argument("--logging_steps", type=int, default=100, 
                         help="Log training stats every X steps")
     parser.add_argument("--learning_rate", type=float, default=5e-5, 
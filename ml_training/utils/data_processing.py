@@ -0,0 +1,133 @@
+"""
+Conversation records -> training text, in the prompt format the backend uses
+("User: ..." / "Assistant: ..." lines).
+"""
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Keys that may hold a conversation's list of messages
+MESSAGE_LIST_KEYS = ("messages", "turns", "conversation", "dialogue")
+
+# Keys that may hold a single message's sender and text
+SENDER_KEYS = ("sender", "role", "speaker", "from")
+TEXT_KEYS = ("text", "content", "message", "value")
+
+# Single-exchange records, e.g. CSV rows with one column per side
+USER_KEYS = ("user", "input", "prompt", "question")
+BOT_KEYS = ("assistant", "bot", "response", "output", "answer")
+
+USER_SENDERS = {"user", "human", "elder", "client", "patient"}
+
+def _first(record, keys):
+    for key in keys:
+        value = record.get(key)
+        if isinstance(value, str) and value.strip():
+            return value
+    return None
+
+def _iter_messages(messages):
+    """
+    Yield (is_user, text) for each message with text, whitespace collapsed.
+    """
+    count = 0
+    for message in messages:
+        if isinstance(message, str):
+            # Plain strings alternate between the user and the assistant
+            sender = "user" if count % 2 == 0 else "bot"
+            text = message
+        elif isinstance(message, dict):
+            sender = str(_first(message, SENDER_KEYS) or "user").lower()
+            text = _first(message, TEXT_KEYS)
+        else:
+            continue
+
+        if text and text.strip():
+            count += 1
+            yield sender in USER_SENDERS, " ".join(text.split())
+
+def _format_messages(messages):
+    return "\n".join(f"{'User' if is_user else 'Assistant'}: {text}" for is_user, text in _iter_messages(messages))
+
+def _record_messages(record):
+    """
+    The list of messages in a conversation record, or None if it has none.
+    """
+    if isinstance(record, list):
+        return record
+    if not isinstance(record, dict):
+        return None
+
+    for key in MESSAGE_LIST_KEYS:
+        messages = record.get(key)
+        if isinstance(messages, str):
+            try:
+                messages = json.loads(messages)
+            except ValueError:
+                continue
+        if isinstance(messages, list):
+            return messages
+
+    user_text, bot_text = _first(record, USER_KEYS), _first(record, BOT_KEYS)
+    if user_text and bot_text:
+        return [{"sender": "user", "text": user_text}, {"sender": "bot", "text": bot_text}]
+
+    return None
+
+def format_conversation(record):
+    """
+    Format one conversation record as training text.
+
+    Accepts a list of messages, a dict holding one (under "messages", "turns",
+    ... possibly JSON-encoded, as in a CSV column), a single user/response
+    exchange, or a dict with preformatted "text".
+
+    Returns:
+        str: The formatted conversation, or None if the record holds no text
+    """
+    messages = _record_messages(record)
+    if messages is not None:
+        return _format_messages(messages) or None
+
+    text = record.get("text") if isinstance(record, dict) else None
+    if isinstance(text, str) and text.strip():
+        return text.strip()
+
+    return None
+
+def extract_messages(record, user_only=False):
+    """
+    The individual message texts of one conversation record, in any of the
+    layouts format_conversation accepts. A dict with only "text" counts as
+    one message.
+
+    Args:
+        record: A conversation record
+        user_only (bool): Keep only the user's messages
+
+    Returns:
+        list: Message texts
+    """
+    messages = _record_messages(record)
+    if messages is not None:
+        return [text for is_user, text in _iter_messages(messages) if is_user or not user_only]
+
+    text = record.get("text") if isinstance(record, dict) else None
+    if isinstance(text, str) and text.strip():
+        return [" ".join(text.split())]
+
+    return []
+
+def preprocess_conversations(conversations):
+    """
+    Format a list of conversation records, skipping records without text.
+
+    Returns:
+        list: Formatted conversations
+    """
+    processed = [format_conversation(record) for record in conversations]
+    skipped = sum(1 for text in processed if text is None)
+    if skipped:
+        logger.warning(f"Skipped {skipped} conversations without any text")
+    return [text for text in processed if text is not None]
@@ -0,0 +1,375 @@
+"""
+Streaming dataset preparation for causal LM fine-tuning.
+
+Conversation exports (JSON array, JSONL or CSV) are read incrementally,
+formatted and tokenized on several processes, and the token stream is packed
+into fixed-size blocks written to uint16 shard files on disk. Training reads
+the shards through memory maps, so neither preparation nor training holds the
+dataset in memory. Each source file gets its own shard directory keyed by its
+content hash, so a re-run only re-tokenizes files that changed.
+"""
+import csv
+import collections
+import hashlib
+import json
+import logging
+import multiprocessing
+import os
+import sys
+import numpy as np
+import torch
+from utils.data_processing import format_conversation
+
+logger = logging.getLogger(__name__)
+
+SUPPORTED_EXTENSIONS = (".json", ".jsonl", ".csv")
+
+# Bump when the shard layout or text formatting changes, invalidating old shards
+SHARD_FORMAT_VERSION = 1
+
+MANIFEST_NAME = "manifest.json"
+
+def _iter_json_array(f, chunk_size=1 << 20):
+    """
+    Yield the elements of a top-level JSON array one at a time, reading the
+    file in chunks instead of parsing it whole.
+    """
+    decoder = json.JSONDecoder()
+    buffer = ""
+    position = 0
+    started = False
+    eof = False
+
+    while True:
+        # Skip whitespace and separators up to the next element
+        while True:
+            while position < len(buffer) and buffer[position] in " \t\r\n,":
+                position += 1
+            if not started and position < len(buffer):
+                if buffer[position] != "[":
+                    raise ValueError("Expected a JSON array of conversations")
+                started = True
+                position += 1
+                continue
+            break
+
+        if position < len(buffer) and buffer[position] == "]":
+            return
+
+        try:
+            element, end = decoder.raw_decode(buffer, position)
+        except json.JSONDecodeError:
+            # Incomplete element: read more and retry
+            if eof:
+                if buffer[position:].strip():
+                    raise
+                return
+            chunk = f.read(chunk_size)
+            eof = not chunk
+            buffer = buffer[position:] + chunk
+            position = 0
+            continue
+
+        # An element must be followed by a separator; otherwise it may be a
+        # number cut off at the end of the chunk (e.g. "2." of "2.5")
+        if not eof and (end == len(buffer) or buffer[end] not in " \t\r\n,]"):
+            chunk = f.read(chunk_size)
+            eof = not chunk
+            buffer = buffer[position:] + chunk
+            position = 0
+            continue
+
+        yield element
+        position = end
+
+def iter_records(path):
+    """
+    Stream conversation records from a JSON array, JSONL or CSV file.
+    """
+    if path.endswith(".jsonl"):
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+    elif path.endswith(".json"):
+        with open(path, "r", encoding="utf-8") as f:
+            yield from _iter_json_array(f)
+    elif path.endswith(".csv"):
+        # Conversations stored as JSON in a single column can be long
+        csv.field_size_limit(min(sys.maxsize, 2 ** 31 - 1))
+        with open(path, "r", encoding="utf-8", newline="") as f:
+            yield from csv.DictReader(f)
+    else:
+        raise ValueError(f"Unsupported file format: {path}")
+
+def find_source_files(data_paths):
+    """
+    Expand files and directories into the supported data files they contain.
+    """
+    files = []
+    for path in data_paths:
+        if os.path.isdir(path):
+            files.extend(sorted(
+                os.path.join(root, name)
+                for root, _, names in os.walk(path)
+                for name in names if name.endswith(SUPPORTED_EXTENSIONS)
+            ))
+        else:
+            files.append(path)
+    return files
+
+def file_sha256(path, chunk_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+# Tokenizer loaded once in each tokenization process
+_worker_tokenizer = None
+
+def _init_tokenizer_worker(tokenizer_name):
+    global _worker_tokenizer
+    os.environ["TOKENIZERS_PARALLELISM"] = "false"
+    from transformers import AutoTokenizer
+    _worker_tokenizer = AutoTokenizer.from_pretrained(tokenizer_name)
+
+def _tokenize_batch(texts):
+    """
+    Tokenize a batch of conversations, each followed by the end-of-text token.
+
+    Returns:
+        numpy.ndarray: The batch's tokens concatenated, as uint16
+    """
+    eos = [_worker_tokenizer.eos_token_id]
+    encoded = _worker_tokenizer(texts, add_special_tokens=False)["input_ids"]
+    return np.concatenate([np.asarray(ids + eos, dtype=np.uint16) for ids in encoded])
+
+def _batched_texts(path, batch_size, counts):
+    batch = []
+    for record in iter_records(path):
+        text = format_conversation(record)
+        if text is None:
+            counts["skipped"] += 1
+            continue
+        counts["documents"] += 1
+        batch.append(text)
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+class _ShardWriter:
+    """
+    Packs a token stream into blocks and writes them to numbered shard files.
+    """
+    def __init__(self, output_dir, block_size, blocks_per_shard):
+        self.output_dir = output_dir
+        self.block_size = block_size
+        self.blocks_per_shard = blocks_per_shard
+        self.shards = []
+        self._pending = np.empty(0, dtype=np.uint16)
+        self._file = None
+        self._file_blocks = 0
+
+    def add(self, tokens):
+        tokens = np.concatenate([self._pending, tokens]) if len(self._pending) else tokens
+        num_blocks = len(tokens) // self.block_size
+        offset = 0
+        while num_blocks:
+            if self._file is None:
+                name = f"shard_{len(self.shards):05d}.bin"
+                self._file = open(os.path.join(self.output_dir, name), "wb")
+                self.shards.append({"file": name, "blocks": 0})
+            count = min(num_blocks, self.blocks_per_shard - self._file_blocks)
+            end = offset + count * self.block_size
+            self._file.write(tokens[offset:end].tobytes())
+            self._file_blocks += count
+            self.shards[-1]["blocks"] = self._file_blocks
+            offset, num_blocks = end, num_blocks - count
+            if self._file_blocks == self.blocks_per_shard:
+                self._close_file()
+        self._pending = tokens[offset:].copy()
+
+    def close(self):
+        """
+        Finish the last shard. The final partial block is dropped, as with TextDataset.
+
+        Returns:
+            int: Tokens dropped
+        """
+        self._close_file()
+        return len(self._pending)
+
+    def _close_file(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+            self._file_blocks = 0
+
+def _prepare_source(path, output_dir, tokenizer_name, vocab_size, block_size, blocks_per_shard, num_workers,
+                    batch_size):
+    """
+    Tokenize one source file into its shard directory, unless shards for the
+    same content and settings are already there.
+
+    Returns:
+        str: The source's shard directory
+    """
+    source_hash = file_sha256(path)
+    fingerprint = {
+        "version": SHARD_FORMAT_VERSION,
+        "source_sha256": source_hash,
+        "tokenizer": tokenizer_name,
+        "block_size": block_size,
+    }
+    stem = os.path.splitext(os.path.basename(path))[0]
+    shard_dir = os.path.join(output_dir, f"{stem}-{source_hash[:12]}")
+    manifest_path = os.path.join(shard_dir, MANIFEST_NAME)
+
+    if os.path.exists(manifest_path):
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+        if all(manifest.get(key) == value for key, value in fingerprint.items()) and all(
+                os.path.exists(os.path.join(shard_dir, shard["file"])) for shard in manifest["shards"]):
+            logger.info(f"Reusing {manifest['total_blocks']} blocks from {shard_dir} (source unchanged)")
+            return shard_dir
+
+    if vocab_size > np.iinfo(np.uint16).max + 1:
+        raise ValueError(f"Tokenizer vocabulary ({vocab_size}) does not fit in uint16 shards")
+
+    os.makedirs(shard_dir, exist_ok=True)
+    for name in os.listdir(shard_dir):
+        os.remove(os.path.join(shard_dir, name))
+
+    logger.info(f"Tokenizing {path} with {num_workers} processes")
+    writer = _ShardWriter(shard_dir, block_size, blocks_per_shard)
+    counts = {"documents": 0, "skipped": 0, "tokens": 0}
+
+    def write(batch_tokens):
+        writer.add(batch_tokens)
+        counts["tokens"] += len(batch_tokens)
+
+    batches = _batched_texts(path, batch_size, counts)
+    if num_workers > 1:
+        with multiprocessing.Pool(num_workers, initializer=_init_tokenizer_worker, initargs=(tokenizer_name,)) as pool:
+            # A bounded window of batches in flight keeps memory flat (Pool.imap
+            # would read the whole file ahead); results are written in source
+            # order, so shards are reproducible
+            in_flight = collections.deque()
+            for batch in batches:
+                in_flight.append(pool.apply_async(_tokenize_batch, (batch,)))
+                if len(in_flight) >= 2 * num_workers:
+                    write(in_flight.popleft().get())
+            while in_flight:
+                write(in_flight.popleft().get())
+    else:
+        _init_tokenizer_worker(tokenizer_name)
+        for batch in batches:
+            write(_tokenize_batch(batch))
+    dropped = writer.close()
+
+    manifest = {
+        **fingerprint,
+        "source": os.path.abspath(path),
+        "dtype": "uint16",
+        "documents": counts["documents"],
+        "skipped_records": counts["skipped"],
+        "tokens": counts["tokens"],
+        "dropped_tokens": dropped,
+        "total_blocks": sum(shard["blocks"] for shard in writer.shards),
+        "shards": writer.shards,
+    }
+    # Written last, so an interrupted run is never mistaken for a complete one
+    with open(manifest_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+
+    logger.info(f"Wrote {manifest['total_blocks']} blocks of {block_size} tokens from {counts['documents']} "
+                f"conversations in {len(writer.shards)} shards to {shard_dir}")
+    return shard_dir
+
+def prepare_shards(data_paths, output_dir, tokenizer, block_size=128, blocks_per_shard=65536, num_workers=None,
+                   batch_size=256):
+    """
+    Prepare memory-mapped training shards for conversation data files.
+
+    Args:
+        data_paths (list): Data files (.json, .jsonl, .csv) and/or directories containing them
+        output_dir (str): Where to write the shards (one subdirectory per source file)
+        tokenizer: Tokenizer (or its name/path) used for training
+        block_size (int): Tokens per training example
+        blocks_per_shard (int): Blocks per shard file
+        num_workers (int): Tokenization processes (default: all cores)
+        batch_size (int): Conversations per tokenization task
+
+    Returns:
+        list: Shard directories, one per source file
+    """
+    if isinstance(data_paths, str):
+        data_paths = [data_paths]
+    if isinstance(tokenizer, str):
+        from transformers import AutoTokenizer
+        tokenizer = AutoTokenizer.from_pretrained(tokenizer)
+    tokenizer_name = tokenizer.name_or_path
+    vocab_size = len(tokenizer)
+    num_workers = max(1, num_workers or os.cpu_count() or 1)
+
+    sources = find_source_files(data_paths)
+    if not sources:
+        raise ValueError(f"No data files found in {data_paths}")
+
+    os.makedirs(output_dir, exist_ok=True)
+    return [
+        _prepare_source(path, output_dir, tokenizer_name, vocab_size, block_size, blocks_per_shard, num_workers,
+                        batch_size)
+        for path in sources
+    ]
+
+class ShardedBlockDataset(torch.utils.data.Dataset):
+    """
+    Training examples read from the shards written by prepare_shards.
+
+    Shards are opened as read-only memory maps on first access in each
+    process (including DataLoader workers), so the data is paged in from disk
+    as needed instead of being loaded.
+    """
+    def __init__(self, shard_dirs):
+        self.shards = []
+        self.block_size = None
+        for shard_dir in shard_dirs:
+            with open(os.path.join(shard_dir, MANIFEST_NAME), "r", encoding="utf-8") as f:
+                manifest = json.load(f)
+            if self.block_size not in (None, manifest["block_size"]):
+                raise ValueError("All shards must use the same block size")
+            self.block_size = manifest["block_size"]
+            self.shards.extend((os.path.join(shard_dir, shard["file"]), shard["blocks"])
+                               for shard in manifest["shards"] if shard["blocks"])
+
+        self._offsets = np.cumsum([0] + [blocks for _, blocks in self.shards])
+        self._maps = {}
+        self._maps_pid = None
+
+    def __len__(self):
+        return int(self._offsets[-1])
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(index)
+
+        shard = int(np.searchsorted(self._offsets, index, side="right")) - 1
+        input_ids = torch.from_numpy(self._shard_map(shard)[index - self._offsets[shard]].astype(np.int64))
+        return {"input_ids": input_ids, "labels": input_ids.clone()}
+
+    def _shard_map(self, shard):
+        if self._maps_pid != os.getpid():
+            self._maps = {}
+            self._maps_pid = os.getpid()
+        shard_map = self._maps.get(shard)
+        if shard_map is None:
+            path, blocks = self.shards[shard]
+            shard_map = self._maps[shard] = np.memmap(path, dtype=np.uint16, mode="r",
+                                                      shape=(blocks, self.block_size))
+        return shard_map
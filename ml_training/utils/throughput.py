@@ -0,0 +1,51 @@
+"""
+Training throughput reporting for the Hugging Face Trainer.
+"""
+import logging
+import time
+from transformers import TrainerCallback
+
+logger = logging.getLogger(__name__)
+
+class ThroughputCallback(TrainerCallback):
+    """
+    Measures optimizer step times and logs samples/sec and tokens/sec,
+    averaged over the steps since the previous Trainer log. The rates are also
+    added to the log history saved in trainer_state.json. Time spent in
+    evaluation and checkpointing between steps is not counted.
+
+    Args:
+        samples_per_step (int): Samples per optimizer step (per-device batch
+            size x gradient accumulation steps x devices)
+        tokens_per_sample (int): Tokens in each sample; with packed blocks
+            every token is a real token
+    """
+    def __init__(self, samples_per_step, tokens_per_sample):
+        self.samples_per_step = samples_per_step
+        self.tokens_per_sample = tokens_per_sample
+        self._step_start = None
+        self._steps = 0
+        self._seconds = 0.0
+
+    def on_step_begin(self, args, state, control, **kwargs):
+        self._step_start = time.perf_counter()
+
+    def on_step_end(self, args, state, control, **kwargs):
+        if self._step_start is not None:
+            self._seconds += time.perf_counter() - self._step_start
+            self._steps += 1
+            self._step_start = None
+
+    def on_log(self, args, state, control, logs=None, **kwargs):
+        if logs is None or not self._steps or not self._seconds:
+            return
+
+        samples_per_second = self._steps * self.samples_per_step / self._seconds
+        logs["step_seconds"] = round(self._seconds / self._steps, 4)
+        logs["samples_per_second"] = round(samples_per_second, 2)
+        logs["tokens_per_second"] = round(samples_per_second * self.tokens_per_sample, 1)
+        logger.info(f"Step {state.global_step}: {logs['step_seconds']}s/step, "
+                    f"{logs['samples_per_second']} samples/s, {logs['tokens_per_second']} tokens/s")
+
+        self._steps = 0
+        self._seconds = 0.0